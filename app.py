@@ -1,12 +1,21 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, jsonify, send_file
-import pandas as pd
+from flask import Flask, render_template, request, redirect, url_for, jsonify, Response, stream_with_context, g
 from datetime import datetime
-import fitz  # PyMuPDF
 from flask_cors import CORS
-import re
 import logging
+import tempfile
+import time
 from logging.handlers import RotatingFileHandler
+from manifest_store import ManifestStore
+from manifest_sessions import SessionManager
+from manifest_export import CSV_MIMETYPE, XLSX_AVAILABLE, XLSX_MIMETYPE, iter_csv, iter_xlsx, row_filter
+from pdf_manifest import ORDER_COLUMNS, iter_manifest_orders
+from awb_patterns import load_registry
+from awb_index import SUGGEST_LIMIT
+from upload_cache import UploadCache, file_digest
+from events import EventBus, format_sse
+from upload_jobs import UploadJobs
+from metrics import METRICS, log_sampled, set_endpoint
 
 # Import configuration
 try:
@@ -39,49 +48,154 @@ if not app.debug:
     app.logger.setLevel(logging.INFO)
     app.logger.info('Meesho Order Scanner startup')
 
-# Original logging setup for compatibility
-logging.basicConfig(level=logging.DEBUG)
+# Console logging at the configured level; per-scan messages are sampled
+# debug lines (see metrics.log_sampled) rather than one info line per scan
+logging.basicConfig(level=app.config.get('LOG_LEVEL', 'INFO'))
 logger = logging.getLogger(__name__)
+LOG_SAMPLE_RATE = app.config.get('LOG_SAMPLE_RATE', 0.01)
 
 UPLOAD_FOLDER = 'uploads'
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
-DATA_FILE = os.path.join(UPLOAD_FOLDER, 'orders.csv')
+# In the gevent worker mode all manifest I/O goes through AsyncManifestStore's
+# single writer, which also takes over the journal maintenance thread's work
+ASYNC_MODE = app.config.get('WORKER_MODE', 'sync') == 'gevent'
+
+awb_registry = load_registry(app.config.get('AWB_PATTERNS_FILE'))
+
+def open_store(directory):
+    """The manifest store of one session, kept in ``directory``"""
+    data_file = os.path.join(directory, 'orders.csv')
+    if app.config.get('STORAGE_BACKEND', 'csv') == 'sqlite':
+        from manifest_sqlite import SqliteManifestStore
+        store = SqliteManifestStore(os.path.join(directory, 'orders.db'), legacy_csv=data_file,
+                                    courier_for=awb_registry.courier_for)
+    else:
+        store = ManifestStore(data_file,
+                              compact_threshold=app.config.get('JOURNAL_COMPACT_THRESHOLD', 500),
+                              compact_interval=0 if ASYNC_MODE else app.config.get('JOURNAL_COMPACT_INTERVAL', 5.0),
+                              fsync_batch=app.config.get('JOURNAL_FSYNC_BATCH', 50),
+                              fsync_interval=app.config.get('JOURNAL_FSYNC_INTERVAL', 0.2),
+                              columnar_snapshot=app.config.get('COLUMNAR_SNAPSHOT', False),
+                              courier_for=awb_registry.courier_for)
+    if ASYNC_MODE:
+        from async_store import AsyncManifestStore
+        store = AsyncManifestStore(store,
+                                   fsync_interval=app.config.get('JOURNAL_FSYNC_INTERVAL', 0.2),
+                                   compact_interval=app.config.get('JOURNAL_COMPACT_INTERVAL', 5.0),
+                                   max_batch=app.config.get('WRITER_MAX_COALESCE', 500))
+    return store
+
+def run_blocking(fn, *args):
+    """Run CPU- or disk-heavy work off the event loop in the gevent worker mode.
+
+    From the event loop this waits on gevent's native thread pool; code
+    already running on one of its threads (which have no hub) calls ``fn``
+    directly.
+    """
+    if ASYNC_MODE:
+        # Not exported from gevent.hub (or gevent) in the pinned 23.9.1
+        from gevent._hub_local import get_hub_if_exists
+        hub = get_hub_if_exists()
+        if hub is not None:
+            return hub.threadpool.apply(fn, args)
+    return fn(*args)
+
+# Each day or pickup is a named session with its own manifest; a manifest
+# uploaded before sessions existed (uploads/orders.csv) becomes the first one
+sessions = SessionManager(os.path.join(UPLOAD_FOLDER, 'sessions'), open_store, legacy_directory=UPLOAD_FOLDER,
+                          run=run_blocking if ASYNC_MODE else None)
+
+def active_store():
+    """Store of the session scans and uploads currently go to"""
+    return sessions.store()
+
+event_bus = EventBus(os.path.join(UPLOAD_FOLDER, 'events.db'),
+                     poll_interval=app.config.get('EVENTS_POLL_INTERVAL', 0.5),
+                     run=run_blocking if ASYNC_MODE else None)
+
+def publish_event(event_type, payload, before=None):
+    """Push a manifest change to every open dashboard; never fails the request"""
+    store = active_store()
+    try:
+        stats = store.counts()
+        payload = dict(payload, stats=stats)
+        if before:
+            payload['delta'] = {key: stats[key] - before[key] for key in stats}
+        event_bus.publish(event_type, payload)
+        return stats
+    except Exception as e:
+        logger.error(f"Error publishing {event_type} event: {str(e)}")
+        return store.counts()
+
+upload_cache = UploadCache(os.path.join(UPLOAD_FOLDER, '.cache'),
+                           max_bytes=app.config.get('UPLOAD_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+METRICS.configure(os.path.join(UPLOAD_FOLDER, '.metrics'),
+                  flush_interval=app.config.get('METRICS_FLUSH_INTERVAL', 1.0),
+                  run=run_blocking if ASYNC_MODE else None)
+upload_jobs = UploadJobs(os.path.join(UPLOAD_FOLDER, 'jobs'), workers=app.config.get('UPLOAD_JOB_WORKERS', 2))
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    set_endpoint(request.endpoint)
+
+@app.after_request
+def record_request_time(response):
+    started = g.pop('request_started', None)
+    if started is not None and request.endpoint not in (None, 'static', 'metrics'):
+        METRICS.observe('scanner_request_seconds', time.perf_counter() - started, endpoint=request.endpoint)
+    return response
+
+def render_dashboard(message=None, job_id=None):
+    """Render the dashboard from the in-memory manifest"""
+    stats = active_store().counts()
+    return render_template('dashboard.html',
+                           packed=stats['packed'],
+                           pending=stats['pending'],
+                           cancelled=stats['cancelled'],
+                           message=message,
+                           job_id=job_id,
+                           session=sessions.active_name(),
+                           live_events=ASYNC_MODE,
+                           xlsx_export=XLSX_AVAILABLE,
+                           stats_poll_interval=app.config.get('STATS_POLL_INTERVAL', 10))
 
 @app.route('/')
 def index():
-    if not os.path.exists(DATA_FILE):
-        return render_template('index.html', message="Please upload your manifest PDF file.")
+    # Set after an upload; the page polls the job until the manifest is swapped in
+    job_id = request.args.get('job')
+    store = active_store()
+    if not store.exists():
+        message = request.args.get('message') or (
+            "Processing your upload..." if job_id else "Please upload your manifest PDF file.")
+        return render_template('index.html', message=message, job_id=job_id, session=sessions.active_name())
     try:
-        df = pd.read_csv(DATA_FILE)
-        packed = df[df['Status'] == 'Packed']
-        pending = df[df['Status'] == 'Pending']
-        cancelled = df[df['Status'] == 'Cancelled']
-        return render_template('dashboard.html', packed=len(packed), pending=len(pending), cancelled=len(cancelled), table=df.to_dict(orient='records'))
-    except pd.errors.EmptyDataError:
-        return render_template('index.html', message="The orders file is empty. Please upload a new one.")
+        if store.is_empty():
+            return render_template('index.html', message="The orders file is empty. Please upload a new one.",
+                                   session=sessions.active_name())
+        return render_dashboard(request.args.get('message'), job_id)
     except Exception as e:
         app.logger.error(f"Error loading data file: {e}")
         return render_template('index.html', message=f"Error loading data: {e}")
 
 @app.route('/upload', methods=['POST'])
 def upload():
-    try:
-        # Determine if we are on the dashboard (to return to the correct page on error)
-        is_dashboard_context = 'file' not in request.files or request.files['file'].filename == ''
+    """Save the uploaded manifest and queue it as a background job.
 
+    The current manifest stays in place (and scannable) until the job has
+    parsed the new file and swapped it in. The response redirects to a page
+    that polls /api/jobs/<id>, or is the job id as JSON for API clients.
+    The manifest goes to the session that is active when it is uploaded.
+    """
+    store = active_store()
+    try:
         if 'file' not in request.files or request.files['file'].filename == '':
             error_msg = "No file selected. Please choose a file to upload."
-            if os.path.exists(DATA_FILE):
+            if store.exists():
                 try:
-                    df = pd.read_csv(DATA_FILE)
-                    return render_template('dashboard.html',
-                                           packed=len(df[df['Status'] == 'Packed']),
-                                           pending=len(df[df['Status'] == 'Pending']),
-                                           cancelled=len(df[df['Status'] == 'Cancelled']),
-                                           table=df.to_dict(orient='records'),
-                                           message=error_msg)
+                    return render_dashboard(error_msg)
                 except:
                     pass
             return render_template('index.html', message=error_msg)
@@ -89,205 +203,168 @@ def upload():
         file = request.files['file']
         filename = file.filename.lower()
         logger.info(f"Processing file: {filename}")
-        
+
+        if not filename.endswith(('.pdf', '.csv')):
+            error_msg = "Unsupported file format. Please upload a PDF manifest or CSV file."
+            if store.exists():
+                return render_dashboard(error_msg)
+            return render_template('index.html', message=error_msg)
+
         # Check if we're replacing existing data
-        is_replacement = os.path.exists(DATA_FILE)
-        
-        # Remove existing data file to prevent conflicts
-        if os.path.exists(DATA_FILE):
-            try:
-                os.remove(DATA_FILE)
-                logger.info("Previous data file removed successfully")
-            except Exception as e:
-                logger.error(f"Error removing previous data file: {str(e)}")
+        is_replacement = store.exists()
+        # Merge mode adds new orders to the current manifest instead of replacing it
+        merge_mode = request.form.get('mode') == 'merge' and is_replacement and not store.is_empty()
 
-        df = pd.DataFrame()
-        try:
-            if filename.endswith('.pdf'):
-                logger.info("Processing PDF manifest file...")
-                pdf_text = extract_text_from_pdf(file)
-                df = parse_pdf_to_dataframe(pdf_text)
-                logger.info(f"Extracted {len(df)} orders from PDF manifest")
-                
-            elif filename.endswith('.csv'):
-                logger.info("Processing CSV file...")
-                df = pd.read_csv(file)
-                # Ensure required columns exist
-                required_columns = ['Order ID', 'AWB ID', 'Courier', 'SKU', 'Qty']
-                for col in required_columns:
-                    if col not in df.columns:
-                        df[col] = 'Unknown'
-                logger.info(f"Loaded {len(df)} orders from CSV")
-            else:
-                error_msg = "Unsupported file format. Please upload a PDF manifest or CSV file."
-                return render_template('dashboard.html' if is_replacement else 'index.html', message=error_msg)
-        
-            if df.empty:
-                error_msg = "No valid data found in the uploaded file. Please check the file format and content."
-                return render_template('dashboard.html' if is_replacement else 'index.html', message=error_msg)
-
-            # Initialize status columns if they don't exist
-            if 'Status' not in df.columns:
-                df['Status'] = 'Pending'
-            if 'Scanned Time' not in df.columns:
-                df['Scanned Time'] = ''
-
-            # Ensure correct data types and clean
-            df['Status'] = df['Status'].astype(str)
-            df['Scanned Time'] = df['Scanned Time'].astype(str)
-            df['AWB ID'] = df['AWB ID'].astype(str).str.strip()
-            df['Order ID'] = df['Order ID'].astype(str).str.strip()
-            
-            df = df.dropna(subset=['AWB ID'])
-            df = df[df['AWB ID'] != '']
-            
-            if df.empty:
-                error_msg = "No valid AWB IDs found in the uploaded file."
-                return render_template('dashboard.html' if is_replacement else 'index.html', message=error_msg)
-            
-            df.to_csv(DATA_FILE, index=False)
-            logger.info(f"Successfully saved {len(df)} orders to {DATA_FILE}")
-            
-            # Prepare success message
-            action_word = "replaced" if is_replacement else "uploaded"
-            success_msg = f"Successfully {action_word} {filename} with {len(df)} orders!"
-            
-        except Exception as e:
-            logger.error(f"Error processing file: {str(e)}")
-            error_msg = f"Error processing file: {str(e)}. Please ensure the file is not corrupted and contains valid data."
-            # Try to load existing data for dashboard, else use defaults
-            if os.path.exists(DATA_FILE):
-                try:
-                    df = pd.read_csv(DATA_FILE)
-                    packed = len(df[df['Status'] == 'Packed']) if 'Status' in df.columns else 0
-                    pending = len(df[df['Status'] == 'Pending']) if 'Status' in df.columns else 0
-                    cancelled = len(df[df['Status'] == 'Cancelled']) if 'Status' in df.columns else 0
-                    table = df.to_dict(orient='records')
-                except Exception:
-                    packed = pending = cancelled = 0
-                    table = []
-            else:
-                packed = pending = cancelled = 0
-                table = []
-            return render_template('dashboard.html',
-                                   packed=packed,
-                                   pending=pending,
-                                   cancelled=cancelled,
-                                   table=table,
-                                   message=error_msg)
+        path = save_upload(file, os.path.splitext(filename)[1])
+        job_id = upload_jobs.submit(process_upload, filename, session=sessions.active_name(),
+                                    path=path, merge_mode=merge_mode, is_replacement=is_replacement)
+        logger.info(f"Queued upload job {job_id} for {filename}")
 
     except Exception as e:
         logger.error(f"Upload failed: {str(e)}")
         error_msg = f"Upload failed: {str(e)}"
-        if os.path.exists(DATA_FILE):
+        if store.exists():
             try:
-                df = pd.read_csv(DATA_FILE)
-                return render_template('dashboard.html',
-                                       packed=len(df[df['Status'] == 'Packed']),
-                                       pending=len(df[df['Status'] == 'Pending']),
-                                       cancelled=len(df[df['Status'] == 'Cancelled']),
-                                       table=df.to_dict(orient='records'),
-                                       message=error_msg)
+                return render_dashboard(error_msg)
             except:
                 return render_template('index.html', message=error_msg)
         else:
             return render_template('index.html', message=error_msg)
 
-    return redirect(url_for('index'))
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({'success': True, 'job_id': job_id,
+                        'status_url': url_for('upload_job_status', job_id=job_id)}), 202
+    return redirect(url_for('index', job=job_id))
 
-def extract_text_from_pdf(file):
-    """Extract text from PDF file with improved error handling"""
+def process_upload(job, session, path, merge_mode, is_replacement):
+    """Upload job: parse the saved file, clean it and swap it in as the session's manifest"""
+    # pandas is only needed here, so workers that never process an upload never load it
+    import pandas as pd
+
+    filename = job.status['filename']
+    set_endpoint('upload_job')
     try:
-        text = ""
-        file_content = file.read()
-        doc = fitz.open(stream=file_content, filetype="pdf")
-        
-        for page_num, page in enumerate(doc):
-            try:
-                text += page.get_text() + "\n"
-                logger.info(f"Extracted text from page {page_num + 1}")
-            except Exception as e:
-                logger.warning(f"Error extracting text from page {page_num + 1}: {str(e)}")
-                continue
-        
-        doc.close()
-        logger.info(f"Successfully extracted {len(text)} characters from PDF")
-        return text
-    except Exception as e:
-        logger.error(f"Error opening PDF: {str(e)}")
-        raise Exception(f"Could not read PDF file: {str(e)}")
-
-def parse_pdf_to_dataframe(text):
-    """Parse PDF text to DataFrame with robust manifest parsing"""
-    required_columns = ["Order ID", "AWB ID", "Courier", "SKU", "Qty"]
-    entries = []
-    courier = "Unknown"
-    lines = text.split('\n')
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
-        # Step 1: Detect courier
-        if line.startswith("Courier :"):
-            courier = line.replace("Courier :", "").strip()
-            logger.info(f"Found courier: {courier}")
-        
-        # Step 2: Look for a new order by finding a line with digits and checking the next line for the '_1' pattern
-        if re.match(r'^\d+$', line):
-            if i + 1 < len(lines) and re.match(r'^\d+_\d+$', lines[i+1].strip()):
-                order_id = line + lines[i+1].strip()
-                j = i + 2  # Start looking for AWB from here
-            else:
-                i += 1
-                continue
+        cache_status = None
+        if filename.endswith('.pdf'):
+            logger.info("Processing PDF manifest file...")
+            df, cache_status = run_blocking(parse_pdf_to_dataframe, path, job)
+            logger.info(f"Extracted {len(df)} orders from PDF manifest")
         else:
-            i += 1
-            continue
-        
-        awb_id = 'Unknown'
-        sku = 'Unknown'
-        qty = 1
-        
-        try:
-            # Assuming AWB ID is on the next line
-            if j < len(lines) and lines[j].strip():
-                awb_id = lines[j].strip()
-            
-            # Assuming SKU is the line after AWB ID
-            if j + 1 < len(lines) and lines[j+1].strip():
-                sku = lines[j+1].strip()
-                
-            # Assuming Quantity is the line after SKU
-            if j + 2 < len(lines) and re.match(r'^\d+$', lines[j+2].strip()):
-                qty = int(lines[j+2].strip())
-                
-            # Validate AWB ID format
-            is_valid_awb = (awb_id and awb_id != order_id and
-                            (re.match(r'^[A-Z]{2}\d+', awb_id) or
-                             re.match(r'^M\d+', awb_id) or
-                             re.match(r'^1490\d{12,}', awb_id) or
-                             re.match(r'^134\d{11,}', awb_id) or
-                             re.match(r'^VL\d+', awb_id) or
-                             re.match(r'^SF\d+', awb_id)))
-            
-            if is_valid_awb:
-                entries.append({
-                    "Order ID": order_id,
-                    "AWB ID": awb_id,
-                    "Courier": courier,
-                    "SKU": sku,
-                    "Qty": qty
-                })
-                logger.debug(f"Extracted: Order ID {order_id}, AWB {awb_id}, SKU {sku}, Qty {qty}")
-            else:
-                logger.warning(f"Invalid AWB ID '{awb_id}' for order {order_id}")
-        except Exception as e:
-            logger.warning(f"Error parsing order {order_id}: {e}")
-        
-        i = j + 2  # Move past the processed block
+            logger.info("Processing CSV file...")
+            with METRICS.stage('csv_read'):
+                df = run_blocking(pd.read_csv, path)
+            # Ensure required columns exist
+            required_columns = ['Order ID', 'AWB ID', 'Courier', 'SKU', 'Qty']
+            for col in required_columns:
+                if col not in df.columns:
+                    df[col] = 'Unknown'
+            logger.info(f"Loaded {len(df)} orders from CSV")
+            job.update(orders=len(df))
+    finally:
+        os.remove(path)
+
+    if df.empty:
+        raise ValueError("No valid data found in the uploaded file. Please check the file format and content.")
+
+    with METRICS.stage('clean'):
+        # Initialize status columns if they don't exist
+        if 'Status' not in df.columns:
+            df['Status'] = 'Pending'
+        if 'Scanned Time' not in df.columns:
+            df['Scanned Time'] = ''
+
+        # Ensure correct data types and clean
+        df['Status'] = df['Status'].astype(str)
+        df['Scanned Time'] = df['Scanned Time'].astype(str)
+        df['AWB ID'] = df['AWB ID'].astype(str).str.strip()
+        df['Order ID'] = df['Order ID'].astype(str).str.strip()
+
+        df = df.dropna(subset=['AWB ID'])
+        df = df[df['AWB ID'] != '']
+
+    if df.empty:
+        raise ValueError("No valid AWB IDs found in the uploaded file.")
+    METRICS.inc('scanner_upload_orders_total', len(df))
+
+    store = sessions.store(session)
+    if merge_mode:
+        with METRICS.stage('swap'):
+            report = store.merge(df)
+        logger.info(f"Merged {filename}: {report}")
+        success_msg = (f"Merged {filename}: {report['added']} new orders added, "
+                       f"{report['kept']} already present kept, {report['conflicting']} conflicting.")
+    else:
+        # replace() swaps the whole manifest in atomically; scans until now
+        # went to the previous manifest
+        with METRICS.stage('swap'):
+            store.replace(df)
+        logger.info(f"Successfully saved {len(df)} orders to session {session}")
+
+        # Prepare success message
+        action_word = "replaced" if is_replacement else "uploaded"
+        success_msg = f"Successfully {action_word} {filename} with {len(df)} orders!"
+    if cache_status == 'hit':
+        success_msg += " (same file as a previous upload, loaded from cache)"
+    elif cache_status == 'partial':
+        success_msg += " (unchanged pages loaded from cache)"
 
-    df = pd.DataFrame(entries, columns=required_columns)
-    logger.info(f"Successfully parsed {len(df)} orders from PDF manifest")
-    return df
+    if session == sessions.active_name():
+        publish_event('manifest', {'message': success_msg})
+    return {'message': success_msg, 'orders': len(df), 'cache': cache_status}
+
+@app.route('/api/jobs/<job_id>')
+def upload_job_status(job_id):
+    """Progress of a background upload: state, pages processed, orders parsed and ETA"""
+    status = upload_jobs.get(job_id)
+    if status is None:
+        return jsonify({'success': False, 'message': 'Unknown upload job'}), 404
+    return jsonify(dict(status, success=True))
+
+def save_upload(file, suffix):
+    """Stream an uploaded file to a temporary path under UPLOAD_FOLDER"""
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=UPLOAD_FOLDER)
+    os.close(fd)
+    file.save(path)
+    return path
+
+def parse_pdf_to_dataframe(pdf_path, job=None):
+    """Parse a manifest PDF on disk to a DataFrame, reusing cached uploads and pages.
+
+    Returns the DataFrame and the cache status: 'hit' (whole file seen
+    before), 'partial' (some pages seen before) or 'miss'. Progress is
+    reported to the upload ``job``, if given.
+    """
+    cache_key = f"{file_digest(pdf_path)}-{awb_registry.fingerprint}"
+    orders = upload_cache.get_orders(cache_key)
+    if orders is not None:
+        cache_status = 'hit'
+    else:
+        stats = {}
+        orders = []
+        progress = (lambda done, total: job.progress(done, total, len(orders))) if job else None
+        started = time.perf_counter()
+        orders.extend(iter_manifest_orders(pdf_path,
+                                           workers=app.config.get('PDF_EXTRACT_WORKERS'),
+                                           registry=awb_registry,
+                                           page_cache=upload_cache,
+                                           stats=stats,
+                                           progress=progress))
+        # Extraction and parsing overlap; parse time is what was not spent waiting for pages
+        extract_seconds = stats.get('extract_seconds', 0.0)
+        METRICS.stage_time('pdf_extract', extract_seconds, endpoint='upload_job')
+        METRICS.stage_time('parse', time.perf_counter() - started - extract_seconds, endpoint='upload_job')
+        METRICS.inc('scanner_upload_pages_total', stats.get('pages', 0) - stats.get('cached_pages', 0),
+                    source='extracted')
+        METRICS.inc('scanner_upload_pages_total', stats.get('cached_pages', 0), source='cached')
+        upload_cache.put_orders(cache_key, orders)
+        cache_status = 'partial' if stats.get('cached_pages') else 'miss'
+    import pandas as pd
+
+    df = pd.DataFrame(orders, columns=ORDER_COLUMNS)
+    if job:
+        job.update(orders=len(df))
+    logger.info(f"Successfully parsed {len(df)} orders from PDF manifest (cache {cache_status})")
+    return df, cache_status
 
 @app.route('/scan', methods=['POST'])
 def scan():
@@ -300,89 +377,181 @@ def scan():
         if not awb_id:
             return jsonify({'success': False, 'message': 'No AWB ID provided'})
 
-        logger.info(f"Scanning AWB ID: {awb_id}")
+        log_sampled(logger, "Scanning AWB ID: %s", awb_id, rate=LOG_SAMPLE_RATE)
         
-        if not os.path.exists(DATA_FILE):
+        store = active_store()
+        if not store.exists():
             return jsonify({'success': False, 'message': 'No manifest data found. Please upload a file first.'})
 
-        df = pd.read_csv(DATA_FILE)
-        
-        awb_id_clean = str(awb_id).strip()
-        df['AWB ID'] = df['AWB ID'].astype(str).str.strip()
-        
-        match = df['AWB ID'] == awb_id_clean
+        # A parcel from an earlier session is reported, not recorded as a
+        # cancellation in this one; only a manifest miss can be one, so the
+        # cross-session lookup is skipped for the usual in-manifest scan
+        unknown = store.get(awb_id) is None
+        earlier = unknown and sessions.packed_elsewhere(awb_id, exclude=sessions.active_name())
+        if earlier:
+            METRICS.inc('scanner_scans_total', result='packed_elsewhere')
+            packed_on = earlier['scanned_time'][:10]
+            return jsonify({
+                'success': False,
+                'message': f"AWB {awb_id} was already packed on {packed_on} (session {earlier['session']})",
+                'status': 'Packed',
+                'packed_on': packed_on,
+                'session': earlier['session']
+            })
 
-        if match.any():
-            current_status = df.loc[match, 'Status'].values[0]
-            logger.info(f"AWB {awb_id} found with status: {current_status}")
-            
-            if current_status == 'Packed':
-                return jsonify({'success': False, 'message': 'Already Packed', 'status': 'Packed'})
-            elif current_status == 'Cancelled':
-                return jsonify({'success': False, 'message': 'This item was previously cancelled.', 'status': 'Cancelled'})
-            else:
-                df.loc[match, 'Status'] = 'Packed'
-                current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                df.loc[match, 'Scanned Time'] = current_time
-                df.to_csv(DATA_FILE, index=False)
-                logger.info(f"AWB {awb_id} marked as Packed")
-                
-                packed = len(df[df['Status'] == 'Packed'])
-                pending = len(df[df['Status'] == 'Pending'])
-                cancelled = len(df[df['Status'] == 'Cancelled'])
-                
+        # A damaged label usually reads as a near miss of a manifest AWB:
+        # offer the likely ones before recording a cancellation, which the
+        # client confirms by sending the scan again with "confirm": true
+        if unknown and not data.get('confirm'):
+            with METRICS.stage('suggest'):
+                suggestions = store.suggest(awb_id)
+            if suggestions:
+                METRICS.inc('scanner_scans_total', result='suggested')
                 return jsonify({
-                    'success': True, 
-                    'message': f'AWB {awb_id} marked as Packed',
-                    'status': 'Packed',
-                    'stats': {
-                        'packed': packed,
-                        'pending': pending,
-                        'cancelled': cancelled,
-                        'total': len(df)
-                    }
+                    'success': False,
+                    'message': f"AWB {awb_id} not found in manifest. Did you mean "
+                               f"{' or '.join(s['awb_id'] for s in suggestions)}?",
+                    'status': None,
+                    'suggestions': suggestions
                 })
+
+        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        before = store.counts()
+        result = store.scan(awb_id, current_time)
+        METRICS.inc('scanner_scans_total', result=result)
+
+        if result == 'already_packed':
+            return jsonify({'success': False, 'message': 'Already Packed', 'status': 'Packed'})
+        elif result == 'cancelled':
+            return jsonify({'success': False, 'message': 'This item was previously cancelled.', 'status': 'Cancelled'})
+        elif result == 'packed':
+            log_sampled(logger, "AWB %s marked as Packed", awb_id, rate=LOG_SAMPLE_RATE)
+            stats = publish_event('scan', {'awb_id': awb_id, 'status': 'Packed'}, before)
+            return jsonify({
+                'success': True, 
+                'message': f'AWB {awb_id} marked as Packed',
+                'status': 'Packed',
+                'stats': stats
+            })
         else:
-            logger.info(f"AWB {awb_id} not found in manifest, adding as cancelled")
-            current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            
-            # Define columns explicitly to handle potential new DataFrame
-            columns = ['Order ID', 'AWB ID', 'Courier', 'SKU', 'Qty', 'Status', 'Scanned Time']
-            new_row_data = {
-                'Order ID': ["Unknown"],
-                'AWB ID': [awb_id_clean],
-                'Courier': ["Unknown"],
-                'SKU': ["Unknown"],
-                'Qty': [1],
-                'Status': ["Cancelled"],
-                'Scanned Time': [current_time]
-            }
-            new_row = pd.DataFrame(new_row_data, columns=columns)
-            
-            df = pd.concat([df, new_row], ignore_index=True)
-            df.to_csv(DATA_FILE, index=False)
-            
-            packed = len(df[df['Status'] == 'Packed'])
-            pending = len(df[df['Status'] == 'Pending'])
-            cancelled = len(df[df['Status'] == 'Cancelled'])
-            
+            log_sampled(logger, "AWB %s not found in manifest, added as cancelled", awb_id, rate=LOG_SAMPLE_RATE)
+            stats = publish_event('scan', {'awb_id': awb_id, 'status': 'Cancelled'}, before)
             return jsonify({
                 'success': True, 
                 'message': f'AWB {awb_id} not found in manifest - marked as Cancelled',
                 'status': 'Cancelled', 
                 'confirm': True,
-                'stats': {
-                    'packed': packed,
-                    'pending': pending,
-                    'cancelled': cancelled,
-                    'total': len(df)
-                }
+                'stats': stats
             })
             
     except Exception as e:
         logger.error(f"Error in scan endpoint: {str(e)}")
         return jsonify({'success': False, 'message': f'Error processing scan: {str(e)}'})
 
+# Result names reported per item by /scan/batch
+BATCH_RESULTS = {
+    'packed': ('packed', 'Packed'),
+    'already_packed': ('duplicate', 'Packed'),
+    'cancelled': ('cancelled', 'Cancelled'),
+    'unknown': ('unknown', 'Cancelled'),
+}
+
+def parse_client_time(value):
+    """Normalise a scanner-supplied timestamp to the manifest format, or None.
+
+    Manifest times are server-local wall-clock times: a value with an offset
+    is converted to local time, and a naive value is taken as local already.
+    """
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed.strftime('%Y-%m-%d %H:%M:%S')
+
+@app.route('/scan/batch', methods=['POST'])
+def scan_batch():
+    """Apply a queue of offline scans in one transaction.
+
+    Body: ``{"batch_id": "...", "items": [{"awb_id": "...", "scanned_at": "..."}]}``.
+    Retrying with the same batch_id returns the original results without
+    applying the scans again.
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not data or not isinstance(data.get('items'), list):
+            return jsonify({'success': False, 'message': 'No items received'})
+
+        items = data['items']
+        max_items = app.config.get('MAX_SCAN_BATCH', 500)
+        if len(items) > max_items:
+            return jsonify({'success': False, 'message': f'A batch can hold at most {max_items} scans'})
+
+        store = active_store()
+        if not store.exists():
+            return jsonify({'success': False, 'message': 'No manifest data found. Please upload a file first.'})
+
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        awb_ids = []
+        scans = []
+        for item in items:
+            if isinstance(item, dict):
+                awb_id = str(item.get('awb_id') or '').strip()
+                scanned_time = parse_client_time(item.get('scanned_at')) or now
+            else:
+                awb_id = str(item or '').strip()
+                scanned_time = now
+            awb_ids.append(awb_id)
+            if awb_id:
+                scans.append((awb_id, scanned_time))
+
+        batch_id = str(data.get('batch_id') or '').strip() or None
+        before = store.counts()
+        outcomes, replayed = store.scan_batch(scans, batch_id=batch_id)
+        if not replayed:
+            for result in outcomes:
+                METRICS.inc('scanner_scans_total', result=result)
+        logger.info(f"Applied scan batch {batch_id} with {len(scans)} scans (replayed: {replayed})")
+
+        outcomes = iter(outcomes)
+        results = []
+        for awb_id in awb_ids:
+            if not awb_id:
+                results.append({'awb_id': awb_id, 'result': 'invalid', 'status': None})
+                continue
+            result, status = BATCH_RESULTS[next(outcomes)]
+            item = {'awb_id': awb_id, 'result': result, 'status': status}
+            if result == 'unknown':
+                # Offline scans are already recorded; flag parcels packed in an
+                # earlier session. 'unknown' is only returned for a manifest
+                # miss, so matched scans never reach the cross-session lookup
+                earlier = sessions.packed_elsewhere(awb_id, exclude=sessions.active_name())
+                if earlier:
+                    item.update(packed_on=earlier['scanned_time'][:10], session=earlier['session'])
+                else:
+                    item['suggestions'] = store.suggest(awb_id)
+            results.append(item)
+
+        changed = [item for item in results if item['result'] in ('packed', 'unknown')]
+        if changed and not replayed:
+            stats = publish_event('batch', {'batch_id': batch_id, 'changes': changed}, before)
+        else:
+            stats = store.counts()
+
+        return jsonify({
+            'success': True,
+            'batch_id': batch_id,
+            'replayed': replayed,
+            'results': results,
+            'stats': stats
+        })
+    except Exception as e:
+        logger.error(f"Error in batch scan endpoint: {str(e)}")
+        return jsonify({'success': False, 'message': f'Error processing batch: {str(e)}'})
+
 @app.route('/delete', methods=['POST'])
 def delete_entry():
     try:
@@ -396,22 +565,15 @@ def delete_entry():
 
         logger.info(f"Deleting AWB ID: {awb_id}")
         
-        if not os.path.exists(DATA_FILE):
+        store = active_store()
+        if not store.exists():
             return jsonify({'success': False, 'message': 'No data file found'})
 
-        df = pd.read_csv(DATA_FILE)
-        initial_count = len(df)
-        
-        awb_id_clean = str(awb_id).strip()
-        df['AWB ID'] = df['AWB ID'].astype(str).str.strip()
-        
-        df = df[df['AWB ID'] != awb_id_clean]
-        final_count = len(df)
-        
-        if initial_count == final_count:
+        before = store.counts()
+        if not store.delete(awb_id):
             return jsonify({'success': False, 'message': f'AWB ID {awb_id} not found'})
+        publish_event('delete', {'awb_id': awb_id}, before)
         
-        df.to_csv(DATA_FILE, index=False)
         logger.info(f"AWB {awb_id} deleted successfully")
         return jsonify({'success': True, 'message': f'AWB ID {awb_id} deleted successfully.'})
         
@@ -419,17 +581,224 @@ def delete_entry():
         logger.error(f"Error in delete endpoint: {str(e)}")
         return jsonify({'success': False, 'message': f'Error deleting entry: {str(e)}'})
 
+@app.route('/api/orders')
+def orders_table():
+    """Server-side processing endpoint for the dashboard's DataTables orders table"""
+    args = request.args
+    draw = args.get('draw', default=0, type=int)
+    try:
+        max_length = app.config.get('ORDERS_PAGE_MAX', 500)
+        length = args.get('length', default=25, type=int)
+        length = max_length if length < 0 else min(length, max_length)
+        order_column = args.get('order[0][column]', type=int)
+        order_by = args.get(f'columns[{order_column}][data]') if order_column is not None else None
+
+        store = active_store()
+        if not store.exists():
+            return jsonify({'draw': draw, 'recordsTotal': 0, 'recordsFiltered': 0, 'data': []})
+
+        total, filtered, rows = store.query(search=args.get('search[value]', '').strip(),
+                                            status=args.get('status', '').strip(),
+                                            order_by=order_by,
+                                            descending=args.get('order[0][dir]') == 'desc',
+                                            start=max(args.get('start', default=0, type=int), 0),
+                                            length=length)
+        return jsonify({'draw': draw, 'recordsTotal': total, 'recordsFiltered': filtered, 'data': rows})
+    except Exception as e:
+        logger.error(f"Error in orders table endpoint: {str(e)}")
+        return jsonify({'draw': draw, 'recordsTotal': 0, 'recordsFiltered': 0, 'data': [],
+                        'error': f'Error loading orders: {str(e)}'})
+
+@app.route('/events')
+def event_stream():
+    """Server-Sent Events stream of scans, deletes and uploads from every worker.
+
+    Only served in the gevent worker mode, where an open stream costs a
+    greenlet. A sync worker would be held for the whole stream, and a few
+    open dashboards would take every worker away from /scan, so sync mode
+    answers 204 (which stops EventSource reconnecting) and the dashboard
+    polls /api/stats instead. Connections are closed after
+    SSE_MAX_DURATION seconds; browsers reconnect on their own and resume
+    from Last-Event-ID.
+    """
+    if not ASYNC_MODE:
+        return Response(status=204)
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    if last_id is None:
+        last_id = request.args.get('last_id', type=int)
+    max_duration = app.config.get('SSE_MAX_DURATION', 25)
+
+    def generate():
+        yield 'retry: 1000\n\n'
+        for event in event_bus.listen(last_id, max_duration=max_duration):
+            yield format_sse(event)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/export')
 def export():
+    """Download the active session's orders; see export_response for the query parameters"""
     try:
-        if not os.path.exists(DATA_FILE):
-            return redirect(url_for('index'))
-        
-        return send_file(DATA_FILE, as_attachment=True, download_name='orders_export.csv')
+        return export_response(sessions.active_name(), 'orders_export')
+    except ValueError as e:
+        return redirect(url_for('index', message=str(e)))
     except Exception as e:
         logger.error(f"Error in export: {str(e)}")
         return redirect(url_for('index'))
 
+def parse_export_time(value, end_of_day=False):
+    """Normalise a since/until export filter; a bare date covers the whole day"""
+    value = (value or '').strip()
+    if not value:
+        return None
+    if len(value) == 10:
+        try:
+            datetime.strptime(value, '%Y-%m-%d')
+        except ValueError:
+            raise ValueError(f"Invalid date {value}; use YYYY-MM-DD")
+        return value + (' 23:59:59' if end_of_day else ' 00:00:00')
+    parsed = parse_client_time(value)
+    if parsed is None:
+        raise ValueError(f"Invalid time {value}; use YYYY-MM-DD or YYYY-MM-DD HH:MM:SS")
+    return parsed
+
+def export_filters(args):
+    """Export filters from the query string: comma-separated status and courier lists, since/until"""
+    def values(name):
+        return {value.strip() for value in args.get(name, '').split(',') if value.strip()} or None
+
+    couriers = values('courier')
+    return {
+        'statuses': values('status'),
+        'couriers': {courier.lower() for courier in couriers} if couriers else None,
+        'since': parse_export_time(args.get('since')),
+        'until': parse_export_time(args.get('until'), end_of_day=True),
+    }
+
+def export_response(name, filename):
+    """Stream a session's orders as CSV or XLSX.
+
+    Query parameters: ``format`` (csv or xlsx), ``status`` and ``courier``
+    (comma-separated), ``since`` / ``until`` (on Scanned Time). Rows come
+    from a point-in-time snapshot and are encoded in chunks, so scans carry
+    on while a large export downloads. Raises ValueError for bad input.
+    """
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in ('csv', 'xlsx'):
+        raise ValueError('Export format must be csv or xlsx')
+    filters = export_filters(request.args)
+    info = sessions.get(name)
+    if info is None:
+        raise ValueError(f"Unknown session {name}")
+    if info['state'] == 'open':
+        store = sessions.store(name)
+        if not store.exists():
+            raise ValueError(f"Session {name} has no manifest yet")
+        columns, rows = store.export_rows(**filters)
+    else:
+        columns, rows = sessions.archived_rows(name)
+        rows = filter(row_filter(columns, **filters), rows)
+    if export_format == 'xlsx':
+        try:
+            chunks = iter_xlsx(columns, rows, directory=UPLOAD_FOLDER)
+        except ImportError:
+            raise ValueError('XLSX export needs the xlsxwriter package; export as CSV instead')
+        mimetype = XLSX_MIMETYPE
+    else:
+        chunks = iter_csv(columns, rows)
+        mimetype = CSV_MIMETYPE
+    logger.info(f"Exporting session {name} as {export_format} with filters {filters}")
+    return Response(chunks, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}.{export_format}"'})
+
+@app.route('/sessions')
+def sessions_page():
+    """List manifest sessions with links to switch, close and export them"""
+    return render_template('sessions.html', sessions=sessions.list(), active=sessions.active_name(),
+                           message=request.args.get('message'))
+
+@app.route('/api/sessions')
+def list_sessions():
+    return jsonify({'success': True, 'active': sessions.active_name(), 'sessions': sessions.list()})
+
+def session_response(message, success=True):
+    """JSON for API clients, otherwise back to the sessions page with a message"""
+    if request.is_json or request.accept_mimetypes.best == 'application/json':
+        return jsonify({'success': success, 'message': message, 'active': sessions.active_name()})
+    return redirect(url_for('sessions_page', message=message))
+
+@app.route('/sessions', methods=['POST'])
+def create_session():
+    """Open a new session (default name: today's date) and make it active"""
+    data = request.get_json(silent=True) or request.form
+    try:
+        name = sessions.create(str(data.get('name') or '').strip() or None)
+    except ValueError as e:
+        return session_response(str(e), success=False)
+    logger.info(f"Session {name} is now active")
+    return session_response(f"Session {name} is now active. Upload its manifest from the dashboard.")
+
+@app.route('/sessions/<name>/activate', methods=['POST'])
+def activate_session(name):
+    try:
+        sessions.activate(name)
+    except ValueError as e:
+        return session_response(str(e), success=False)
+    publish_event('manifest', {'message': f"Switched to session {name}"})
+    return session_response(f"Session {name} is now active.")
+
+@app.route('/sessions/<name>/close', methods=['POST'])
+def close_session(name):
+    """Archive a finished session and free its memory"""
+    try:
+        orders = sessions.close(name)
+    except ValueError as e:
+        return session_response(str(e), success=False)
+    except Exception as e:
+        logger.error(f"Error closing session {name}: {str(e)}")
+        return session_response(f"Error closing session {name}: {str(e)}", success=False)
+    return session_response(f"Session {name} closed and archived with {orders} orders.")
+
+@app.route('/sessions/<name>/export')
+def export_session(name):
+    """Export any session: open ones from their store, closed ones from the archive"""
+    try:
+        return export_response(name, f"orders_{name}")
+    except ValueError as e:
+        return redirect(url_for('sessions_page', message=str(e)))
+    except Exception as e:
+        logger.error(f"Error exporting session {name}: {str(e)}")
+        return redirect(url_for('sessions_page', message=f"Error exporting session {name}: {str(e)}"))
+
+@app.route('/api/awb/suggest')
+def awb_suggest():
+    """Manifest AWB IDs matching a partial or mis-read one, for damaged labels.
+
+    ``q`` is the read; ``limit`` caps the suggestions (default 5, at most 50).
+    """
+    awb_id = request.args.get('q', '').strip()
+    if not awb_id:
+        return jsonify({'success': False, 'message': 'No AWB ID provided'})
+    limit = min(max(request.args.get('limit', SUGGEST_LIMIT, type=int), 1), 50)
+    store = active_store()
+    if not store.exists():
+        return jsonify({'success': True, 'awb_id': awb_id, 'suggestions': []})
+    with METRICS.stage('suggest'):
+        suggestions = store.suggest(awb_id, limit)
+    return jsonify({'success': True, 'awb_id': awb_id, 'suggestions': suggestions})
+
+@app.route('/api/awb/<awb_id>/history')
+def awb_history(awb_id):
+    """Every session holding an AWB, from open manifests and the archive index"""
+    awb_id = awb_id.strip()
+    return jsonify({'success': True, 'awb_id': awb_id, 'sessions': sessions.history_of(awb_id)})
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics summed over every worker process"""
+    return Response(run_blocking(METRICS.render), mimetype='text/plain; version=0.0.4')
+
 @app.route('/test', methods=['GET'])
 def test():
     """Test endpoint to check if server is working"""
@@ -438,24 +807,71 @@ def test():
 @app.route('/api/stats')
 def get_stats():
     try:
-        if not os.path.exists(DATA_FILE):
+        store = active_store()
+        if not store.exists():
             return jsonify({'packed': 0, 'pending': 0, 'cancelled': 0, 'total': 0})
         
-        df = pd.read_csv(DATA_FILE)
-        packed = len(df[df['Status'] == 'Packed'])
-        pending = len(df[df['Status'] == 'Pending'])
-        cancelled = len(df[df['Status'] == 'Cancelled'])
-        
-        return jsonify({
-            'packed': packed,
-            'pending': pending,
-            'cancelled': cancelled,
-            'total': len(df)
-        })
+        return jsonify(store.counts())
     except Exception as e:
         logger.error(f"Error getting stats: {str(e)}")
         return jsonify({'packed': 0, 'pending': 0, 'cancelled': 0, 'total': 0})
 
+@app.route('/api/stats/breakdown')
+def get_stats_breakdown():
+    """Status counts per courier and per SKU, from the maintained counters"""
+    try:
+        store = active_store()
+        if not store.exists():
+            return jsonify({'by_courier': {}, 'by_sku': {}})
+        return jsonify(store.breakdown())
+    except Exception as e:
+        logger.error(f"Error getting stats breakdown: {str(e)}")
+        return jsonify({'by_courier': {}, 'by_sku': {}})
+
+def reconciliation_report():
+    """Reconciliation of the session in the ``session`` query arg (default: active)"""
+    name = request.args.get('session') or sessions.active_name()
+    store = sessions.store(name)
+    if not store.exists():
+        raise ValueError(f"Session {name} has no manifest yet")
+    return name, store.reconciliation()
+
+@app.route('/api/reconciliation')
+def reconciliation_json():
+    """Per-courier packed / pending / cancelled / unexpected counts and missing AWBs"""
+    try:
+        name, report = reconciliation_report()
+        return jsonify(dict(report, success=True, session=name,
+                            generated=datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)})
+    except Exception as e:
+        logger.error(f"Error building reconciliation: {str(e)}")
+        return jsonify({'success': False, 'message': f'Error building reconciliation: {str(e)}'})
+
+@app.route('/reconciliation')
+def reconciliation_page():
+    """Printable pickup handover sheet, one section per courier"""
+    try:
+        name, report = reconciliation_report()
+    except ValueError as e:
+        return redirect(url_for('index', message=str(e)))
+    return render_template('reconciliation.html', session=name, report=report,
+                           generated=datetime.now().strftime('%Y-%m-%d %H:%M'))
+
+@app.route('/api/stats/verify')
+def verify_stats():
+    """Recompute the counters from scratch and report whether they had drifted"""
+    try:
+        store = active_store()
+        if not store.exists():
+            return jsonify({'success': True, 'consistent': True})
+        result = store.verify_counts()
+        return jsonify(dict(result, success=True))
+    except Exception as e:
+        logger.error(f"Error verifying stats: {str(e)}")
+        return jsonify({'success': False, 'message': f'Error verifying stats: {str(e)}'})
+
 @app.route('/health')
 def health_check():
     """Health check endpoint for monitoring"""
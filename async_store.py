@@ -0,0 +1,127 @@
+"""Non-blocking manifest access for the gevent worker mode"""
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Most queued writes applied by one write_many call
+MAX_COALESCE = 500
+
+
+class AsyncManifestStore:
+    """Wraps a ManifestStore or SqliteManifestStore for gevent workers.
+
+    Request greenlets must never block the event loop on a file lock, a
+    journal append or an fsync. Scans, batch scans and deletes are
+    therefore queued to one writer greenlet per process, which drains
+    everything queued since its last pass and applies it with a single
+    ``store.write_many`` call on gevent's native thread pool: one lock, one
+    journal append and at most one fsync for many concurrent scanners. The
+    writer also runs the store's fsync and compaction (``store.maintain``),
+    so the store must be created without its own maintenance thread.
+
+    Every other store method is called on the thread pool, so reads such as
+    counts() or query() wait on disk only in a native thread.
+    """
+
+    def __init__(self, store, fsync_interval=0.2, compact_interval=5.0, max_batch=MAX_COALESCE):
+        self.store = store
+        self.fsync_interval = fsync_interval
+        self.compact_interval = compact_interval
+        self.max_batch = max_batch
+        self._pid = None
+        self._queue = None
+        self._pool = None
+
+    def _ensure_writer(self):
+        """Start the writer greenlet once per process (greenlets do not survive fork)"""
+        if self._pid == os.getpid():
+            return
+        import gevent
+        from gevent.monkey import get_original
+        from gevent.queue import Queue
+
+        self._pid = os.getpid()
+        self._queue = Queue()
+        self._pool = gevent.get_hub().threadpool
+        if hasattr(self.store, '_lock'):
+            # The store is only entered from pool threads; a native lock
+            # keeps them from going through the monkey-patched one
+            self.store._lock = get_original('threading', 'Lock')()
+        gevent.spawn(self._writer_loop)
+
+    def _submit(self, op):
+        from gevent.event import AsyncResult
+
+        self._ensure_writer()
+        result = AsyncResult()
+        self._queue.put((op, result))
+        outcome = result.get()
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def _writer_loop(self):
+        from gevent.queue import Empty
+
+        pid = os.getpid()
+        last_compact = time.monotonic()
+        while self._pid == pid:
+            try:
+                pending = [self._queue.get(timeout=self.fsync_interval)]
+            except Empty:
+                pending = []
+            while pending and len(pending) < self.max_batch:
+                try:
+                    pending.append(self._queue.get_nowait())
+                except Empty:
+                    break
+            if pending:
+                try:
+                    outcomes = self._pool.apply(self.store.write_many, ([op for op, _ in pending],))
+                except Exception as e:
+                    logger.error(f"Coalesced manifest write of {len(pending)} ops failed: {e}")
+                    outcomes = [e] * len(pending)
+                for (_, result), outcome in zip(pending, outcomes):
+                    result.set(outcome)
+
+            compact = time.monotonic() - last_compact >= self.compact_interval
+            if compact:
+                last_compact = time.monotonic()
+            if compact or not pending:
+                try:
+                    self._pool.apply(self.store.maintain, (), {'compact': compact})
+                except Exception as e:
+                    logger.error(f"Manifest journal maintenance failed: {e}")
+
+    def scan(self, awb_id, scanned_time):
+        return self._submit(('scan', awb_id, scanned_time))
+
+    def scan_batch(self, items, batch_id=None):
+        return self._submit(('batch', list(items), batch_id))
+
+    def delete(self, awb_id):
+        return self._submit(('delete', awb_id))
+
+    def run(self, fn, *args, **kwargs):
+        """Call ``fn`` on the native thread pool, e.g. to parse an upload"""
+        self._ensure_writer()
+        return self._pool.apply(fn, args, kwargs)
+
+    def close(self):
+        """Stop the writer greenlet and close the wrapped store"""
+        self._pid = None
+        self.store.close()
+
+    def __len__(self):
+        return self.run(len, self.store)
+
+    def __getattr__(self, name):
+        attr = getattr(self.store, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            return self.run(attr, *args, **kwargs)
+        return call
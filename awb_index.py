@@ -0,0 +1,133 @@
+"""Prefix, suffix and one-edit lookups over a manifest's AWB IDs, for damaged barcodes"""
+from bisect import bisect_left, insort
+
+# Suggestions returned for one lookup
+SUGGEST_LIMIT = 5
+# Shortest read matched against the start or end of AWB IDs; shorter
+# fragments fit too many parcels to be worth suggesting
+MIN_PARTIAL_LENGTH = 6
+
+
+class AwbIndex:
+    """A set of AWB IDs searchable by prefix, suffix and one-character edits.
+
+    A smudged label or a keyboard wedge that drops characters sends a
+    truncated or slightly wrong AWB ID. Truncated reads are found by
+    binary search: the IDs starting with the read sit in one run of the
+    sorted IDs, and the IDs ending with it in one run of the sorted
+    reversed IDs. Near misses are found by generating every string one
+    substitution, insertion, deletion or adjacent swap away from the read,
+    over the characters the IDs actually use, and looking each up in the
+    set: about a thousand set lookups for a 14-character ID, whatever the
+    manifest size, and no memory beyond the two sorted lists.
+    """
+
+    def __init__(self, awbs=()):
+        # A dict rather than a set keeps the IDs in manifest order, which is
+        # mostly sorted already and makes the sort below several times faster
+        self._members = dict.fromkeys(awbs)
+        self._forward = sorted(self._members)
+        self._backward = sorted(awb[::-1] for awb in self._members)
+        self._alphabet = set(''.join(self._members))
+
+    def __len__(self):
+        return len(self._members)
+
+    def __contains__(self, awb):
+        return awb in self._members
+
+    def add(self, awb):
+        if awb in self._members:
+            return
+        self._members[awb] = None
+        insort(self._forward, awb)
+        insort(self._backward, awb[::-1])
+        self._alphabet.update(awb)
+
+    def discard(self, awb):
+        if awb not in self._members:
+            return
+        del self._members[awb]
+        _remove_sorted(self._forward, awb)
+        _remove_sorted(self._backward, awb[::-1])
+
+    def reset(self, awbs):
+        """Make the members exactly ``awbs``, applying only the difference when it is small"""
+        awbs = dict.fromkeys(awbs)
+        gone = self._members.keys() - awbs.keys()
+        new = awbs.keys() - self._members.keys()
+        if len(gone) + len(new) > len(awbs) // 4:
+            self.__init__(awbs)
+            return
+        for awb in gone:
+            self.discard(awb)
+        for awb in new:
+            self.add(awb)
+
+    def prefixed(self, fragment, limit=SUGGEST_LIMIT):
+        """Up to ``limit`` IDs starting with ``fragment``, in sorted order"""
+        return _run(self._forward, fragment, limit)
+
+    def suffixed(self, fragment, limit=SUGGEST_LIMIT):
+        """Up to ``limit`` IDs ending with ``fragment``"""
+        return [awb[::-1] for awb in _run(self._backward, fragment[::-1], limit)]
+
+    def near(self, read):
+        """IDs one substitution, insertion, deletion or adjacent swap away from ``read``, sorted"""
+        return sorted((self._members.keys() & self._edits(read)) - {read})
+
+    def _edits(self, read):
+        alphabet = self._alphabet
+        for i in range(len(read) + 1):
+            head, tail = read[:i], read[i:]
+            for c in alphabet:
+                yield head + c + tail
+            if tail:
+                rest = tail[1:]
+                yield head + rest
+                for c in alphabet:
+                    yield head + c + rest
+                if rest:
+                    yield head + rest[0] + tail[0] + rest[1:]
+
+    def suggest(self, read, limit=SUGGEST_LIMIT):
+        """Likely intended IDs for a read, as ``(awb, match)`` pairs, best first.
+
+        ``match`` is 'exact', 'edit' (one character off), 'prefix' (the
+        read lost its end) or 'suffix' (the read lost its start). Prefix
+        and suffix matches need a read of at least MIN_PARTIAL_LENGTH.
+        """
+        found = []
+        seen = set()
+
+        def take(awbs, match):
+            for awb in awbs:
+                if len(found) >= limit:
+                    return
+                if awb not in seen:
+                    seen.add(awb)
+                    found.append((awb, match))
+
+        if read in self._members:
+            take([read], 'exact')
+        take(self.near(read), 'edit')
+        if len(read) >= MIN_PARTIAL_LENGTH:
+            take(self.prefixed(read, limit + 1), 'prefix')
+            take(self.suffixed(read, limit + 1), 'suffix')
+        return found
+
+
+def _run(sorted_values, prefix, limit):
+    start = bisect_left(sorted_values, prefix)
+    run = []
+    for value in sorted_values[start:start + limit]:
+        if not value.startswith(prefix):
+            break
+        run.append(value)
+    return run
+
+
+def _remove_sorted(sorted_values, value):
+    pos = bisect_left(sorted_values, value)
+    if pos < len(sorted_values) and sorted_values[pos] == value:
+        del sorted_values[pos]
@@ -0,0 +1,91 @@
+"""Courier AWB pattern registry and single-pass manifest line tokenizer"""
+import hashlib
+import json
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+# Checked in order, so specific prefixes must come before generic ones.
+# ``courier`` is None where the format is shared or not tied to one courier.
+DEFAULT_PATTERNS = [
+    {'name': 'valmo', 'pattern': r'VL\d+', 'courier': 'Valmo'},
+    {'name': 'shadowfax', 'pattern': r'SF\d+', 'courier': 'Shadowfax'},
+    {'name': 'delhivery', 'pattern': r'1490\d{12,}', 'courier': 'Delhivery'},
+    {'name': 'numeric-134', 'pattern': r'134\d{11,}', 'courier': None},
+    {'name': 'm-series', 'pattern': r'M\d+', 'courier': None},
+    {'name': 'two-letter', 'pattern': r'[A-Z]{2}\d+', 'courier': None},
+]
+
+
+class AwbPatternRegistry:
+    """Validates an AWB ID and identifies its courier with one regex match.
+
+    All patterns are compiled into a single anchored alternation with one
+    named group per pattern; ``match.lastgroup`` says which one matched.
+    Like the original checks, a pattern only has to match a prefix of the
+    AWB ID.
+    """
+
+    def __init__(self, patterns=None):
+        self.patterns = list(DEFAULT_PATTERNS if patterns is None else patterns)
+        alternatives = []
+        for i, entry in enumerate(self.patterns):
+            re.compile(entry['pattern'])  # fail early, naming the bad pattern
+            alternatives.append(f"(?P<p{i}>{entry['pattern']})")
+        self._regex = re.compile(r'\A(?:' + '|'.join(alternatives) + ')') if alternatives else None
+        # Identifies the pattern set, e.g. so cached parse results are not reused across it
+        self.fingerprint = hashlib.sha256(json.dumps(self.patterns, sort_keys=True).encode()).hexdigest()[:12]
+
+    @classmethod
+    def from_file(cls, path):
+        """Registry with the patterns in a JSON file ahead of the defaults.
+
+        The file holds a list of ``{"name", "pattern", "courier"}`` objects,
+        so new courier formats need no code change.
+        """
+        with open(path, encoding='utf-8') as f:
+            extra = json.load(f)
+        logger.info(f"Loaded {len(extra)} AWB patterns from {path}")
+        return cls(extra + DEFAULT_PATTERNS)
+
+    def classify(self, awb_id):
+        """Return the matching pattern entry, or None if the AWB ID is not valid"""
+        if self._regex is None:
+            return None
+        match = self._regex.match(awb_id)
+        if match is None:
+            return None
+        return self.patterns[int(match.lastgroup[1:])]
+
+    def is_valid(self, awb_id):
+        return self.classify(awb_id) is not None
+
+    def courier_for(self, awb_id):
+        entry = self.classify(awb_id)
+        return entry['courier'] if entry else None
+
+
+def load_registry(path=None):
+    """Registry from AWB_PATTERNS_FILE (or ``path``), falling back to the defaults"""
+    path = path or os.environ.get('AWB_PATTERNS_FILE')
+    if path and os.path.exists(path):
+        return AwbPatternRegistry.from_file(path)
+    return AwbPatternRegistry()
+
+
+# Line kinds produced by tokenize_lines
+COURIER = 'courier'
+DIGITS = 'digits'
+ORDER_SUFFIX = 'order_suffix'
+TEXT = 'text'
+
+_LINE_RE = re.compile(r'(?P<digits>\d+)|(?P<order_suffix>\d+_\d+)|(?P<courier>Courier :.*)', re.DOTALL)
+
+
+def tokenize_lines(lines):
+    """Strip each manifest line once and classify it; returns [(kind, text)]"""
+    fullmatch = _LINE_RE.fullmatch
+    return [(match.lastgroup if match else TEXT, text)
+            for text, match in ((text, fullmatch(text)) for text in map(str.strip, lines))]
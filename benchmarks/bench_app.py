@@ -0,0 +1,438 @@
+"""Benchmark the scan, upload, stats and orders-table hot paths against manifest size.
+
+    python benchmarks/bench_app.py [--sizes 1000,10000,100000] [--formats csv,pdf]
+                                   [--scans N] [--clients N] [--url http://host:port]
+                                   [--output results.json] [--compare earlier.json]
+
+For every size a synthetic manifest (several couriers, realistic AWB
+formats) is generated as CSV and/or PDF and driven twice:
+
+* in-process through Flask's test client, which times the app alone;
+* over HTTP by ``--clients`` concurrent threads, against a local threaded
+  server or, with ``--url``, an already running deployment (e.g. gunicorn).
+
+Uploads are timed from POST until the background job reports the manifest
+swapped in. Each repeat clears the upload cache, uploads the file (cold:
+every PDF page extracted) and uploads it again (warm: answered from the
+file-hash cache); they are reported as upload_cold and upload_warm by the
+cache status the job reports (CSV uploads are never cached and stay
+``upload``). /api/awb/suggest is driven with damaged-label reads (one
+character wrong, or the start or end lost). Per endpoint the p50/p99/mean latency
+and throughput are printed and saved as JSON; ``--compare`` prints the
+change against an earlier results file. The app runs in a scratch
+directory, so uploads/ is not touched.
+"""
+import argparse
+import functools
+import http.client
+import io
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# (courier, AWB format) pairs; the formats match awb_patterns.DEFAULT_PATTERNS
+COURIERS = [
+    ('Valmo', lambda n: f"VL{2035000000 + n}"),
+    ('Shadowfax', lambda n: f"SF{2035000000 + n}FPL"),
+    ('Delhivery', lambda n: f"1490{n:012d}"),
+    ('Xpress Bees', lambda n: f"134{n:011d}"),
+    ('Ekart', lambda n: f"FM{5100000000 + n}"),
+]
+SKUS = [f"Bench SKU {k}" for k in range(1, 41)]
+ORDERS_PER_PDF_PAGE = 25
+PDF_FONT_SIZE = 4
+FORMATS = ('csv', 'pdf')
+# Upload result names by the cache status the finished job reports
+UPLOAD_ENDPOINTS = {None: 'upload', 'miss': 'upload_cold', 'partial': 'upload_partial', 'hit': 'upload_warm'}
+
+
+# ----------------------------------------------------------------------
+# Synthetic manifests
+# ----------------------------------------------------------------------
+def synthetic_orders(count, seed=0):
+    rng = random.Random(seed)
+    orders = []
+    for n in range(count):
+        courier, awb = COURIERS[n % len(COURIERS)]
+        orders.append({
+            'Order ID': f"{19300000000 + n}{8000000 + n}_1",
+            'AWB ID': awb(n),
+            'Courier': courier,
+            'SKU': rng.choice(SKUS),
+            'Qty': rng.choice((1, 1, 1, 2, 3)),
+        })
+    return orders
+
+
+def write_csv(orders, path):
+    import csv
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=['Order ID', 'AWB ID', 'Courier', 'SKU', 'Qty'])
+        writer.writeheader()
+        writer.writerows(orders)
+
+
+def write_pdf(orders, path):
+    """A manifest PDF laid out like the Meesho one: a courier header, then order blocks"""
+    import fitz  # PyMuPDF
+
+    by_courier = {}
+    for order in orders:
+        by_courier.setdefault(order['Courier'], []).append(order)
+    doc = fitz.open()
+    for courier, courier_orders in by_courier.items():
+        for start in range(0, len(courier_orders), ORDERS_PER_PDF_PAGE):
+            lines = [f"Courier : {courier}", 'Supplier Name : Benchmark', 'S. No.', 'Sub Order No.',
+                     'AWB', 'SKU', 'Qty.', 'Size', 'Packed']
+            for k, order in enumerate(courier_orders[start:start + ORDERS_PER_PDF_PAGE], start + 1):
+                prefix, suffix = order['Order ID'][:11], order['Order ID'][11:]
+                lines += [str(k), prefix, suffix, order['AWB ID'], order['SKU'], str(order['Qty']), 'Free Size']
+            page = doc.new_page(width=595, height=len(lines) * PDF_FONT_SIZE * 1.4 + 40)
+            page.insert_text((20, 20), '\n'.join(lines), fontsize=PDF_FONT_SIZE)
+    doc.save(path)
+    doc.close()
+
+
+def scan_workload(orders, count, seed=0):
+    """AWB IDs to scan: mostly pending orders, some repeats and some unknown labels"""
+    rng = random.Random(seed)
+    fresh = rng.sample([order['AWB ID'] for order in orders], min(count, len(orders)))
+    awbs = []
+    for k in range(count):
+        roll = rng.random()
+        if roll < 0.1 and awbs:
+            awbs.append(rng.choice(awbs))
+        elif roll < 0.2 or not fresh:
+            awbs.append(f"VL9{k:09d}")
+        else:
+            awbs.append(fresh.pop())
+    return awbs
+
+
+def damaged_reads(orders, count, seed=0):
+    """AWB IDs as a smudged label reads them: one character wrong, or the start or end lost"""
+    rng = random.Random(seed)
+    reads = []
+    for _ in range(count):
+        awb = rng.choice(orders)['AWB ID']
+        damage = rng.randrange(3)
+        if damage == 0:
+            pos = rng.randrange(len(awb))
+            reads.append(awb[:pos] + 'X' + awb[pos + 1:])
+        elif damage == 1:
+            reads.append(awb[:-3])
+        else:
+            reads.append(awb[3:])
+    return reads
+
+
+# ----------------------------------------------------------------------
+# Measurement
+# ----------------------------------------------------------------------
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def summarize(latencies, elapsed, **labels):
+    values = sorted(latencies)
+    result = dict(labels, count=len(values))
+    result.update({
+        'p50_ms': round(percentile(values, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(values, 0.99) * 1000, 3),
+        'mean_ms': round(sum(values) / len(values) * 1000, 3),
+        'throughput_rps': round(len(values) / elapsed, 1) if elapsed else None,
+    })
+    return result
+
+
+def timed(calls):
+    """Run callables one after another; returns (latencies, total elapsed)"""
+    latencies = []
+    started = time.perf_counter()
+    for call in calls:
+        t = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - t)
+    return latencies, time.perf_counter() - started
+
+
+def timed_uploads(upload, repeat, clear_cache=None, **labels):
+    """Cold then warm upload, ``repeat`` times; one result per cache status seen.
+
+    ``upload`` returns the job's cache status. Without ``clear_cache``
+    (a remote server) nothing is cleared, and the statuses say what was timed.
+    """
+    latencies = {}
+    for _ in range(repeat):
+        for cold in (True, False):
+            if cold and clear_cache:
+                clear_cache()
+            t = time.perf_counter()
+            cache_status = upload()
+            latencies.setdefault(UPLOAD_ENDPOINTS.get(cache_status, 'upload'), []).append(time.perf_counter() - t)
+    return [summarize(values, sum(values), endpoint=endpoint, **labels) for endpoint, values in latencies.items()]
+
+
+def clear_directory(directory):
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory, exist_ok=True)
+
+
+# ----------------------------------------------------------------------
+# In-process: Flask test client
+# ----------------------------------------------------------------------
+def run_test_client(client, orders, path, fmt, args, clear_cache):
+    labels = {'mode': 'test_client', 'size': len(orders), 'format': fmt}
+    results = []
+
+    def upload():
+        with open(path, 'rb') as f:
+            response = client.post('/upload', data={'file': (io.BytesIO(f.read()), os.path.basename(path))},
+                                   content_type='multipart/form-data', headers={'Accept': 'application/json'})
+        job_id = response.get_json()['job_id']
+        while True:
+            status = client.get(f'/api/jobs/{job_id}').get_json()
+            if status['state'] in ('done', 'failed'):
+                if status['state'] == 'failed':
+                    raise RuntimeError(f"Upload failed: {status['message']}")
+                return status.get('cache')
+            time.sleep(0.01)
+
+    results += timed_uploads(upload, args.upload_repeat, clear_cache, **labels)
+
+    awbs = scan_workload(orders, args.scans, seed=args.seed)
+    latencies, elapsed = timed([lambda awb=awb: client.post('/scan', json={'awb_id': awb}) for awb in awbs])
+    results.append(summarize(latencies, elapsed, endpoint='scan', **labels))
+
+    latencies, elapsed = timed([lambda: client.get('/api/stats')] * args.reads)
+    results.append(summarize(latencies, elapsed, endpoint='stats', **labels))
+
+    reads = damaged_reads(orders, args.reads, seed=args.seed)
+    latencies, elapsed = timed([lambda read=read: client.get(f'/api/awb/suggest?q={read}') for read in reads])
+    results.append(summarize(latencies, elapsed, endpoint='suggest', **labels))
+
+    table_query = '/api/orders?draw=1&start=0&length=25&order[0][column]=1&columns[1][data]=AWB ID&search[value]='
+    latencies, elapsed = timed([lambda: client.get(table_query + 'bench sku 1')] * args.reads)
+    results.append(summarize(latencies, elapsed, endpoint='orders_search', **labels))
+
+    victims = [order['AWB ID'] for order in orders[-args.deletes:]]
+    latencies, elapsed = timed([lambda awb=awb: client.post('/delete', json={'awb_id': awb}) for awb in victims])
+    results.append(summarize(latencies, elapsed, endpoint='delete', **labels))
+    return results
+
+
+# ----------------------------------------------------------------------
+# Over HTTP: concurrent clients
+# ----------------------------------------------------------------------
+class HttpClient:
+    """One keep-alive connection per thread"""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self._local = threading.local()
+
+    def request(self, method, path, body=None, headers=None):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=120)
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            response = conn.getresponse()
+            data = response.read()
+        except (http.client.HTTPException, OSError):
+            self._local.conn = None
+            conn.close()
+            raise
+        return response.status, data
+
+    def json(self, method, path, payload=None):
+        body = json.dumps(payload).encode() if payload is not None else None
+        headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+        return json.loads(self.request(method, path, body, headers)[1])
+
+    def upload(self, path):
+        boundary = uuid.uuid4().hex
+        with open(path, 'rb') as f:
+            data = f.read()
+        body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; '
+                f'filename="{os.path.basename(path)}"\r\nContent-Type: application/octet-stream\r\n\r\n'
+                ).encode() + data + f'\r\n--{boundary}--\r\n'.encode()
+        headers = {'Content-Type': f'multipart/form-data; boundary={boundary}', 'Accept': 'application/json'}
+        job_id = json.loads(self.request('POST', '/upload', body, headers)[1])['job_id']
+        while True:
+            status = self.json('GET', f'/api/jobs/{job_id}')
+            if status['state'] == 'failed':
+                raise RuntimeError(f"Upload failed: {status['message']}")
+            if status['state'] == 'done':
+                return status.get('cache')
+            time.sleep(0.05)
+
+
+def run_concurrent(base_url, orders, path, fmt, args, clear_cache):
+    labels = {'mode': f'concurrent_{args.clients}', 'size': len(orders), 'format': fmt}
+    client = HttpClient(base_url)
+    results = timed_uploads(lambda: client.upload(path), 1, clear_cache, **labels)
+
+    def hammer(endpoint, calls):
+        latencies = []
+        lock = threading.Lock()
+
+        def run(call):
+            t = time.perf_counter()
+            call()
+            elapsed = time.perf_counter() - t
+            with lock:
+                latencies.append(elapsed)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.clients) as pool:
+            list(pool.map(run, calls))
+        results.append(summarize(latencies, time.perf_counter() - started, endpoint=endpoint, **labels))
+
+    awbs = scan_workload(orders, args.scans, seed=args.seed + 1)
+    hammer('scan', [lambda awb=awb: client.json('POST', '/scan', {'awb_id': awb}) for awb in awbs])
+    hammer('stats', [lambda: client.json('GET', '/api/stats')] * args.reads)
+    hammer('suggest', [lambda read=read: client.json('GET', f'/api/awb/suggest?q={read}')
+                       for read in damaged_reads(orders, args.reads, seed=args.seed + 1)])
+    # Scans and stats polls interleaved, as on a packing floor with dashboards open
+    mixed = [lambda awb=awb: client.json('POST', '/scan', {'awb_id': awb})
+             for awb in scan_workload(orders, args.scans, seed=args.seed + 2)]
+    mixed[::4] = [lambda: client.json('GET', '/api/stats')] * len(mixed[::4])
+    hammer('scan_and_stats', mixed)
+    return results
+
+
+def start_local_server(app):
+    from werkzeug.serving import make_server
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+# ----------------------------------------------------------------------
+# Reporting
+# ----------------------------------------------------------------------
+def result_key(result):
+    return (result['mode'], result['format'], result['size'], result['endpoint'])
+
+
+def print_results(results):
+    print(f"{'mode':<16}{'fmt':<5}{'size':>8}  {'endpoint':<16}{'count':>7}{'p50 ms':>10}{'p99 ms':>10}{'req/s':>10}")
+    for r in results:
+        print(f"{r['mode']:<16}{r['format']:<5}{r['size']:>8}  {r['endpoint']:<16}{r['count']:>7}"
+              f"{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['throughput_rps'] or 0:>10.1f}")
+
+
+def print_comparison(results, earlier_path):
+    with open(earlier_path, encoding='utf-8') as f:
+        earlier = {result_key(r): r for r in json.load(f)['results']}
+    print(f"\nChange against {earlier_path} (p50 / p99, >1.00 is slower):")
+    for r in results:
+        before = earlier.get(result_key(r))
+        if before is None:
+            continue
+        p50 = r['p50_ms'] / before['p50_ms'] if before['p50_ms'] else float('nan')
+        p99 = r['p99_ms'] / before['p99_ms'] if before['p99_ms'] else float('nan')
+        flag = '  <-- regression' if p50 > 1.2 or p99 > 1.5 else ''
+        print(f"{r['mode']:<16}{r['format']:<5}{r['size']:>8}  {r['endpoint']:<16}{p50:>7.2f}x {p99:>7.2f}x{flag}")
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help='comma-separated manifest sizes in orders (up to 500000)')
+    parser.add_argument('--formats', default='csv,pdf', help='comma-separated manifest formats: csv, pdf')
+    parser.add_argument('--scans', type=int, default=2000, help='scans per size and mode')
+    parser.add_argument('--reads', type=int, default=500, help='stats / orders-table requests per size')
+    parser.add_argument('--deletes', type=int, default=50)
+    parser.add_argument('--upload-repeat', type=int, default=3, help='cold/warm upload pairs per size')
+    parser.add_argument('--clients', type=int, default=16, help='concurrent HTTP clients (0 to skip)')
+    parser.add_argument('--url', help='run the concurrent phase against this server instead of a local one')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='results JSON (default benchmarks/results/bench-<time>.json)')
+    parser.add_argument('--compare', help='earlier results JSON to compare against')
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+    formats = [fmt.strip() for fmt in args.formats.split(',') if fmt.strip()]
+    unknown = sorted(set(formats) - set(FORMATS))
+    if unknown or not formats:
+        parser.error(f"--formats takes a comma-separated list of {', '.join(FORMATS)}, not {args.formats!r}")
+
+    output = os.path.abspath(args.output or os.path.join(ROOT, 'benchmarks', 'results',
+                                                         time.strftime('bench-%Y%m%d-%H%M%S.json')))
+    compare = os.path.abspath(args.compare) if args.compare else None
+
+    workdir = tempfile.mkdtemp(prefix='bench-app-')
+    os.chdir(workdir)  # app.py keeps its manifest under ./uploads
+    os.environ.setdefault('FLASK_ENV', 'production')
+    logging.disable(logging.CRITICAL)  # time request handling, not log formatting
+    import app as scanner
+
+    client = scanner.app.test_client()
+    server, base_url = (None, args.url) if args.url or not args.clients else start_local_server(scanner.app)
+    clear_cache = functools.partial(clear_directory, scanner.upload_cache.directory)
+
+    results = []
+    for size in sizes:
+        orders = synthetic_orders(size, seed=args.seed)
+        for fmt in formats:
+            path = os.path.join(workdir, f"manifest-{size}.{fmt}")
+            t = time.perf_counter()
+            (write_pdf if fmt == 'pdf' else write_csv)(orders, path)
+            print(f"Generated {fmt} manifest with {size} orders in {time.perf_counter() - t:.1f}s", file=sys.stderr)
+            results += run_test_client(client, orders, path, fmt, args, clear_cache)
+            if args.clients:
+                # A remote server's cache is out of reach; its uploads are labelled by what it reports
+                results += run_concurrent(base_url, orders, path, fmt, args, None if args.url else clear_cache)
+
+    if server:
+        server.shutdown()
+    print_results(results)
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'meta': {
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'revision': git_revision(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+                'storage_backend': scanner.app.config.get('STORAGE_BACKEND'),
+                'args': vars(args),
+            },
+            'results': results,
+        }, f, indent=2)
+    print(f"\nSaved {output}")
+    if compare:
+        print_comparison(results, compare)
+
+
+if __name__ == '__main__':
+    main()
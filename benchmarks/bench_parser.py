@@ -0,0 +1,89 @@
+"""Micro-benchmark: original manifest parser vs the registry/tokenizer parser.
+
+    python benchmarks/bench_parser.py [uploads/Supplier_Manifest.pdf] [--repeat N] [--scale K]
+
+Page text is extracted once up front so only parsing is timed. ``--scale``
+repeats the pages K times to simulate a larger manifest.
+"""
+import argparse
+import logging
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # PyMuPDF
+
+from pdf_manifest import iter_lines, iter_orders
+
+
+def legacy_parse(text):
+    """The parse_pdf_to_dataframe loop as it was before the registry, minus pandas and logging"""
+    entries = []
+    courier = "Unknown"
+    lines = text.split('\n')
+    i = 0
+    while i < len(lines):
+        line = lines[i].strip()
+        if line.startswith("Courier :"):
+            courier = line.replace("Courier :", "").strip()
+        if re.match(r'^\d+$', line):
+            if i + 1 < len(lines) and re.match(r'^\d+_\d+$', lines[i+1].strip()):
+                order_id = line + lines[i+1].strip()
+                j = i + 2
+            else:
+                i += 1
+                continue
+        else:
+            i += 1
+            continue
+        awb_id = 'Unknown'
+        sku = 'Unknown'
+        qty = 1
+        if j < len(lines) and lines[j].strip():
+            awb_id = lines[j].strip()
+        if j + 1 < len(lines) and lines[j+1].strip():
+            sku = lines[j+1].strip()
+        if j + 2 < len(lines) and re.match(r'^\d+$', lines[j+2].strip()):
+            qty = int(lines[j+2].strip())
+        is_valid_awb = (awb_id and awb_id != order_id and
+                        (re.match(r'^[A-Z]{2}\d+', awb_id) or
+                         re.match(r'^M\d+', awb_id) or
+                         re.match(r'^1490\d{12,}', awb_id) or
+                         re.match(r'^134\d{11,}', awb_id) or
+                         re.match(r'^VL\d+', awb_id) or
+                         re.match(r'^SF\d+', awb_id)))
+        if is_valid_awb:
+            entries.append({"Order ID": order_id, "AWB ID": awb_id, "Courier": courier, "SKU": sku, "Qty": qty})
+        i = j + 2
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('pdf', nargs='?', default=os.path.join('uploads', 'Supplier_Manifest.pdf'))
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--scale', type=int, default=1)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)  # time parsing, not log formatting
+
+    with fitz.open(args.pdf) as doc:
+        pages = [page.get_text() for page in doc] * args.scale
+    text = ''.join(page + '\n' for page in pages)
+
+    legacy = legacy_parse(text)
+    current = list(iter_orders(iter_lines(pages)))
+    if legacy != current:
+        sys.exit(f"Parsers disagree: {len(legacy)} vs {len(current)} orders")
+
+    legacy_time = min(timeit.repeat(lambda: legacy_parse(text), number=1, repeat=args.repeat))
+    current_time = min(timeit.repeat(lambda: list(iter_orders(iter_lines(pages))), number=1, repeat=args.repeat))
+    print(f"{len(pages)} pages, {len(current)} orders")
+    print(f"legacy parser:   {legacy_time * 1000:8.3f} ms")
+    print(f"registry parser: {current_time * 1000:8.3f} ms ({legacy_time / current_time:.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,305 @@
+"""Benchmark worker start-up time and memory: cold imports and preloaded forks.
+
+    python benchmarks/bench_startup.py [--repeat N] [--workers N]
+                                       [--output results.json] [--compare earlier.json]
+
+Two scenarios, each run with the heavy libraries loaded the way app.py
+loads them now (``lazy``: pandas and PyMuPDF only on the upload path) and
+the way it used to (``eager``: both imported before the app):
+
+* ``cold``: a fresh interpreter imports app.py and serves /health,
+  /api/stats and /metrics, as a gunicorn worker does without preloading.
+  Timed from process start; RSS is read after the import and after the
+  requests.
+* ``fork`` / ``preload``: ``--workers`` processes are forked at once and
+  each serves /health, /api/stats and /metrics, either importing the app
+  after the fork (``fork``, gunicorn's default) or inheriting it from a
+  parent that imported it and then ran gunicorn.conf.py's start-up hooks
+  (``preload``, in the order gunicorn runs them). Timed from the fork to the first response;
+  per-worker unique (USS) and proportional (PSS) memory come from
+  /proc/<pid>/smaps_rollup while all workers are alive.
+
+Medians are printed and saved as JSON; ``--compare`` prints the change
+against an earlier results file. Every process runs in a scratch
+directory, so uploads/ is not touched. Memory figures need Linux.
+"""
+import argparse
+import json
+import os
+import platform
+import runpy
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+HEAVY_MODULES = ('pandas', 'fitz')
+ENDPOINTS = ('/health', '/api/stats', '/metrics')
+
+
+# ----------------------------------------------------------------------
+# Measurements taken inside the benchmarked processes
+# ----------------------------------------------------------------------
+def memory_mb():
+    """RSS, PSS and USS of this process in MB (USS/PSS are None off Linux)"""
+    fields = {}
+    try:
+        with open('/proc/self/smaps_rollup', encoding='ascii') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    except OSError:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {'rss_mb': rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 'pss_mb': None, 'uss_mb': None}
+    return {
+        'rss_mb': fields.get('Rss'),
+        'pss_mb': fields.get('Pss'),
+        'uss_mb': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0),
+    }
+
+
+def import_app(eager):
+    if eager:
+        for name in HEAVY_MODULES:
+            __import__(name)
+    import app as scanner
+    return scanner
+
+
+def serve_requests(scanner):
+    client = scanner.app.test_client()
+    for endpoint in ENDPOINTS:
+        response = client.get(endpoint)
+        if response.status_code != 200:
+            raise RuntimeError(f"{endpoint} returned {response.status_code}")
+
+
+def loaded_heavy_modules():
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+
+def child_cold(eager, started):
+    """One cold worker: import, serve, report; ``started`` is the parent's clock at spawn"""
+    t = time.perf_counter()
+    scanner = import_app(eager)
+    imported = time.perf_counter()
+    after_import = memory_mb()
+    serve_requests(scanner)
+    served = time.perf_counter()
+    return {
+        'import_ms': (imported - t) * 1000,
+        'first_response_ms': (served - imported) * 1000,
+        'startup_ms': (time.time() - started) * 1000,
+        'rss_import_mb': after_import['rss_mb'],
+        'rss_served_mb': memory_mb()['rss_mb'],
+        'heavy_modules': loaded_heavy_modules(),
+    }
+
+
+def child_forks(eager, preload, workers):
+    """Fork ``workers`` workers at once and collect what each one reports"""
+    if preload:
+        scanner = import_app(eager)
+        # gunicorn runs its start-up hooks after importing a preloaded app
+        hooks = runpy.run_path(os.path.join(ROOT, 'gunicorn.conf.py'))
+        hooks['on_starting'](None)
+        hooks['when_ready'](None)
+    parent_mb = memory_mb()['rss_mb']
+    release_r, release_w = os.pipe()
+    pids = []
+    readers = []
+    for _ in range(workers):
+        result_r, result_w = os.pipe()
+        forked = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            os.close(release_w)
+            os.close(result_r)
+            try:
+                worker = scanner if preload else import_app(eager)
+                serve_requests(worker)
+                report = {'ready_ms': (time.perf_counter() - forked) * 1000, **memory_mb(),
+                          'heavy_modules': loaded_heavy_modules()}
+                # PSS splits shared pages between the processes mapping them,
+                # so wait for the parent to read every worker before exiting
+                os.write(result_w, json.dumps(report).encode())
+                os.close(result_w)
+                os.read(release_r, 1)
+            finally:
+                os._exit(0)
+        os.close(result_w)
+        pids.append(pid)
+        readers.append(result_r)
+    reports = []
+    for result_r in readers:
+        with os.fdopen(result_r, 'rb') as f:
+            reports.append(json.loads(f.read()))
+    os.close(release_w)
+    os.close(release_r)
+    for pid in pids:
+        os.waitpid(pid, 0)
+    return {'parent_rss_mb': parent_mb, 'workers': reports}
+
+
+def run_child(args):
+    os.chdir(args.workdir)  # app.py keeps its manifest under ./uploads
+    os.environ.setdefault('FLASK_ENV', 'production')
+    import logging
+    logging.disable(logging.CRITICAL)
+    if args.child == 'cold':
+        result = child_cold(args.eager, args.started)
+    else:
+        result = child_forks(args.eager, args.child == 'preload', args.workers)
+    json.dump(result, sys.stdout)
+
+
+# ----------------------------------------------------------------------
+# Driver
+# ----------------------------------------------------------------------
+def spawn(scenario, libs, workdir, workers=0):
+    command = [sys.executable, os.path.abspath(__file__), '--child', scenario, '--workdir', workdir,
+               '--workers', str(workers), '--started', repr(time.time())]
+    if libs == 'eager':
+        command.append('--eager')
+    output = subprocess.run(command, cwd=workdir, capture_output=True, text=True)
+    if output.returncode != 0:
+        raise RuntimeError(f"{scenario}/{libs} run failed:\n{output.stderr}")
+    return json.loads(output.stdout)
+
+
+def median(values):
+    values = [v for v in values if v is not None]
+    return statistics.median(values) if values else None
+
+
+def run_cold(libs, workdir, repeat):
+    runs = [spawn('cold', libs, workdir) for _ in range(repeat)]
+    result = {'scenario': 'cold', 'libs': libs, 'runs': repeat, 'heavy_modules': runs[-1]['heavy_modules']}
+    for key in ('startup_ms', 'import_ms', 'first_response_ms', 'rss_import_mb', 'rss_served_mb'):
+        result[key] = median([r[key] for r in runs])
+    return result
+
+
+def run_forks(scenario, libs, workdir, repeat, workers):
+    runs = [spawn(scenario, libs, workdir, workers) for _ in range(repeat)]
+    reports = [w for r in runs for w in r['workers']]
+    return {
+        'scenario': scenario,
+        'libs': libs,
+        'runs': repeat,
+        'workers': workers,
+        'heavy_modules': reports[-1]['heavy_modules'],
+        'parent_rss_mb': median([r['parent_rss_mb'] for r in runs]),
+        'ready_ms': median([w['ready_ms'] for w in reports]),
+        'rss_mb': median([w['rss_mb'] for w in reports]),
+        'pss_mb': median([w['pss_mb'] for w in reports]),
+        'uss_mb': median([w['uss_mb'] for w in reports]),
+    }
+
+
+# ----------------------------------------------------------------------
+# Reporting
+# ----------------------------------------------------------------------
+METRICS = ('startup_ms', 'import_ms', 'ready_ms', 'rss_served_mb', 'rss_mb', 'pss_mb', 'uss_mb')
+
+
+def result_key(result):
+    return (result['scenario'], result['libs'])
+
+
+def fmt(value):
+    return f"{value:>10.1f}" if value is not None else f"{'-':>10}"
+
+
+def print_results(results):
+    print(f"{'scenario':<10}{'libs':<7}{'start ms':>10}{'import ms':>10}{'ready ms':>10}"
+          f"{'RSS MB':>10}{'PSS MB':>10}{'USS MB':>10}  heavy modules")
+    for r in results:
+        rss = r.get('rss_served_mb', r.get('rss_mb'))
+        print(f"{r['scenario']:<10}{r['libs']:<7}{fmt(r.get('startup_ms'))}{fmt(r.get('import_ms'))}"
+              f"{fmt(r.get('ready_ms'))}{fmt(rss)}{fmt(r.get('pss_mb'))}{fmt(r.get('uss_mb'))}"
+              f"  {', '.join(r['heavy_modules']) or '-'}")
+
+
+def print_comparison(results, earlier_path):
+    with open(earlier_path, encoding='utf-8') as f:
+        earlier = {result_key(r): r for r in json.load(f)['results']}
+    print(f"\nChange against {earlier_path} (>1.00 is slower / larger):")
+    for r in results:
+        before = earlier.get(result_key(r))
+        if before is None:
+            continue
+        ratios = []
+        for key in METRICS:
+            if r.get(key) is not None and before.get(key):
+                ratios.append(f"{key} {r[key] / before[key]:.2f}x")
+        print(f"{r['scenario']:<10}{r['libs']:<7}{'  '.join(ratios)}")
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help='runs per scenario (medians are reported)')
+    parser.add_argument('--workers', type=int, default=4, help='workers forked at once in the fork scenarios')
+    parser.add_argument('--libs', default='lazy,eager', help='lazy, eager or both')
+    parser.add_argument('--output', help='results JSON (default benchmarks/results/startup-<time>.json)')
+    parser.add_argument('--compare', help='earlier results JSON to compare against')
+    # Internal: what the spawned benchmark processes run
+    parser.add_argument('--child', choices=('cold', 'fork', 'preload'), help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    parser.add_argument('--started', type=float, help=argparse.SUPPRESS)
+    parser.add_argument('--eager', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return run_child(args)
+
+    output = os.path.abspath(args.output or os.path.join(ROOT, 'benchmarks', 'results',
+                                                         time.strftime('startup-%Y%m%d-%H%M%S.json')))
+    workdir = tempfile.mkdtemp(prefix='bench-startup-')
+    # Created up front so workers importing the app at the same time do not race to make them
+    os.makedirs(os.path.join(workdir, 'logs'))
+    os.makedirs(os.path.join(workdir, 'uploads'))
+    spawn('cold', 'lazy', workdir)  # warm the page cache and __pycache__ before timing
+
+    results = []
+    fork_scenarios = ('fork', 'preload') if hasattr(os, 'fork') else ()
+    for libs in [name.strip() for name in args.libs.split(',')]:
+        print(f"Running {libs} scenarios...", file=sys.stderr)
+        results.append(run_cold(libs, workdir, args.repeat))
+        for scenario in fork_scenarios:
+            results.append(run_forks(scenario, libs, workdir, args.repeat, args.workers))
+    print_results(results)
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'meta': {
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'revision': git_revision(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+                'args': vars(args),
+            },
+            'results': results,
+        }, f, indent=2)
+    print(f"\nSaved {output}")
+    if args.compare:
+        print_comparison(results, os.path.abspath(args.compare))
+
+
+if __name__ == '__main__':
+    main()
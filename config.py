@@ -11,9 +11,65 @@ class Config:
     MAX_CONTENT_LENGTH = 50 * 1024 * 1024  # 50MB max file size
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
     
+    # Worker mode, matching gunicorn.conf.py: 'sync' (one request per worker
+    # process) or 'gevent' (many concurrent connections per process; manifest
+    # writes are coalesced by one writer per process, see async_store.py).
+    # The gevent mode needs requirements-async.txt.
+    WORKER_MODE = os.environ.get('WORKER_MODE', 'sync')
+    
+    # Most queued scans/deletes the gevent-mode writer applies in one go
+    WRITER_MAX_COALESCE = 500
+    
+    # Manifest storage: 'csv' (orders.csv plus journal) or 'sqlite'
+    # (uploads/orders.db in WAL mode, safe for many gunicorn workers)
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'csv')
+    
+    # Manifest journal: events are fsynced in batches and folded into
+    # orders.csv by a background thread once the journal gets long
+    JOURNAL_COMPACT_THRESHOLD = 500
+    JOURNAL_COMPACT_INTERVAL = 5.0
+    JOURNAL_FSYNC_BATCH = 50
+    JOURNAL_FSYNC_INTERVAL = 0.2
+    
+    # Also write each manifest snapshot as orders.csv.feather, which workers
+    # load much faster than the CSV (needs pyarrow; skipped if it is missing)
+    COLUMNAR_SNAPSHOT = os.environ.get('COLUMNAR_SNAPSHOT', '').lower() in ('1', 'true', 'yes')
+    
+    # Processes used to extract text from large manifest PDFs (None = up to 4)
+    PDF_EXTRACT_WORKERS = int(os.environ['PDF_EXTRACT_WORKERS']) if os.environ.get('PDF_EXTRACT_WORKERS') else None
+    
+    # Extra courier AWB formats: JSON list of {"name", "pattern", "courier"}
+    AWB_PATTERNS_FILE = os.environ.get('AWB_PATTERNS_FILE')
+    
+    # Parsed uploads and page text are cached in uploads/.cache up to this size
+    UPLOAD_CACHE_MAX_BYTES = 200 * 1024 * 1024
+    
+    # Uploads are parsed in the background; jobs run at once per worker process
+    UPLOAD_JOB_WORKERS = 2
+    
+    # Largest number of queued scans accepted by /scan/batch in one request
+    MAX_SCAN_BATCH = 500
+    
+    # Largest page the orders table endpoint (/api/orders) returns
+    ORDERS_PAGE_MAX = 500
+    
+    # Live dashboard updates (/events, gevent worker mode only): how often
+    # each stream checks for new events, and how long one connection lasts
+    # before the browser reconnects
+    EVENTS_POLL_INTERVAL = 0.5
+    SSE_MAX_DURATION = 25
+    # In the sync worker mode dashboards poll /api/stats this often (seconds)
+    # instead, so they never hold a worker
+    STATS_POLL_INTERVAL = 10
+    
     # Logging configuration
     LOG_LEVEL = 'INFO'
     LOG_FILE = 'logs/app.log'
+    # Fraction of per-scan debug messages logged when LOG_LEVEL is DEBUG
+    LOG_SAMPLE_RATE = 0.01
+    
+    # Each worker writes its /metrics numbers to uploads/.metrics this often
+    METRICS_FLUSH_INTERVAL = 1.0
     
     # Security headers
     SECURITY_HEADERS = {
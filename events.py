@@ -0,0 +1,117 @@
+"""Cross-worker scan event bus backed by a small SQLite table"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created REAL NOT NULL,
+    type TEXT NOT NULL,
+    payload TEXT NOT NULL
+);
+"""
+
+# Events older than the newest KEEP_EVENTS are trimmed on publish
+KEEP_EVENTS = 5000
+
+
+class EventBus:
+    """Publish/subscribe between gunicorn workers through SQLite.
+
+    Any worker appends events with ``publish``; each SSE connection polls
+    ``PRAGMA data_version``, which only changes when another connection
+    commits, and reads new rows only then. Event ids are monotonic, so a
+    reconnecting browser resumes from its Last-Event-ID.
+
+    With ``run`` (e.g. a gevent thread-pool call), every SQLite statement
+    goes through ``run(fn, *args)`` so publishers and streams never block
+    the event loop on disk.
+    """
+
+    def __init__(self, path, poll_interval=0.5, run=None):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.run = run
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _call(self, fn, *args):
+        return self.run(fn, *args) if self.run else fn(*args)
+
+    def publish(self, event_type, payload):
+        return self._call(self._publish, event_type, payload)
+
+    def _publish(self, event_type, payload):
+        conn = self._conn()
+        cursor = conn.execute('INSERT INTO events (created, type, payload) VALUES (?, ?, ?)',
+                              (time.time(), event_type, json.dumps(payload)))
+        if cursor.lastrowid % 100 == 0:
+            conn.execute('DELETE FROM events WHERE id <= ?', (cursor.lastrowid - KEEP_EVENTS,))
+        return cursor.lastrowid
+
+    def last_id(self):
+        return self._call(self._last_id)
+
+    def _last_id(self):
+        return self._conn().execute('SELECT COALESCE(MAX(id), 0) FROM events').fetchone()[0]
+
+    def _poll(self, last_id, data_version):
+        """Events after ``last_id`` and data_version; rows are read only after a new commit.
+
+        Through ``run`` each poll may land on another thread and connection,
+        whose data_version cannot be compared with the last one, so the
+        rows are always read; that is one primary-key range lookup.
+        """
+        conn = self._conn()
+        version = conn.execute('PRAGMA data_version').fetchone()[0]
+        if version == data_version and not self.run:
+            return [], version
+        rows = conn.execute('SELECT id, type, payload FROM events WHERE id > ? ORDER BY id', (last_id,)).fetchall()
+        return rows, version
+
+    def listen(self, after_id=None, max_duration=None, keepalive=15.0):
+        """Yield ``(id, type, payload)`` for events after ``after_id``.
+
+        Yields None every ``keepalive`` seconds while idle so the caller can
+        send a comment line. Stops after ``max_duration`` seconds, if given.
+        """
+        last_id = self.last_id() if after_id is None else after_id
+        started = last_yield = time.monotonic()
+        data_version = None
+        while max_duration is None or time.monotonic() - started < max_duration:
+            rows, data_version = self._call(self._poll, last_id, data_version)
+            for event_id, event_type, payload in rows:
+                last_id = event_id
+                last_yield = time.monotonic()
+                yield event_id, event_type, json.loads(payload)
+            if time.monotonic() - last_yield >= keepalive:
+                last_yield = time.monotonic()
+                yield None
+            time.sleep(self.poll_interval)
+
+
+def format_sse(event):
+    """Encode a listen() item as a Server-Sent Events message"""
+    if event is None:
+        return ': keepalive\n\n'
+    event_id, event_type, payload = event
+    return f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(payload)}\n\n"
@@ -1,16 +1,35 @@
 # Gunicorn configuration file for production
 import multiprocessing
+import os
 
 # Server socket
 bind = "127.0.0.1:5000"
 backlog = 2048
 
 # Worker processes
-workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = "sync"
-worker_connections = 1000
-timeout = 30
-keepalive = 2
+# WORKER_MODE=gevent (see config.py) serves many scanner connections per
+# process from a few workers; it needs requirements-async.txt installed
+worker_mode = os.environ.get("WORKER_MODE", "sync")
+if worker_mode == "gevent":
+    workers = multiprocessing.cpu_count() + 1
+    worker_class = "gevent"
+    worker_connections = 1000
+    timeout = 120
+    keepalive = 5
+else:
+    workers = multiprocessing.cpu_count() * 2 + 1
+    worker_class = "sync"
+    worker_connections = 1000
+    timeout = 30
+    keepalive = 2
+
+# Load app.py once in the master and fork the workers from it, so they
+# start without importing Flask and the app again and share those pages
+# copy-on-write. Not in gevent mode: its monkey-patching has to happen
+# before the app is imported, in each worker. Everything the app opens
+# (stores, SQLite connections, lock files, threads, metrics) is opened
+# lazily and re-opened when it sees a new pid, so forking it is safe.
+preload_app = worker_mode != "gevent"
 
 # Restart workers after this many requests, to control memory leaks
 max_requests = 1000
@@ -31,6 +50,25 @@ user = "ubuntu"
 group = "ubuntu"
 tmp_upload_dir = None
 
+# Start every deployment with fresh /metrics totals (each worker keeps its
+# numbers in uploads/.metrics; see metrics.py). Only the files go: with
+# preload_app the app has already been imported and set up the directory
+# by the time gunicorn calls this hook
+def on_starting(server):
+    directory = os.path.join("uploads", ".metrics")
+    if not os.path.isdir(directory):
+        return
+    for entry in os.scandir(directory):
+        if entry.is_file():
+            os.remove(entry.path)
+
+# Move the preloaded app's objects out of the garbage collector's reach:
+# collections touch every tracked object, which would copy the shared
+# pages into each worker
+def when_ready(server):
+    import gc
+    gc.freeze()
+
 # SSL (if needed)
 # keyfile = "/path/to/keyfile"
 # certfile = "/path/to/certfile"
@@ -0,0 +1,251 @@
+"""Column-oriented, dictionary-encoded storage for the in-memory manifest"""
+from array import array
+from collections import Counter
+from itertools import compress
+from operator import and_, or_
+
+# Columns kept as plain strings because nearly every value is distinct;
+# every other column is dictionary-encoded
+STRING_COLUMNS = ('Order ID', 'AWB ID')
+
+
+class DictColumn:
+    """A column stored as one code per row into a list of distinct values.
+
+    Courier, SKU, Status and Qty have a handful of distinct values across
+    the whole manifest, so a row costs 4 bytes instead of a string object,
+    and a filter tests each distinct value once instead of once per row.
+    """
+
+    def __init__(self):
+        self.values = []
+        self.codes = array('I')
+        self._code_of = {}
+
+    def encode(self, value):
+        code = self._code_of.get(value)
+        if code is None:
+            code = self._code_of[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def append(self, value):
+        self.codes.append(self.encode(value))
+
+    def extend(self, values):
+        code_of = self._code_of
+        known = len(self.values)
+        # setdefault hands the next free code to values not seen before
+        self.codes.extend(array('I', [code_of.setdefault(value, len(code_of)) for value in values]))
+        self.values.extend(list(code_of)[known:])
+
+    def __getitem__(self, pos):
+        return self.values[self.codes[pos]]
+
+    def __setitem__(self, pos, value):
+        self.codes[pos] = self.encode(value)
+
+    def __iter__(self):
+        return map(self.values.__getitem__, self.codes)
+
+    def mask(self, predicate):
+        """bytes with 1 for each row whose value satisfies ``predicate``"""
+        hits = bytes(bool(predicate(value)) for value in self.values)
+        return bytes(map(hits.__getitem__, self.codes))
+
+    def sort_key(self, key=None):
+        """Row sort key: the rank of the row's value among the distinct values"""
+        order = sorted(range(len(self.values)), key=lambda code: key(self.values[code]) if key else self.values[code])
+        rank = [0] * len(order)
+        for i, code in enumerate(order):
+            rank[code] = i
+        codes = self.codes
+        return lambda pos: rank[codes[pos]]
+
+
+class ManifestTable:
+    """The manifest as one column per field plus a live-row bitmap.
+
+    Row positions are stable: a delete only clears the row's ``alive``
+    byte, so hash indexes keyed by position stay valid until the table is
+    rebuilt. Filters produce row masks (one byte per row) that are combined
+    and turned into positions with C-level ``map`` / ``compress``.
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.col = {name: i for i, name in enumerate(self.columns)}
+        self.data = [[] if name in STRING_COLUMNS else DictColumn() for name in self.columns]
+        self.alive = bytearray()
+
+    @classmethod
+    def from_rows(cls, columns, rows):
+        """Build a table column by column from a list of equally long rows"""
+        table = cls(columns)
+        fields = list(zip(*rows)) if rows else [()] * len(table.columns)
+        for column, values in zip(table.data, fields):
+            column.extend(values)
+        table.alive = bytearray(b'\x01') * len(rows)
+        return table
+
+    def __len__(self):
+        """Number of row positions, deleted rows included"""
+        return len(self.alive)
+
+    def append(self, row):
+        for column, value in zip(self.data, row):
+            column.append(value)
+        self.alive.append(1)
+        return len(self.alive) - 1
+
+    def value(self, pos, name):
+        return self.data[self.col[name]][pos]
+
+    def set(self, pos, name, value):
+        self.data[self.col[name]][pos] = value
+
+    def remove(self, pos):
+        self.alive[pos] = 0
+
+    def row(self, pos):
+        return [column[pos] for column in self.data]
+
+    def positions(self, mask=None):
+        """Positions of live rows, restricted to ``mask`` if given"""
+        mask = self.alive if mask is None else bytes(map(and_, mask, self.alive))
+        return list(compress(range(len(self.alive)), mask))
+
+    def rows(self, positions=None):
+        """Live rows as lists of strings, in position order unless ``positions`` is given"""
+        if positions is None:
+            return map(list, compress(zip(*self.data), self.alive))
+        return (self.row(pos) for pos in positions)
+
+    def equal_mask(self, name, value):
+        column = self.data[self.col[name]]
+        if isinstance(column, DictColumn):
+            return column.mask(value.__eq__)
+        return bytes(map(value.__eq__, column))
+
+    def match_mask(self, name, predicate):
+        """Rows whose value in the named column satisfies ``predicate`` (none if there is no such column)"""
+        if name not in self.col:
+            return bytes(len(self.alive))
+        column = self.data[self.col[name]]
+        if isinstance(column, DictColumn):
+            return column.mask(predicate)
+        return bytes(bool(predicate(value)) for value in column)
+
+    def contains_mask(self, needle):
+        """Rows where any column contains ``needle`` (which must be lower case)"""
+        mask = bytes(len(self.alive))
+        for column in self.data:
+            if isinstance(column, DictColumn):
+                column_mask = column.mask(lambda value: needle in value.lower())
+            else:
+                column_mask = bytes(needle in value.lower() for value in column)
+            mask = bytes(map(or_, mask, column_mask))
+        return mask
+
+    def sort(self, positions, name, descending=False, key=None):
+        column = self.data[self.col[name]]
+        if isinstance(column, DictColumn):
+            positions.sort(key=column.sort_key(key), reverse=descending)
+        elif key:
+            positions.sort(key=lambda pos: key(column[pos]), reverse=descending)
+        else:
+            positions.sort(key=column.__getitem__, reverse=descending)
+
+    def snapshot(self, mask=None, mutable=()):
+        """The live rows (restricted to ``mask``) as they are now, readable while the table keeps changing.
+
+        Rows are only ever appended or flagged dead, so only the columns
+        named in ``mutable`` (changed in place by set()) are copied: four
+        bytes per row for a dictionary column.
+        """
+        data = list(self.data)
+        for name in mutable:
+            if name in self.col:
+                data[self.col[name]] = _frozen(self.data[self.col[name]])
+        mask = self.alive if mask is None else bytes(map(and_, mask, self.alive))
+        return TableSnapshot(self.columns, data, array('I', compress(range(len(self.alive)), mask)))
+
+    def group_counts(self, names):
+        """Counter of live rows per combination of values of the named columns"""
+        columns = [self.data[self.col[name]] for name in names]
+        codes = [column.codes if isinstance(column, DictColumn) else column for column in columns]
+        counts = Counter(compress(zip(*codes), self.alive))
+
+        def decode(key):
+            return tuple(column.values[code] if isinstance(column, DictColumn) else code
+                         for column, code in zip(columns, key))
+        return Counter({decode(key): n for key, n in counts.items()})
+
+    # ------------------------------------------------------------------
+    # Arrow (Feather) snapshots, optional: needs pyarrow
+    # ------------------------------------------------------------------
+    def to_arrow(self, metadata=None):
+        """Live rows as a pyarrow Table; dictionary columns stay dictionary-encoded"""
+        import pyarrow as pa
+
+        arrays = []
+        for column in self.data:
+            if isinstance(column, DictColumn):
+                indices = pa.array(array('I', compress(column.codes, self.alive)), pa.uint32())
+                arrays.append(pa.DictionaryArray.from_arrays(indices, pa.array(column.values, pa.string())))
+            else:
+                arrays.append(pa.array(list(compress(column, self.alive)), pa.string()))
+        schema = pa.schema([pa.field(name, array_.type) for name, array_ in zip(self.columns, arrays)],
+                           metadata=metadata)
+        return pa.Table.from_arrays(arrays, schema=schema)
+
+    @classmethod
+    def from_arrow(cls, table):
+        """Inverse of to_arrow; dictionary columns are adopted without decoding every row"""
+        import pyarrow as pa
+
+        result = cls(table.column_names)
+        table = table.combine_chunks()
+        for name, column, chunked in zip(result.columns, result.data, table.columns):
+            arr = chunked.chunk(0) if chunked.num_chunks else pa.array([], pa.string())
+            if isinstance(column, DictColumn):
+                if not pa.types.is_dictionary(arr.type):
+                    arr = arr.dictionary_encode()
+                column.values = arr.dictionary.to_pylist()
+                column._code_of = {value: code for code, value in enumerate(column.values)}
+                indices = arr.indices.cast(pa.uint32())
+                if len(indices):
+                    data = indices.buffers()[1]
+                    column.codes.frombytes(memoryview(data)[indices.offset * 4:(indices.offset + len(indices)) * 4])
+            else:
+                column.extend(arr.to_pylist())
+        result.alive = bytearray(b'\x01') * table.num_rows
+        return result
+
+
+class TableSnapshot:
+    """Rows of a ManifestTable frozen by ManifestTable.snapshot"""
+
+    def __init__(self, columns, data, positions):
+        self.columns = list(columns)
+        self.data = data
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def rows(self):
+        """Iterate the rows as lists of strings, one at a time"""
+        data = self.data
+        for pos in self.positions:
+            yield [column[pos] for column in data]
+
+
+def _frozen(column):
+    """A copy of a column that later set() calls on the original do not affect"""
+    if isinstance(column, DictColumn):
+        frozen = DictColumn()
+        frozen.values = list(column.values)
+        frozen.codes = array('I', column.codes)
+        return frozen
+    return list(column)
@@ -0,0 +1,93 @@
+"""Chunked CSV and XLSX encoding of manifest rows for streaming downloads"""
+import csv
+import importlib.util
+import io
+import os
+import tempfile
+
+# Bytes (roughly) handed to the response per chunk
+CHUNK_SIZE = 64 * 1024
+# Data rows per worksheet; Excel stops at 1,048,576 rows including the header
+XLSX_SHEET_ROWS = 1048575
+
+CSV_MIMETYPE = 'text/csv'
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+# xlsxwriter is only imported when an XLSX export starts; this lets the
+# dashboard leave the format out when it is not installed
+XLSX_AVAILABLE = importlib.util.find_spec('xlsxwriter') is not None
+
+
+def iter_csv(columns, rows, chunk_size=CHUNK_SIZE):
+    """Encode rows as CSV, yielding about ``chunk_size`` characters at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_xlsx(columns, rows, directory=None, chunk_size=CHUNK_SIZE):
+    """Encode rows as an XLSX workbook, yielding its bytes in chunks.
+
+    Needs xlsxwriter; the ImportError is raised here, before anything is
+    streamed. In constant_memory mode xlsxwriter writes each row out as it
+    goes, but a workbook is a zip that only exists once every row is in,
+    so the rows go to a temporary file that is then streamed and removed.
+    """
+    import xlsxwriter
+
+    return _xlsx_chunks(xlsxwriter, columns, rows, directory, chunk_size)
+
+
+def _xlsx_chunks(xlsxwriter, columns, rows, directory, chunk_size):
+    fd, path = tempfile.mkstemp(suffix='.xlsx', dir=directory)
+    os.close(fd)
+    try:
+        workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'tmpdir': directory})
+        bold = workbook.add_format({'bold': True})
+        sheet = None
+        row_num = XLSX_SHEET_ROWS
+        for row in rows:
+            if row_num >= XLSX_SHEET_ROWS:
+                # Start another sheet rather than lose rows past Excel's limit
+                sheet = workbook.add_worksheet()
+                sheet.write_row(0, 0, columns, bold)
+                row_num = 0
+            row_num += 1
+            sheet.write_row(row_num, 0, row)
+        if sheet is None:
+            workbook.add_worksheet().write_row(0, 0, columns, bold)
+        workbook.close()
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
+
+
+def row_filter(columns, statuses=None, couriers=None, since=None, until=None):
+    """Predicate over row lists with the export_rows filters, for rows read from an archive"""
+    col = {name: i for i, name in enumerate(columns)}
+
+    def value(row, name):
+        return row[col[name]] if name in col else ''
+
+    def keep(row):
+        if statuses and value(row, 'Status') not in statuses:
+            return False
+        if couriers and value(row, 'Courier').lower() not in couriers:
+            return False
+        if since or until:
+            scanned = value(row, 'Scanned Time')
+            if not scanned or (since and scanned < since) or (until and scanned > until):
+                return False
+        return True
+    return keep
@@ -0,0 +1,33 @@
+"""Vectorized merge of a newly uploaded manifest into the current one"""
+import pandas as pd
+
+# Order details compared to detect conflicting rows for an AWB already present
+DETAIL_COLUMNS = ['Order ID', 'Courier', 'SKU', 'Qty']
+
+
+def merge_orders(current, incoming):
+    """Hash-join ``incoming`` onto ``current`` by AWB ID.
+
+    Rows of ``incoming`` whose AWB ID is already in ``current`` are kept as
+    they are (existing Status and Scanned Time win); the rest are returned
+    as new rows. A kept row whose order details differ counts as
+    conflicting. Returns ``(new_rows, report)`` where report has ``added``,
+    ``kept`` and ``conflicting`` counts.
+    """
+    details = [col for col in DETAIL_COLUMNS if col in current.columns and col in incoming.columns]
+    existing = current[['AWB ID'] + details].drop_duplicates('AWB ID').astype(str)
+    joined = incoming[['AWB ID'] + details].astype(str).merge(
+        existing, on='AWB ID', how='left', suffixes=('', '_current'), indicator=True)
+    matched = (joined['_merge'] == 'both').to_numpy()
+
+    differs = pd.Series(False, index=joined.index)
+    for col in details:
+        differs |= joined[col] != joined[col + '_current']
+
+    new_rows = incoming[~matched]
+    report = {
+        'added': int(len(new_rows)),
+        'kept': int(matched.sum()),
+        'conflicting': int((differs & matched).sum()),
+    }
+    return new_rows, report
@@ -0,0 +1,407 @@
+"""Named manifest sessions (one per day or pickup) with archival of closed ones"""
+import csv
+import gzip
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+from manifest_columns import ManifestTable
+from manifest_store import COLUMNS
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines have no flock
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+OPEN = 'open'
+CLOSED = 'closed'
+
+SESSION_NAME = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]{0,63}$')
+
+# Compression of archived sessions written as Feather (needs pyarrow)
+ARCHIVE_COMPRESSION = 'zstd'
+
+HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS awb_history (
+    awb TEXT NOT NULL,
+    session_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    scanned_time TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (awb, session_id)
+) WITHOUT ROWID;
+"""
+
+# Set once the missing-pyarrow fallback has been logged
+_warned_no_pyarrow = False
+
+# Preference when one AWB has several rows in a session
+_STATUS_RANK = {'Packed': 2, 'Cancelled': 1}
+
+
+class AwbHistory:
+    """On-disk index of the AWBs of closed sessions.
+
+    One row per (AWB, session) in a WITHOUT ROWID table clustered on the
+    AWB, so a lookup is a single B-tree descent and old sessions never have
+    to be loaded to answer "was this packed before?".
+
+    With ``run`` (e.g. app.run_blocking in the gevent worker mode), the
+    SQLite work goes through ``run(fn, *args)`` so it waits on disk off the
+    event loop.
+    """
+
+    def __init__(self, path, run=None):
+        self.path = path
+        self.run = run
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(HISTORY_SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _call(self, fn, *args):
+        return self.run(fn, *args) if self.run else fn(*args)
+
+    def add_session(self, session, records):
+        """Index the rows (dicts) of a session being closed; safe to repeat"""
+        return self._call(self._add_session, session, records)
+
+    def _add_session(self, session, records):
+        latest = {}
+        for record in records:
+            awb = str(record.get('AWB ID', '')).strip()
+            if not awb:
+                continue
+            entry = (record.get('Status', ''), record.get('Scanned Time', '') or '')
+            current = latest.get(awb)
+            if current is None or _STATUS_RANK.get(entry[0], 0) > _STATUS_RANK.get(current[0], 0):
+                latest[awb] = entry
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('INSERT OR IGNORE INTO sessions (name) VALUES (?)', (session,))
+            session_id = conn.execute('SELECT id FROM sessions WHERE name = ?', (session,)).fetchone()[0]
+            conn.execute('DELETE FROM awb_history WHERE session_id = ?', (session_id,))
+            conn.executemany('INSERT INTO awb_history (awb, session_id, status, scanned_time) VALUES (?, ?, ?, ?)',
+                             ((awb, session_id, status, scanned) for awb, (status, scanned) in latest.items()))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return len(latest)
+
+    def lookup(self, awb_id):
+        """Closed sessions holding this AWB, most recently scanned first"""
+        return self._call(self._lookup, awb_id)
+
+    def _lookup(self, awb_id):
+        rows = self._conn().execute(
+            'SELECT s.name, h.status, h.scanned_time FROM awb_history h JOIN sessions s ON s.id = h.session_id '
+            'WHERE h.awb = ? ORDER BY h.scanned_time DESC', (str(awb_id).strip(),)).fetchall()
+        return [{'session': name, 'status': status, 'scanned_time': scanned} for name, status, scanned in rows]
+
+
+class SessionManager:
+    """Named manifest sessions, each with its own store and indexes.
+
+    ``sessions.json`` lists every session and which one is active; scans
+    and uploads go to the active session. Any number of sessions can be
+    open (e.g. one per pickup), each loaded lazily by ``open_store`` from
+    its own directory. Closing a session writes its orders to a compressed
+    Feather file under ``archive/`` (gzipped CSV without pyarrow), adds its
+    AWBs to the AwbHistory index and removes the live files, so only open
+    sessions cost memory.
+
+    The registry is rewritten under a flock and re-read by other gunicorn
+    workers when its stat signature changes, as ManifestStore does with
+    orders.csv.
+    """
+
+    def __init__(self, directory, open_store, legacy_directory=None, run=None):
+        self.directory = directory
+        self.archive_directory = os.path.join(directory, 'archive')
+        self.registry_path = os.path.join(directory, 'sessions.json')
+        self.lock_path = os.path.join(directory, 'sessions.lock')
+        self.open_store = open_store
+        self.legacy_directory = legacy_directory
+        for path in (directory, self.archive_directory):
+            if not os.path.exists(path):
+                os.makedirs(path)
+        self.history = AwbHistory(os.path.join(directory, 'awb_history.db'), run=run)
+        self._lock = threading.RLock()
+        self._registry = None
+        self._registry_sig = None
+        self._stores = {}
+
+    # ------------------------------------------------------------------
+    # Registry
+    # ------------------------------------------------------------------
+    def _stat(self):
+        try:
+            st = os.stat(self.registry_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _read(self):
+        """The registry, re-read if another worker changed it"""
+        sig = self._stat()
+        if sig is None:
+            with self._update() as registry:
+                self._adopt_legacy(registry)
+            return self._registry
+        if sig != self._registry_sig:
+            with open(self.registry_path, encoding='utf-8') as f:
+                self._set_registry(json.load(f), sig)
+        return self._registry
+
+    def _set_registry(self, registry, sig):
+        self._registry = registry
+        self._registry_sig = sig
+        # Drop the stores of sessions closed by another worker
+        for name in list(self._stores):
+            if registry['sessions'].get(name, {}).get('state') != OPEN:
+                self._stores.pop(name).close()
+
+    @contextmanager
+    def _update(self):
+        """Read-modify-write the registry under an exclusive flock"""
+        with self._lock:
+            fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                try:
+                    with open(self.registry_path, encoding='utf-8') as f:
+                        registry = json.load(f)
+                except FileNotFoundError:
+                    registry = {'active': None, 'sessions': {}}
+                yield registry
+                tmp_path = f"{self.registry_path}.{uuid.uuid4().hex}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(registry, f, indent=1)
+                os.replace(tmp_path, self.registry_path)
+                self._set_registry(registry, self._stat())
+            finally:
+                os.close(fd)
+
+    def _adopt_legacy(self, registry):
+        """Register a manifest from before sessions existed as the first session"""
+        if registry['sessions'] or not self.legacy_directory:
+            return
+        store = self.open_store(self.legacy_directory)
+        if not store.exists():
+            store.close()
+            return
+        name = datetime.now().strftime('%Y-%m-%d')
+        registry['sessions'][name] = _new_session(self.legacy_directory)
+        registry['active'] = name
+        self._stores[name] = store
+        logger.info(f"Adopted the existing manifest in {self.legacy_directory} as session {name}")
+
+    # ------------------------------------------------------------------
+    # Sessions
+    # ------------------------------------------------------------------
+    def list(self):
+        """Every session as a dict with its name, newest first"""
+        with self._lock:
+            sessions = self._read()['sessions']
+            return sorted((dict(info, name=name) for name, info in sessions.items()),
+                          key=lambda info: info['created'], reverse=True)
+
+    def get(self, name):
+        with self._lock:
+            info = self._read()['sessions'].get(name)
+            return dict(info, name=name) if info else None
+
+    def active_name(self):
+        """Name of the session scans go to, creating today's session if there is none"""
+        with self._lock:
+            name = self._read()['active']
+            if name is None:
+                name = self.create()
+            return name
+
+    def store(self, name=None):
+        """Store of a session (default: the active one); it must be open"""
+        with self._lock:
+            name = name or self.active_name()
+            store = self._stores.get(name)
+            if store is None:
+                info = self._read()['sessions'].get(name)
+                if info is None:
+                    raise ValueError(f"Unknown session {name}")
+                if info['state'] != OPEN:
+                    raise ValueError(f"Session {name} is closed")
+                store = self._stores[name] = self.open_store(info['directory'])
+            return store
+
+    def create(self, name=None, activate=True):
+        """Open a new session (default name: today's date); returns its name.
+
+        Creating a session that is already open just activates it.
+        """
+        name = (name or datetime.now().strftime('%Y-%m-%d')).strip()
+        if not SESSION_NAME.match(name):
+            raise ValueError('Session names may only use letters, digits, ".", "_" and "-" (at most 64)')
+        with self._update() as registry:
+            info = registry['sessions'].get(name)
+            if info is None:
+                registry['sessions'][name] = _new_session(os.path.join(self.directory, name))
+                logger.info(f"Created manifest session {name}")
+            elif info['state'] != OPEN:
+                raise ValueError(f"Session {name} is closed; choose another name")
+            if activate or registry['active'] is None:
+                registry['active'] = name
+        return name
+
+    def activate(self, name):
+        with self._update() as registry:
+            info = registry['sessions'].get(name)
+            if info is None:
+                raise ValueError(f"Unknown session {name}")
+            if info['state'] != OPEN:
+                raise ValueError(f"Session {name} is closed")
+            registry['active'] = name
+
+    def close(self, name):
+        """Archive a session that is not active and free its live files.
+
+        Every step can be repeated, so a close interrupted by a crash is
+        finished by closing the session again.
+        """
+        info = self.get(name)
+        if info is None:
+            raise ValueError(f"Unknown session {name}")
+        if info['state'] != OPEN:
+            raise ValueError(f"Session {name} is already closed")
+        if name == self.active_name():
+            raise ValueError('Switch to another session before closing the active one')
+        store = self.store(name)
+        records = store.records() if store.exists() else []
+        archive = self._write_archive(name, records)
+        indexed = self.history.add_session(name, records)
+        with self._lock:
+            # Taken out first so the registry update does not close it before it is cleared
+            self._stores.pop(name, None)
+            with self._update() as registry:
+                registry['sessions'][name].update(state=CLOSED, closed=datetime.now().isoformat(timespec='seconds'),
+                                                  orders=len(records), archive=archive)
+        store.clear()
+        store.close()
+        directory = info['directory']
+        if os.path.dirname(os.path.abspath(directory)) == os.path.abspath(self.directory):
+            # Anything but lock files means data this store does not own (e.g. another backend's)
+            if all(name.endswith('.lock') for name in os.listdir(directory)):
+                shutil.rmtree(directory, ignore_errors=True)
+        logger.info(f"Closed session {name}: archived {len(records)} orders, indexed {indexed} AWBs")
+        return len(records)
+
+    # ------------------------------------------------------------------
+    # Archives
+    # ------------------------------------------------------------------
+    def _write_archive(self, name, records):
+        """Write a session's rows to archive/<name>.feather (or .csv.gz); returns the file name"""
+        columns = list(records[0]) if records else list(COLUMNS)
+        rows = [[str(record.get(column, '')) for column in columns] for record in records]
+        try:
+            import pyarrow.feather as feather
+        except ImportError:
+            _warn_no_pyarrow()
+            filename = f"{name}.csv.gz"
+            tmp_path = os.path.join(self.archive_directory, filename + '.tmp')
+            with gzip.open(tmp_path, 'wt', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f, lineterminator='\n')
+                writer.writerow(columns)
+                writer.writerows(rows)
+        else:
+            filename = f"{name}.feather"
+            tmp_path = os.path.join(self.archive_directory, filename + '.tmp')
+            feather.write_feather(ManifestTable.from_rows(columns, rows).to_arrow(), tmp_path,
+                                  compression=ARCHIVE_COMPRESSION)
+        os.replace(tmp_path, os.path.join(self.archive_directory, filename))
+        return filename
+
+    def archived_rows(self, name):
+        """``(columns, rows)`` of a closed session, rows read from its archive a batch at a time"""
+        info = self.get(name)
+        if info is None or info['state'] != CLOSED:
+            raise ValueError(f"Session {name} is not archived")
+        path = os.path.join(self.archive_directory, info['archive'])
+        if path.endswith('.feather'):
+            import pyarrow as pa
+
+            reader = pa.ipc.open_file(pa.memory_map(path))
+            return reader.schema.names, _feather_rows(reader)
+        f = gzip.open(path, 'rt', newline='', encoding='utf-8')
+        reader = csv.reader(f)
+        return next(reader, []), _closing_rows(f, reader)
+
+    # ------------------------------------------------------------------
+    # Cross-session lookups
+    # ------------------------------------------------------------------
+    def history_of(self, awb_id, exclude=None):
+        """Every other session holding this AWB: open sessions first, then archived ones"""
+        found = []
+        for info in self.list():
+            if info['state'] != OPEN or info['name'] == exclude:
+                continue
+            store = self.store(info['name'])
+            row = store.get(awb_id) if store.exists() else None
+            if row:
+                found.append({'session': info['name'], 'status': row.get('Status', ''),
+                              'scanned_time': row.get('Scanned Time', '') or ''})
+        found.extend(entry for entry in self.history.lookup(awb_id) if entry['session'] != exclude)
+        return found
+
+    def packed_elsewhere(self, awb_id, exclude=None):
+        """The most recent other session in which this AWB was packed, or None"""
+        packed = [entry for entry in self.history_of(awb_id, exclude) if entry['status'] == 'Packed']
+        return max(packed, key=lambda entry: entry['scanned_time']) if packed else None
+
+
+def _warn_no_pyarrow():
+    global _warned_no_pyarrow
+    if not _warned_no_pyarrow:
+        _warned_no_pyarrow = True
+        logger.warning("pyarrow is not installed; closed sessions are archived as gzipped CSV, not Feather")
+
+
+def _feather_rows(reader):
+    for i in range(reader.num_record_batches):
+        yield from map(list, zip(*reader.get_batch(i).to_pydict().values()))
+
+
+def _closing_rows(f, rows):
+    with f:
+        yield from rows
+
+
+def _new_session(directory):
+    return {
+        'directory': directory,
+        'state': OPEN,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'closed': None,
+        'orders': None,
+        'archive': None,
+    }
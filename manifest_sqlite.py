@@ -0,0 +1,574 @@
+"""SQLite-backed manifest storage shared safely across gunicorn workers.
+
+Usage as a one-off migration of an existing manifest:
+
+    python manifest_sqlite.py uploads/orders.csv uploads/orders.db
+"""
+import csv
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from collections import Counter, defaultdict
+
+from awb_index import SUGGEST_LIMIT, AwbIndex
+from manifest_store import (COLUMNS, MAX_REMEMBERED_BATCHES, SORTABLE_COLUMNS, UNEXPECTED_ORDER_ID, StatusCounters,
+                            summarize, verify_counters)
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Manifest columns with a dedicated SQL column; anything else from an
+# uploaded CSV is kept in the ``extra`` JSON column so exports round-trip
+SQL_COLUMNS = {
+    'Order ID': 'order_id',
+    'AWB ID': 'awb_id',
+    'Courier': 'courier',
+    'SKU': 'sku',
+    'Qty': 'qty',
+    'Status': 'status',
+    'Scanned Time': 'scanned_time',
+}
+
+# Rows fetched at a time by export_rows
+EXPORT_FETCH_SIZE = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY,
+    order_id TEXT NOT NULL DEFAULT '',
+    awb_id TEXT NOT NULL,
+    courier TEXT NOT NULL DEFAULT '',
+    sku TEXT NOT NULL DEFAULT '',
+    qty TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL DEFAULT 'Pending',
+    scanned_time TEXT NOT NULL DEFAULT '',
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_orders_awb ON orders (awb_id);
+CREATE INDEX IF NOT EXISTS idx_orders_status ON orders (status);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scan_batches (
+    id INTEGER PRIMARY KEY,
+    batch_id TEXT NOT NULL UNIQUE,
+    results TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS status_counts (
+    dimension TEXT NOT NULL,
+    key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (dimension, key, status)
+);
+"""
+
+# status_counts is kept current by triggers: dimension is 'all' (key ''),
+# 'courier' or 'sku', plus 'unexpected' (key courier, status Cancelled)
+# for rows recorded by scans of AWBs missing from the manifest. Bulk
+# imports drop the triggers and rebuild the table with one GROUP BY
+# instead of firing three upserts per inserted row.
+_COUNT_DELTA = """
+    INSERT INTO status_counts (dimension, key, status, n) VALUES ('all', '', {row}.status, {n})
+        ON CONFLICT (dimension, key, status) DO UPDATE SET n = n + {n};
+    INSERT INTO status_counts (dimension, key, status, n) VALUES ('courier', {row}.courier, {row}.status, {n})
+        ON CONFLICT (dimension, key, status) DO UPDATE SET n = n + {n};
+    INSERT INTO status_counts (dimension, key, status, n) VALUES ('sku', {row}.sku, {row}.status, {n})
+        ON CONFLICT (dimension, key, status) DO UPDATE SET n = n + {n};
+"""
+
+_UNEXPECTED = f"{{row}}.order_id = '{UNEXPECTED_ORDER_ID}' AND {{row}}.status = 'Cancelled'"
+
+_UNEXPECTED_DELTA = """
+    INSERT INTO status_counts (dimension, key, status, n) VALUES ('unexpected', {row}.courier, 'Cancelled', {n})
+        ON CONFLICT (dimension, key, status) DO UPDATE SET n = n + {n};
+"""
+
+# meta 'awb_generation' changes whenever a manifest AWB ID is added or
+# removed, so workers know when to rebuild their AwbIndex. Rows recorded
+# for unknown scans are not in the index and do not count.
+_AWB_GENERATION = """
+    INSERT INTO meta (key, value) VALUES ('awb_generation', 1)
+        ON CONFLICT (key) DO UPDATE SET value = value + 1;
+"""
+
+TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS orders_count_insert AFTER INSERT ON orders BEGIN"
+    + _COUNT_DELTA.format(row='NEW', n=1) + "END",
+    "CREATE TRIGGER IF NOT EXISTS orders_count_delete AFTER DELETE ON orders BEGIN"
+    + _COUNT_DELTA.format(row='OLD', n=-1) + "END",
+    "CREATE TRIGGER IF NOT EXISTS orders_count_update AFTER UPDATE OF status, courier, sku ON orders BEGIN"
+    + _COUNT_DELTA.format(row='OLD', n=-1) + _COUNT_DELTA.format(row='NEW', n=1) + "END",
+    "CREATE TRIGGER IF NOT EXISTS orders_unexpected_insert AFTER INSERT ON orders WHEN "
+    + _UNEXPECTED.format(row='NEW') + " BEGIN" + _UNEXPECTED_DELTA.format(row='NEW', n=1) + "END",
+    "CREATE TRIGGER IF NOT EXISTS orders_unexpected_delete AFTER DELETE ON orders WHEN "
+    + _UNEXPECTED.format(row='OLD') + " BEGIN" + _UNEXPECTED_DELTA.format(row='OLD', n=-1) + "END",
+    "CREATE TRIGGER IF NOT EXISTS orders_unexpected_update_old AFTER UPDATE OF status, courier, order_id ON orders "
+    "WHEN " + _UNEXPECTED.format(row='OLD') + " BEGIN" + _UNEXPECTED_DELTA.format(row='OLD', n=-1) + "END",
+    "CREATE TRIGGER IF NOT EXISTS orders_unexpected_update_new AFTER UPDATE OF status, courier, order_id ON orders "
+    "WHEN " + _UNEXPECTED.format(row='NEW') + " BEGIN" + _UNEXPECTED_DELTA.format(row='NEW', n=1) + "END",
+    "CREATE TRIGGER IF NOT EXISTS orders_awb_insert AFTER INSERT ON orders "
+    f"WHEN NEW.order_id != '{UNEXPECTED_ORDER_ID}' BEGIN" + _AWB_GENERATION + "END",
+    "CREATE TRIGGER IF NOT EXISTS orders_awb_delete AFTER DELETE ON orders "
+    f"WHEN OLD.order_id != '{UNEXPECTED_ORDER_ID}' BEGIN" + _AWB_GENERATION + "END",
+]
+
+DROP_TRIGGERS = [
+    'DROP TRIGGER IF EXISTS orders_count_insert',
+    'DROP TRIGGER IF EXISTS orders_count_delete',
+    'DROP TRIGGER IF EXISTS orders_count_update',
+    'DROP TRIGGER IF EXISTS orders_unexpected_insert',
+    'DROP TRIGGER IF EXISTS orders_unexpected_delete',
+    'DROP TRIGGER IF EXISTS orders_unexpected_update_old',
+    'DROP TRIGGER IF EXISTS orders_unexpected_update_new',
+    'DROP TRIGGER IF EXISTS orders_awb_insert',
+    'DROP TRIGGER IF EXISTS orders_awb_delete',
+]
+
+REBUILD_UNEXPECTED = [
+    "DELETE FROM status_counts WHERE dimension = 'unexpected'",
+    "INSERT INTO status_counts SELECT 'unexpected', courier, 'Cancelled', COUNT(*) FROM orders "
+    f"WHERE {_UNEXPECTED.format(row='orders')} GROUP BY courier",
+]
+
+REBUILD_COUNTS = [
+    'DELETE FROM status_counts',
+    "INSERT INTO status_counts SELECT 'all', '', status, COUNT(*) FROM orders GROUP BY status",
+    "INSERT INTO status_counts SELECT 'courier', courier, status, COUNT(*) FROM orders GROUP BY courier, status",
+    "INSERT INTO status_counts SELECT 'sku', sku, status, COUNT(*) FROM orders GROUP BY sku, status",
+] + REBUILD_UNEXPECTED[1:]
+
+
+class SqliteManifestStore:
+    """Manifest store with the same interface as ManifestStore, kept in SQLite.
+
+    The database runs in WAL mode so readers never block the writer, and
+    every state change is a single transaction, e.g. Pending -> Packed only
+    happens while the row is still Pending. Each worker process and thread
+    gets its own connection.
+
+    suggest() uses an awb_index.AwbIndex per process, rebuilt from the
+    orders table when meta's ``awb_generation`` shows that manifest AWB
+    IDs were added or removed; scans only change statuses and keep it.
+    """
+
+    def __init__(self, path, legacy_csv=None, courier_for=None):
+        self.path = path
+        self.courier_for = courier_for
+        self.export_file = os.path.splitext(path)[0] + '_export.csv'
+        self._local = threading.local()
+        self._awb_index = None
+        self._awb_generation = None
+        self._awb_index_lock = threading.Lock()
+        self._conn()
+        if legacy_csv and os.path.exists(legacy_csv) and not self.exists():
+            logger.info(f"Migrating {legacy_csv} into {path}")
+            self.import_csv(legacy_csv)
+            # Keep the original, but stop it from being imported again after a clear()
+            os.replace(legacy_csv, legacy_csv + '.migrated')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            with _Transaction(conn):
+                if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'orders_unexpected_insert'").fetchone():
+                    # Databases from before the unexpected-scan counts need them filled in once
+                    for statement in REBUILD_UNEXPECTED:
+                        conn.execute(statement)
+                for statement in TRIGGERS:
+                    conn.execute(statement)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _transaction(self):
+        return _Transaction(self._conn())
+
+    def _columns(self, conn=None):
+        row = (conn or self._conn()).execute("SELECT value FROM meta WHERE key = 'columns'").fetchone()
+        return json.loads(row[0]) if row else None
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+    def import_csv(self, csv_path):
+        """Replace the manifest with the contents of a CSV file (the migration path)"""
+        with open(csv_path, newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            columns = next(reader, [])
+            with self._transaction() as conn:
+                for statement in DROP_TRIGGERS:
+                    conn.execute(statement)
+                conn.execute('DELETE FROM orders')
+                # Batch results belong to the old manifest, as in ManifestStore
+                conn.execute('DELETE FROM scan_batches')
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('columns', ?)",
+                             (json.dumps(columns),))
+                if columns:
+                    conn.executemany(
+                        'INSERT INTO orders (order_id, awb_id, courier, sku, qty, status, scanned_time, extra) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                        (_to_sql(columns, row) for row in reader if row))
+                for statement in REBUILD_COUNTS + TRIGGERS:
+                    conn.execute(statement)
+                conn.execute(_AWB_GENERATION)
+        logger.info(f"Imported {len(self)} orders from {csv_path}")
+
+    # ------------------------------------------------------------------
+    # Public API (mirrors ManifestStore)
+    # ------------------------------------------------------------------
+    def exists(self):
+        return self._columns() is not None
+
+    def is_empty(self):
+        return self._columns() == []
+
+    def compact(self, threshold=1):
+        pass
+
+    def flush(self):
+        pass
+
+    def maintain(self, compact=True):
+        pass
+
+    def close(self):
+        """Close this thread's connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def export_path(self):
+        """Write a point-in-time CSV snapshot of the manifest and return its path"""
+        conn = self._conn()
+        tmp_path = self.export_file + '.tmp'
+        with _Transaction(conn, 'BEGIN'):
+            columns = self._columns(conn) or []
+            with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f, lineterminator='\n')
+                writer.writerow(columns)
+                for row in conn.execute('SELECT * FROM orders ORDER BY id'):
+                    writer.writerow(_from_sql(columns, row))
+        os.replace(tmp_path, self.export_file)
+        return self.export_file
+
+    def clear(self):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM orders')
+            conn.execute('DELETE FROM scan_batches')
+            conn.execute("DELETE FROM meta WHERE key = 'columns'")
+
+    def replace(self, df):
+        """Swap in a freshly uploaded manifest DataFrame"""
+        tmp_path = self.path + '.upload.csv'
+        df.to_csv(tmp_path, index=False)
+        try:
+            self.import_csv(tmp_path)
+        finally:
+            os.remove(tmp_path)
+
+    def merge(self, df):
+        """Same contract as ManifestStore.merge, in one transaction"""
+        import pandas as pd
+        from manifest_merge import merge_orders
+
+        with self._transaction() as conn:
+            columns = self._columns(conn)
+            if not columns:
+                raise ValueError('The orders file is empty')
+            current = pd.read_sql_query(
+                'SELECT awb_id AS "AWB ID", order_id AS "Order ID", courier AS "Courier", '
+                'sku AS "SKU", qty AS "Qty" FROM orders', conn)
+            new_rows, report = merge_orders(current, df)
+            values = new_rows.reindex(columns=columns).fillna('').astype(str).values.tolist()
+            conn.executemany(
+                'INSERT INTO orders (order_id, awb_id, courier, sku, qty, status, scanned_time, extra) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (_to_sql(columns, row) for row in values))
+            return report
+
+    def __len__(self):
+        return self._conn().execute('SELECT COUNT(*) FROM orders').fetchone()[0]
+
+    def get(self, awb_id):
+        conn = self._conn()
+        row = conn.execute('SELECT * FROM orders WHERE awb_id = ? ORDER BY id LIMIT 1',
+                           (str(awb_id).strip(),)).fetchone()
+        if row is None:
+            return None
+        columns = self._columns(conn) or COLUMNS
+        return dict(zip(columns, _from_sql(columns, row)))
+
+    def suggest(self, awb_id, limit=SUGGEST_LIMIT):
+        """Same contract as ManifestStore.suggest"""
+        conn = self._conn()
+        with _Transaction(conn, 'BEGIN'):
+            row = conn.execute("SELECT value FROM meta WHERE key = 'awb_generation'").fetchone()
+            generation = row[0] if row else None
+            with self._awb_index_lock:
+                if self._awb_index is None or generation != self._awb_generation:
+                    awbs = (awb for awb, in conn.execute(
+                        'SELECT awb_id FROM orders WHERE order_id != ? ORDER BY awb_id', (UNEXPECTED_ORDER_ID,)))
+                    if self._awb_index is None:
+                        self._awb_index = AwbIndex(awbs)
+                    else:
+                        self._awb_index.reset(awbs)
+                    self._awb_generation = generation
+                matches = self._awb_index.suggest(str(awb_id).strip(), limit)
+            if not matches:
+                return []
+            # ORDER BY id DESC leaves each AWB's first row in the dict, as get() returns
+            details = {awb: (status, courier) for awb, status, courier in conn.execute(
+                f"SELECT awb_id, status, courier FROM orders WHERE awb_id IN ({', '.join('?' * len(matches))}) "
+                "ORDER BY id DESC", [awb for awb, _ in matches])}
+        return [{'awb_id': awb, 'match': match, 'status': details[awb][0], 'courier': details[awb][1]}
+                for awb, match in matches if awb in details]
+
+    def _scan_one(self, conn, awb_id, scanned_time):
+        row = conn.execute('SELECT status FROM orders WHERE awb_id = ? ORDER BY id LIMIT 1',
+                           (awb_id,)).fetchone()
+        if row is not None:
+            if row[0] == 'Packed':
+                return 'already_packed'
+            if row[0] == 'Cancelled':
+                return 'cancelled'
+            conn.execute("UPDATE orders SET status = 'Packed', scanned_time = ? "
+                         "WHERE awb_id = ? AND status NOT IN ('Packed', 'Cancelled')",
+                         (scanned_time, awb_id))
+            return 'packed'
+        courier = (self.courier_for(awb_id) if self.courier_for else None) or 'Unknown'
+        conn.execute("INSERT INTO orders (order_id, awb_id, courier, sku, qty, status, scanned_time) "
+                     "VALUES (?, ?, ?, 'Unknown', '1', 'Cancelled', ?)",
+                     (UNEXPECTED_ORDER_ID, awb_id, courier, scanned_time))
+        return 'unknown'
+
+    def scan(self, awb_id, scanned_time):
+        """Same contract as ManifestStore.scan, as one IMMEDIATE transaction"""
+        with self._transaction() as conn:
+            if not self._columns(conn):
+                raise ValueError('The orders file is empty')
+            return self._scan_one(conn, str(awb_id).strip(), scanned_time)
+
+    def scan_batch(self, items, batch_id=None):
+        """Same contract as ManifestStore.scan_batch, as one IMMEDIATE transaction"""
+        with self._transaction() as conn:
+            if not self._columns(conn):
+                raise ValueError('The orders file is empty')
+            return self._scan_batch(conn, items, batch_id)
+
+    def _scan_batch(self, conn, items, batch_id):
+        if batch_id:
+            row = conn.execute('SELECT results FROM scan_batches WHERE batch_id = ?', (batch_id,)).fetchone()
+            if row:
+                return json.loads(row[0]), True
+        results = [self._scan_one(conn, str(awb_id).strip(), scanned_time) for awb_id, scanned_time in items]
+        if batch_id:
+            cursor = conn.execute('INSERT INTO scan_batches (batch_id, results) VALUES (?, ?)',
+                                  (batch_id, json.dumps(results)))
+            conn.execute('DELETE FROM scan_batches WHERE id <= ?', (cursor.lastrowid - MAX_REMEMBERED_BATCHES,))
+        return results, False
+
+    def delete(self, awb_id):
+        with self._transaction() as conn:
+            return conn.execute('DELETE FROM orders WHERE awb_id = ?', (str(awb_id).strip(),)).rowcount
+
+    def write_many(self, ops):
+        """Same contract as ManifestStore.write_many, as one IMMEDIATE transaction"""
+        with self._transaction() as conn:
+            has_manifest = bool(self._columns(conn))
+            outcomes = []
+            for op in ops:
+                if op[0] == 'delete':
+                    outcomes.append(conn.execute('DELETE FROM orders WHERE awb_id = ?',
+                                                 (str(op[1]).strip(),)).rowcount)
+                elif op[0] not in ('scan', 'batch'):
+                    outcomes.append(ValueError(f"Unknown manifest write {op[0]!r}"))
+                elif not has_manifest:
+                    outcomes.append(ValueError('The orders file is empty'))
+                elif op[0] == 'scan':
+                    outcomes.append(self._scan_one(conn, str(op[1]).strip(), op[2]))
+                else:
+                    outcomes.append(self._scan_batch(conn, op[1], op[2]))
+            return outcomes
+
+    def counts(self):
+        rows = self._conn().execute("SELECT status, n FROM status_counts WHERE dimension = 'all'")
+        return summarize(Counter(dict(rows)))
+
+    def _load_counters(self, conn):
+        counters = StatusCounters()
+        tables = {'courier': counters.by_courier, 'sku': counters.by_sku}
+        for dimension, key, status, n in conn.execute('SELECT * FROM status_counts WHERE n != 0'):
+            if dimension == 'all':
+                counters.total[status] += n
+            elif dimension == 'unexpected':
+                counters.add_unexpected(key, n)
+            else:
+                tables[dimension][key][status] += n
+        return counters
+
+    def breakdown(self):
+        return self._load_counters(self._conn()).breakdown()
+
+    def verify_counts(self):
+        """Recount from the orders table and compare with status_counts"""
+        with self._transaction() as conn:
+            maintained = self._load_counters(conn)
+            recounted = StatusCounters.recount(conn.execute(
+                f"SELECT courier, sku, status, {_UNEXPECTED.format(row='orders')} FROM orders"))
+            result = verify_counters(maintained, recounted)
+            if not result['consistent']:
+                logger.warning(f"status_counts drifted in {self.path}; rebuilding")
+                for statement in REBUILD_COUNTS:
+                    conn.execute(statement)
+            return result
+
+    def reconciliation(self):
+        """Same contract as ManifestStore.reconciliation, from status_counts and the status index"""
+        with _Transaction(self._conn(), 'BEGIN') as conn:
+            counters = self._load_counters(conn)
+            missing = defaultdict(list)
+            for courier, awb_id in conn.execute("SELECT courier, awb_id FROM orders WHERE status = 'Pending'"):
+                missing[courier].append(awb_id)
+        return counters.reconciliation(missing)
+
+    def query(self, search=None, status=None, order_by=None, descending=False, start=0, length=None):
+        """Same contract as ManifestStore.query, as SQL with LIMIT/OFFSET"""
+        where = []
+        params = []
+        if status:
+            where.append('status = ?')
+            params.append(status)
+        if search:
+            pattern = '%' + search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            where.append('(' + ' OR '.join(f"{col} LIKE ? ESCAPE '\\'" for col in SQL_COLUMNS.values()) + ')')
+            params.extend([pattern] * len(SQL_COLUMNS))
+        where_sql = (' WHERE ' + ' AND '.join(where)) if where else ''
+        order_sql = ' ORDER BY id'
+        if order_by in SORTABLE_COLUMNS:
+            col = SQL_COLUMNS[order_by]
+            if order_by == 'Qty':
+                col = f'CAST({col} AS INTEGER)'
+            order_sql = f" ORDER BY {col} {'DESC' if descending else 'ASC'}, id"
+        if length is None or length < 0:
+            length = -1  # no limit in SQLite; the offset still applies
+        conn = self._conn()
+        with _Transaction(conn, 'BEGIN'):
+            columns = self._columns(conn) or []
+            total = conn.execute('SELECT COUNT(*) FROM orders').fetchone()[0]
+            filtered = conn.execute('SELECT COUNT(*) FROM orders' + where_sql, params).fetchone()[0]
+            rows = conn.execute('SELECT * FROM orders' + where_sql + order_sql + ' LIMIT ? OFFSET ?',
+                                params + [length, start])
+            return total, filtered, [dict(zip(columns, _from_sql(columns, row))) for row in rows]
+
+    def export_rows(self, statuses=None, couriers=None, since=None, until=None):
+        """Same contract as ManifestStore.export_rows.
+
+        The rows come from a read transaction on a dedicated connection,
+        which WAL mode keeps at a consistent snapshot until the last row
+        is read; they are fetched EXPORT_FETCH_SIZE at a time.
+        """
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        try:
+            conn.execute('BEGIN')
+            columns = self._columns(conn) or []
+            where = []
+            params = []
+            if statuses:
+                where.append(f"status IN ({', '.join('?' * len(statuses))})")
+                params.extend(statuses)
+            if couriers:
+                where.append(f"lower(courier) IN ({', '.join('?' * len(couriers))})")
+                params.extend(couriers)
+            if since:
+                where.append("scanned_time != '' AND scanned_time >= ?")
+                params.append(since)
+            if until:
+                where.append("scanned_time != '' AND scanned_time <= ?")
+                params.append(until)
+            sql = 'SELECT * FROM orders' + (' WHERE ' + ' AND '.join(where) if where else '') + ' ORDER BY id'
+            cursor = conn.execute(sql, params)
+        except Exception:
+            conn.close()
+            raise
+        return columns, _stream_rows(conn, cursor, columns)
+
+    def records(self):
+        conn = self._conn()
+        with _Transaction(conn, 'BEGIN'):
+            columns = self._columns(conn) or []
+            return [dict(zip(columns, _from_sql(columns, row)))
+                    for row in conn.execute('SELECT * FROM orders ORDER BY id')]
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK on an autocommit connection"""
+
+    def __init__(self, conn, begin='BEGIN IMMEDIATE'):
+        self.conn = conn
+        self.begin = begin
+
+    def __enter__(self):
+        with METRICS.stage('lock'):
+            self.conn.execute(self.begin)
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        with METRICS.stage('write'):
+            self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+
+
+def _to_sql(columns, row):
+    values = dict(zip(columns, row))
+    extra = {name: value for name, value in values.items() if name not in SQL_COLUMNS}
+    return (
+        values.get('Order ID', ''),
+        values.get('AWB ID', '').strip(),
+        values.get('Courier', ''),
+        values.get('SKU', ''),
+        values.get('Qty', ''),
+        values.get('Status', 'Pending'),
+        values.get('Scanned Time', ''),
+        json.dumps(extra) if extra else None,
+    )
+
+
+def _stream_rows(conn, cursor, columns):
+    """Yield converted rows in fetchmany batches, closing the connection at the end"""
+    try:
+        while True:
+            batch = cursor.fetchmany(EXPORT_FETCH_SIZE)
+            if not batch:
+                break
+            for row in batch:
+                yield _from_sql(columns, row)
+    finally:
+        conn.close()
+
+
+def _from_sql(columns, row):
+    # row is (id, order_id, awb_id, courier, sku, qty, status, scanned_time, extra)
+    values = dict(zip(SQL_COLUMNS, row[1:8]))
+    if row[8]:
+        values.update(json.loads(row[8]))
+    return [values.get(name, '') for name in columns]
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('usage: python manifest_sqlite.py <orders.csv> <orders.db>')
+        sys.exit(1)
+    logging.basicConfig(level=logging.INFO)
+    SqliteManifestStore(sys.argv[2]).import_csv(sys.argv[1])
@@ -0,0 +1,866 @@
+"""In-memory, hash-indexed manifest store backed by orders.csv"""
+import csv
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+from operator import and_
+from contextlib import contextmanager
+
+from awb_index import SUGGEST_LIMIT, AwbIndex
+from manifest_columns import ManifestTable
+from metrics import METRICS
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines have no flock
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ['Order ID', 'AWB ID', 'Courier', 'SKU', 'Qty', 'Status', 'Scanned Time']
+
+# Columns the orders table can be sorted by
+SORTABLE_COLUMNS = COLUMNS
+
+# Number of journal records after which the journal is folded into the CSV
+COMPACT_THRESHOLD = 500
+# How often the background thread looks for journal work, in seconds
+COMPACT_INTERVAL = 5.0
+# Journal appends are fsynced once this many are pending or this much time has passed
+FSYNC_BATCH = 50
+FSYNC_INTERVAL = 0.2
+# Results of this many recent scan batches are remembered for idempotent retries
+MAX_REMEMBERED_BATCHES = 1000
+# Order ID of the Cancelled rows recorded for scanned AWBs missing from the manifest
+UNEXPECTED_ORDER_ID = 'Unknown'
+
+
+class StatusCounters:
+    """Order counts per status, overall and per courier / per SKU.
+
+    Updated on every status transition so stats never need a pass over the
+    manifest; ``recount`` rebuilds them from scratch for consistency checks.
+    ``unexpected`` counts, per courier, the Cancelled rows recorded for
+    scanned AWBs that were not in the manifest (already part of the
+    Cancelled counts).
+    """
+
+    def __init__(self):
+        self.total = Counter()
+        self.by_courier = defaultdict(Counter)
+        self.by_sku = defaultdict(Counter)
+        self.unexpected = Counter()
+
+    def add(self, courier, sku, status, n=1):
+        self.total[status] += n
+        self.by_courier[courier][status] += n
+        self.by_sku[sku][status] += n
+
+    def remove(self, courier, sku, status, n=1):
+        self.add(courier, sku, status, -n)
+        for table, key in ((self.by_courier, courier), (self.by_sku, sku)):
+            if not any(table[key].values()):
+                del table[key]
+
+    def move(self, courier, sku, old_status, new_status, n=1):
+        self.total[old_status] -= n
+        self.total[new_status] += n
+        for counter in (self.by_courier[courier], self.by_sku[sku]):
+            counter[old_status] -= n
+            counter[new_status] += n
+
+    def add_unexpected(self, courier, n=1):
+        self.unexpected[courier] += n
+        if not self.unexpected[courier]:
+            del self.unexpected[courier]
+
+    @classmethod
+    def recount(cls, rows):
+        """Build counters from (courier, sku, status, unexpected) tuples"""
+        counters = cls()
+        for courier, sku, status, unexpected in rows:
+            counters.add(courier, sku, status)
+            if unexpected:
+                counters.add_unexpected(courier)
+        return counters
+
+    def summary(self):
+        return summarize(self.total)
+
+    def breakdown(self):
+        return {
+            'by_courier': {key: summarize(c) for key, c in sorted(self.by_courier.items())},
+            'by_sku': {key: summarize(c) for key, c in sorted(self.by_sku.items())},
+        }
+
+    def as_dict(self):
+        return dict(self.breakdown(), unexpected=dict(sorted(self.unexpected.items())), **self.summary())
+
+    def reconciliation(self, missing):
+        """Pickup handover numbers per courier.
+
+        ``cancelled`` only counts cancellations that came with the
+        manifest; ``unexpected`` counts scanned AWBs that were not in it.
+        ``missing`` maps a courier to its AWBs that are still Pending.
+        """
+        couriers = []
+        for courier in sorted(set(self.by_courier) | set(self.unexpected) | set(missing)):
+            counts = self.by_courier.get(courier, Counter())
+            unexpected = self.unexpected.get(courier, 0)
+            couriers.append({
+                'courier': courier,
+                'packed': counts['Packed'],
+                'pending': counts['Pending'],
+                'cancelled': counts['Cancelled'] - unexpected,
+                'unexpected': unexpected,
+                'missing': sorted(missing.get(courier, ())),
+            })
+        totals = {key: sum(entry[key] for entry in couriers)
+                  for key in ('packed', 'pending', 'cancelled', 'unexpected')}
+        return {'couriers': couriers, 'totals': totals}
+
+
+def summarize(counter):
+    """Map a status Counter onto the packed/pending/cancelled/total shape the API uses"""
+    return {
+        'packed': counter['Packed'],
+        'pending': counter['Pending'],
+        'cancelled': counter['Cancelled'],
+        'total': sum(counter.values()),
+    }
+
+
+def verify_counters(maintained, recounted):
+    """Compare maintained counters against a fresh recount"""
+    expected = recounted.as_dict()
+    actual = maintained.as_dict()
+    return {'consistent': expected == actual, 'maintained': actual, 'recounted': expected}
+
+
+class ManifestStore:
+    """Keeps the manifest rows in memory with an AWB ID -> row index.
+
+    orders.csv is the last snapshot; every change after that is appended as
+    a ``scan``, ``cancel`` or ``delete`` event to ``orders.csv.journal``
+    instead of rewriting the whole file. Current state is the snapshot with
+    the journal replayed over it. Other gunicorn workers notice the journal
+    growing and replay only the new tail, and a background thread folds the
+    journal into a new snapshot once it gets long.
+
+    Events are applied by state ("mark Packed", "add as Cancelled unless
+    present", "remove"), so replaying a journal over a snapshot that already
+    contains it gives the same manifest. That keeps a crash between writing
+    the snapshot and removing the journal harmless.
+
+    Rows live in a manifest_columns.ManifestTable: one column per field,
+    with Courier, SKU, Status and the other repetitive fields
+    dictionary-encoded. With ``columnar_snapshot`` (needs pyarrow) every
+    snapshot is also written as ``orders.csv.feather``, which later loads
+    skip the CSV parse for as long as orders.csv is unchanged.
+
+    An awb_index.AwbIndex over the manifest's AWB IDs answers suggest()
+    for damaged reads. It is built on the first lookup and then kept in
+    step with merges and deletes, and across reloads, by applying only what
+    changed.
+    """
+
+    def __init__(self, path, compact_threshold=COMPACT_THRESHOLD, compact_interval=COMPACT_INTERVAL,
+                 fsync_batch=FSYNC_BATCH, fsync_interval=FSYNC_INTERVAL, columnar_snapshot=False,
+                 courier_for=None):
+        self.path = path
+        self.journal_path = path + '.journal'
+        self.lock_path = path + '.lock'
+        self.snapshot_path = path + '.feather'
+        self.columnar_snapshot = columnar_snapshot
+        self.compact_threshold = compact_threshold
+        self.compact_interval = compact_interval
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        # Attributes an AWB missing from the manifest to a courier (e.g. AwbPatternRegistry.courier_for)
+        self.courier_for = courier_for
+        self._lock = threading.Lock()
+        self._lock_fd = None
+        self._lock_pid = None
+        self._worker_pid = None
+        self._unsynced = 0
+        self._last_fsync = time.monotonic()
+        self._reset()
+
+    def _reset(self):
+        self.columns = []
+        self._table = ManifestTable([])
+        self._index = {}
+        self._awb_index = None
+        self._live = 0
+        self.counters = StatusCounters()
+        self._snapshot_sig = None
+        self._journal_offset = 0
+        self._journal_entries = 0
+        self._batches = OrderedDict()
+
+    # ------------------------------------------------------------------
+    # Locking and cross-worker coherence
+    # ------------------------------------------------------------------
+    def _file_lock(self):
+        """Return a lock fd private to this process (flock is shared across fork)"""
+        if fcntl is None:
+            return None
+        if self._lock_fd is None or self._lock_pid != os.getpid():
+            directory = os.path.dirname(self.lock_path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            self._lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._lock_pid = os.getpid()
+        return self._lock_fd
+
+    @contextmanager
+    def _locked(self, exclusive=False):
+        self._ensure_maintenance()
+        started = time.perf_counter()
+        with self._lock:
+            fd = self._file_lock()
+            if fd is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            METRICS.stage_time('lock', time.perf_counter() - started)
+            try:
+                self._sync()
+                yield
+            finally:
+                if fd is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _stat_snapshot(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _sync(self):
+        """Bring the in-memory view up to date with what other workers wrote"""
+        sig = self._stat_snapshot()
+        if sig != self._snapshot_sig:
+            with METRICS.stage('load'):
+                self._load()
+            return
+        try:
+            journal_size = os.path.getsize(self.journal_path)
+        except FileNotFoundError:
+            journal_size = 0
+        if journal_size < self._journal_offset:
+            with METRICS.stage('load'):
+                self._load()
+        elif journal_size > self._journal_offset:
+            with METRICS.stage('replay'):
+                self._replay_journal()
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+    def _load(self):
+        awb_index = self._awb_index
+        self._reset()
+        sig = self._stat_snapshot()
+        if sig is None:
+            return
+        if not (self.columnar_snapshot and self._load_columnar(sig)):
+            with open(self.path, newline='', encoding='utf-8') as f:
+                reader = csv.reader(f)
+                self.columns = next(reader, [])
+                rows = [self._pad(row) for row in reader if row] if self.columns else []
+            self._table = ManifestTable.from_rows(self.columns, rows)
+            if self.columns:
+                awbs = self._table.data[self._table.col['AWB ID']]
+                awbs[:] = [awb.strip() for awb in awbs]
+                self._index_table()
+        self._snapshot_sig = sig
+        self._replay_journal()
+        if awb_index is not None:
+            # Most reloads follow a compaction that changed no AWB IDs
+            awb_index.reset(self._manifest_awbs())
+            self._awb_index = awb_index
+        logger.info(f"Loaded {self._live} orders from {self.path}")
+
+    def _load_columnar(self, sig):
+        """Load orders.csv.feather if it was written from this exact orders.csv"""
+        try:
+            import pyarrow.feather as feather
+            table = feather.read_table(self.snapshot_path)
+        except ImportError:
+            self.columnar_snapshot = False
+            logger.warning("pyarrow is not installed; columnar manifest snapshots are disabled")
+            return False
+        except (OSError, ValueError):
+            return False
+        if (table.schema.metadata or {}).get(b'csv_signature') != json.dumps(sig).encode():
+            return False
+        self._table = ManifestTable.from_arrow(table)
+        self.columns = self._table.columns
+        self._index_table()
+        return True
+
+    def _index_table(self):
+        """Build the AWB index and the counters for a freshly loaded table"""
+        index = self._index
+        for pos, awb in enumerate(self._table.data[self._table.col['AWB ID']]):
+            positions = index.get(awb)
+            if positions is None:
+                index[awb] = [pos]
+            else:
+                positions.append(pos)
+        self._live = len(self._table)
+        self._count_all(self.counters)
+
+    def _count_all(self, counters):
+        """Add every live row to ``counters``"""
+        table = self._table
+        for dims, n in table.group_counts(self._dim_columns()).items():
+            counters.add(*self._fill_dims(dims), n=n)
+        if 'Order ID' in table.col and 'Status' in table.col:
+            mask = bytes(map(and_, table.equal_mask('Order ID', UNEXPECTED_ORDER_ID),
+                             table.equal_mask('Status', 'Cancelled')))
+            for pos in table.positions(mask):
+                counters.add_unexpected(self._dims(pos)[0])
+
+    def _is_unexpected(self, pos):
+        return ('Order ID' in self._table.col and self._table.value(pos, 'Order ID') == UNEXPECTED_ORDER_ID
+                and self._table.value(pos, 'Status') == 'Cancelled')
+
+    def _manifest_awbs(self):
+        """AWB IDs of the manifest's orders, leaving out rows recorded for unknown scans"""
+        table = self._table
+        if 'Order ID' not in table.col:
+            return self._index.keys()
+        awbs = table.data[table.col['AWB ID']]
+        unknown = {awbs[pos] for pos in table.positions(table.equal_mask('Order ID', UNEXPECTED_ORDER_ID))}
+        return (awb for awb in self._index if awb not in unknown)
+
+    def _save_columnar(self):
+        """Write the Feather snapshot next to a freshly written orders.csv"""
+        try:
+            import pyarrow.feather as feather
+        except ImportError:
+            self.columnar_snapshot = False
+            logger.warning("pyarrow is not installed; columnar manifest snapshots are disabled")
+            return
+        tmp_path = self.snapshot_path + '.tmp'
+        metadata = {'csv_signature': json.dumps(self._stat_snapshot())}
+        feather.write_feather(self._table.to_arrow(metadata), tmp_path, compression='uncompressed')
+        os.replace(tmp_path, self.snapshot_path)
+
+    def _pad(self, row):
+        width = len(self.columns)
+        if len(row) < width:
+            row = row + [''] * (width - len(row))
+        return row
+
+    def _append_row(self, row):
+        awb_col = self._table.col['AWB ID']
+        row[awb_col] = row[awb_col].strip()
+        pos = self._table.append(row)
+        self._index.setdefault(row[awb_col], []).append(pos)
+        self._live += 1
+        self.counters.add(*self._dims(pos))
+        if self._is_unexpected(pos):
+            self.counters.add_unexpected(self._dims(pos)[0])
+        if self._awb_index is not None and not ('Order ID' in self._table.col and
+                                                row[self._table.col['Order ID']] == UNEXPECTED_ORDER_ID):
+            self._awb_index.add(row[awb_col])
+
+    def _dim_columns(self):
+        return [name for name in ('Courier', 'SKU', 'Status') if name in self._table.col]
+
+    def _fill_dims(self, values):
+        """(courier, sku, status) from the values of _dim_columns(), 'Unknown' for missing columns"""
+        values = dict(zip(self._dim_columns(), values))
+        return values.get('Courier', 'Unknown'), values.get('SKU', 'Unknown'), values['Status']
+
+    def _dims(self, pos):
+        """(courier, sku, status) of a row, the keys the counters are kept by"""
+        return self._fill_dims([self._table.value(pos, name) for name in self._dim_columns()])
+
+    def _replay_journal(self):
+        try:
+            with open(self.journal_path, 'rb') as f:
+                f.seek(self._journal_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        consumed = 0
+        for line in data.splitlines(keepends=True):
+            if not line.endswith(b'\n'):
+                break  # torn tail: still being written, or left by a crash
+            consumed += len(line)
+            try:
+                event = json.loads(line)
+                self._apply(event)
+                if event['event'] != 'batch':
+                    self._journal_entries += 1
+            except (ValueError, KeyError) as e:
+                logger.warning(f"Skipping unreadable journal record in {self.journal_path}: {e}")
+        self._journal_offset += consumed
+
+    def _apply(self, event):
+        kind = event['event']
+        if kind == 'batch':
+            self._batches[event['batch_id']] = event['results']
+            while len(self._batches) > MAX_REMEMBERED_BATCHES:
+                self._batches.popitem(last=False)
+            return
+        awb = event['awb']
+        if kind == 'scan':
+            for pos in self._index.get(awb, ()):
+                courier, sku, status = self._dims(pos)
+                self.counters.move(courier, sku, status, 'Packed')
+                self._table.set(pos, 'Status', 'Packed')
+                self._table.set(pos, 'Scanned Time', event['time'])
+        elif kind == 'cancel':
+            if awb not in self._index:
+                row = {
+                    'Order ID': UNEXPECTED_ORDER_ID,
+                    'AWB ID': awb,
+                    'Courier': event.get('courier') or 'Unknown',
+                    'SKU': 'Unknown',
+                    'Qty': '1',
+                    'Status': 'Cancelled',
+                    'Scanned Time': event['time'],
+                }
+                self._append_row([row.get(name, '') for name in self.columns])
+        elif kind == 'delete':
+            if self._awb_index is not None:
+                self._awb_index.discard(awb)
+            for pos in self._index.pop(awb, ()):
+                if self._is_unexpected(pos):
+                    self.counters.add_unexpected(self._dims(pos)[0], -1)
+                self.counters.remove(*self._dims(pos))
+                self._table.remove(pos)
+                self._live -= 1
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+    def _append_journal(self, events):
+        """Append already-applied events to the journal, fsyncing in batches"""
+        with METRICS.stage('write'), open(self.journal_path, 'ab') as f:
+            if f.tell() > self._journal_offset:
+                # Drop a torn record left behind by a crashed writer
+                f.truncate(self._journal_offset)
+                f.seek(self._journal_offset)
+            f.write(b''.join(json.dumps(event).encode('utf-8') + b'\n' for event in events))
+            f.flush()
+            self._journal_offset = f.tell()
+            self._unsynced += len(events)
+            if (self._unsynced >= self.fsync_batch or
+                    time.monotonic() - self._last_fsync >= self.fsync_interval):
+                with METRICS.stage('fsync'):
+                    os.fsync(f.fileno())
+                self._mark_synced()
+        self._journal_entries += sum(1 for event in events if event['event'] != 'batch')
+
+    def _mark_synced(self):
+        self._unsynced = 0
+        self._last_fsync = time.monotonic()
+
+    def _fsync_journal(self):
+        try:
+            with open(self.journal_path, 'ab') as f:
+                os.fsync(f.fileno())
+        except FileNotFoundError:
+            pass
+        self._mark_synced()
+
+    def _compact(self):
+        """Fold the journal into a new orders.csv snapshot.
+
+        The snapshot is written to a temp file, fsynced and renamed over
+        orders.csv, so a crash leaves either the old or the new snapshot.
+        """
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f, lineterminator='\n')
+            writer.writerow(self.columns)
+            writer.writerows(self._table.rows())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        _fsync_dir(self.path)
+        if self.columnar_snapshot:
+            self._save_columnar()
+        if self._batches:
+            # Batch results only matter for retries; carry them into the new journal
+            with open(self.journal_path + '.tmp', 'wb') as f:
+                f.write(b''.join(json.dumps({'event': 'batch', 'batch_id': batch_id, 'results': results})
+                                 .encode('utf-8') + b'\n' for batch_id, results in self._batches.items()))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(self.journal_path + '.tmp', self.journal_path)
+        elif os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._mark_synced()
+        self._load()
+        logger.info(f"Compacted manifest journal into {self.path}")
+
+    # ------------------------------------------------------------------
+    # Background maintenance
+    # ------------------------------------------------------------------
+    def _ensure_maintenance(self):
+        """Start the fsync/compaction thread once per process (threads do not survive fork)"""
+        if self._worker_pid == os.getpid() or not self.compact_interval:
+            return
+        self._worker_pid = os.getpid()
+        thread = threading.Thread(target=self._maintenance_loop, name='manifest-journal', daemon=True)
+        thread.start()
+
+    def _maintenance_loop(self):
+        pid = os.getpid()
+        last_compact_check = time.monotonic()
+        while self._worker_pid == pid:
+            time.sleep(min(self.fsync_interval, self.compact_interval))
+            try:
+                compact = time.monotonic() - last_compact_check >= self.compact_interval
+                if compact:
+                    last_compact_check = time.monotonic()
+                self.maintain(compact=compact)
+            except Exception as e:
+                logger.error(f"Manifest journal maintenance failed: {e}")
+
+    def maintain(self, compact=True):
+        """Fsync pending journal appends and, if ``compact``, fold a long journal.
+
+        Run periodically by the maintenance thread, or by whoever owns the
+        store's writes when that thread is disabled (``compact_interval=0``).
+        """
+        if self._unsynced:
+            with self._lock:
+                if self._unsynced:
+                    self._fsync_journal()
+        if compact:
+            self.compact(threshold=self.compact_threshold)
+
+    def close(self):
+        """Fsync pending journal appends and stop the maintenance thread"""
+        self.maintain(compact=False)
+        self._worker_pid = None
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def compact(self, threshold=1):
+        """Fold the journal into orders.csv if it holds at least ``threshold`` events"""
+        with self._locked(exclusive=True):
+            if self._journal_entries >= threshold:
+                self._compact()
+
+    def flush(self):
+        """Make orders.csv current, e.g. before exporting it"""
+        self.compact()
+
+    def export_path(self):
+        """Return the path of a CSV that reflects every event so far"""
+        self.flush()
+        return self.path
+
+    def clear(self):
+        """Remove the manifest and its journal"""
+        with self._locked(exclusive=True):
+            for path in (self.journal_path, self.path, self.snapshot_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._reset()
+
+    def replace(self, df):
+        """Swap in a freshly uploaded manifest DataFrame.
+
+        The old journal is removed before the new snapshot is renamed into
+        place: its events belong to the old manifest, and a crash between
+        the two steps must not leave them to be replayed over the new one.
+        """
+        with self._locked(exclusive=True):
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+                df.to_csv(f, index=False)
+                f.flush()
+                os.fsync(f.fileno())
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+                _fsync_dir(self.journal_path)
+            os.replace(tmp_path, self.path)
+            _fsync_dir(self.path)
+            self._load()
+            if self.columnar_snapshot:
+                self._save_columnar()
+
+    def merge(self, df):
+        """Add the orders in ``df`` whose AWB IDs are new; existing rows keep their status.
+
+        Returns the ``added`` / ``kept`` / ``conflicting`` report from
+        manifest_merge.merge_orders. The result is written as one new snapshot.
+        """
+        import pandas as pd
+        from manifest_merge import merge_orders
+
+        with self._locked(exclusive=True):
+            if not self.columns:
+                raise ValueError('The orders file is empty')
+            current = pd.DataFrame(list(self._table.rows()), columns=self.columns)
+            new_rows, report = merge_orders(current, df)
+            values = new_rows.reindex(columns=self.columns).fillna('').astype(str).values.tolist()
+            for row in values:
+                self._append_row(row)
+            if values:
+                self._compact()
+            return report
+
+    def __len__(self):
+        with self._locked():
+            return self._live
+
+    def is_empty(self):
+        """True when orders.csv exists but has no header (a zero-byte file)"""
+        with self._locked():
+            return self._snapshot_sig is not None and not self.columns
+
+    def get(self, awb_id):
+        """Return the first row for an AWB ID as a dict, or None"""
+        with self._locked():
+            positions = self._index.get(str(awb_id).strip())
+            if not positions:
+                return None
+            return dict(zip(self.columns, self._table.row(positions[0])))
+
+    def suggest(self, awb_id, limit=SUGGEST_LIMIT):
+        """Manifest AWB IDs a damaged read probably meant; see AwbIndex.suggest.
+
+        Returns dicts with the ``awb_id``, its ``match`` kind and the
+        order's ``status`` and ``courier``.
+        """
+        with self._locked():
+            if self._awb_index is None:
+                self._awb_index = AwbIndex(self._manifest_awbs())
+            suggestions = []
+            for awb, match in self._awb_index.suggest(str(awb_id).strip(), limit):
+                pos = self._index[awb][0]
+                courier, _, status = self._dims(pos)
+                suggestions.append({'awb_id': awb, 'match': match, 'status': status, 'courier': courier})
+            return suggestions
+
+    def _scan_applied(self, items, batch_id=None):
+        """Apply scans in memory; returns (results, replayed, events to journal)"""
+        if not self.columns:
+            raise ValueError('The orders file is empty')
+        if batch_id and batch_id in self._batches:
+            return self._batches[batch_id], True, []
+        events = []
+        results = []
+        for awb_id, scanned_time in items:
+            result, event = self._scan_one(str(awb_id).strip(), scanned_time)
+            if event:
+                # Apply now so a repeated AWB later in the batch sees it
+                self._apply(event)
+                events.append(event)
+            results.append(result)
+        if batch_id:
+            event = {'event': 'batch', 'batch_id': batch_id, 'results': results}
+            self._apply(event)
+            events.append(event)
+        return results, False, events
+
+    def _delete_applied(self, awb_id):
+        """Apply a delete in memory; returns (rows removed, events to journal)"""
+        removed = len(self._index.get(awb_id, ()))
+        if not removed:
+            return 0, []
+        event = {'event': 'delete', 'awb': awb_id}
+        self._apply(event)
+        return removed, [event]
+
+    def _scan_one(self, awb_id, scanned_time):
+        """Decide the outcome of one scan; returns (result, event to write or None)"""
+        positions = self._index.get(awb_id)
+        if positions:
+            status = self._table.value(positions[0], 'Status')
+            if status == 'Packed':
+                return 'already_packed', None
+            if status == 'Cancelled':
+                return 'cancelled', None
+            return 'packed', {'event': 'scan', 'awb': awb_id, 'time': scanned_time}
+        event = {'event': 'cancel', 'awb': awb_id, 'time': scanned_time}
+        courier = self.courier_for(awb_id) if self.courier_for else None
+        if courier:
+            event['courier'] = courier
+        return 'unknown', event
+
+    def scan(self, awb_id, scanned_time):
+        """Mark an AWB as Packed, or record it as Cancelled if it is unknown.
+
+        Returns one of 'packed', 'already_packed', 'cancelled' (previously
+        cancelled) or 'unknown' (not in the manifest, added as Cancelled).
+        """
+        with self._locked(exclusive=True):
+            with METRICS.stage('match'):
+                results, _, events = self._scan_applied([(awb_id, scanned_time)])
+            if events:
+                self._append_journal(events)
+            return results[0]
+
+    def scan_batch(self, items, batch_id=None):
+        """Apply many scans under one lock and one journal append.
+
+        ``items`` is a list of (awb_id, scanned_time). Returns ``(results,
+        replayed)``: one scan() result per item, and whether they were
+        answered from an earlier batch with the same ``batch_id``.
+        """
+        with self._locked(exclusive=True):
+            with METRICS.stage('match'):
+                results, replayed, events = self._scan_applied(items, batch_id)
+            if events:
+                self._append_journal(events)
+            return results, replayed
+
+    def delete(self, awb_id):
+        """Delete every row with this AWB ID; returns the number removed"""
+        with self._locked(exclusive=True):
+            with METRICS.stage('match'):
+                removed, events = self._delete_applied(str(awb_id).strip())
+            if events:
+                self._append_journal(events)
+            return removed
+
+    def write_many(self, ops):
+        """Apply queued writes under one lock and one journal append.
+
+        ``ops`` holds ``('scan', awb_id, time)``, ``('batch', items,
+        batch_id)`` and ``('delete', awb_id)`` tuples. Returns, per op, what
+        scan(), scan_batch() or delete() would have returned, or the
+        ValueError it would have raised.
+        """
+        with self._locked(exclusive=True):
+            outcomes = []
+            events = []
+            for op in ops:
+                try:
+                    if op[0] == 'scan':
+                        results, _, op_events = self._scan_applied([(op[1], op[2])])
+                        outcome = results[0]
+                    elif op[0] == 'batch':
+                        results, replayed, op_events = self._scan_applied(op[1], op[2])
+                        outcome = (results, replayed)
+                    elif op[0] == 'delete':
+                        outcome, op_events = self._delete_applied(str(op[1]).strip())
+                    else:
+                        raise ValueError(f"Unknown manifest write {op[0]!r}")
+                except ValueError as e:
+                    outcome, op_events = e, []
+                outcomes.append(outcome)
+                events.extend(op_events)
+            if events:
+                self._append_journal(events)
+            return outcomes
+
+    def counts(self):
+        with self._locked():
+            return self.counters.summary()
+
+    def breakdown(self):
+        """Status counts per courier and per SKU"""
+        with self._locked():
+            return self.counters.breakdown()
+
+    def verify_counts(self):
+        """Recount from the rows and compare with the maintained counters.
+
+        A mismatch is logged and the counters are replaced by the recount.
+        """
+        with self._locked():
+            recounted = StatusCounters()
+            self._count_all(recounted)
+            result = verify_counters(self.counters, recounted)
+            if not result['consistent']:
+                logger.warning(f"Status counters drifted from {self.path}; rebuilt from rows")
+                self.counters = recounted
+            return result
+
+    def reconciliation(self):
+        """Per-courier pickup reconciliation; see StatusCounters.reconciliation"""
+        with self._locked():
+            table = self._table
+            missing = defaultdict(list)
+            if 'Status' in table.col:
+                awbs = table.data[table.col['AWB ID']]
+                for pos in table.positions(table.equal_mask('Status', 'Pending')):
+                    missing[self._dims(pos)[0]].append(awbs[pos])
+            return self.counters.reconciliation(missing)
+
+    def query(self, search=None, status=None, order_by=None, descending=False, start=0, length=None):
+        """One page of the manifest for the server-side orders table.
+
+        ``search`` is a case-insensitive substring matched against every
+        column, ``status`` an exact Status filter. Returns ``(total,
+        filtered, rows)`` with rows as dicts.
+        """
+        needle = search.lower() if search else None
+        with self._locked():
+            table = self._table
+            mask = None
+            if status and 'Status' in table.col:
+                mask = table.equal_mask('Status', status)
+            if needle:
+                found = table.contains_mask(needle)
+                mask = found if mask is None else bytes(map(and_, mask, found))
+            positions = table.positions(mask)
+            if order_by in SORTABLE_COLUMNS and order_by in table.col:
+                table.sort(positions, order_by, descending, key=_qty_key if order_by == 'Qty' else None)
+            stop = None if length is None or length < 0 else start + length
+            return self._live, len(positions), [dict(zip(self.columns, row))
+                                                for row in table.rows(positions[start:stop])]
+
+    def export_rows(self, statuses=None, couriers=None, since=None, until=None):
+        """A point-in-time snapshot of the manifest for streaming exports.
+
+        Keeps rows whose Status is in ``statuses``, whose Courier (lower
+        case) is in ``couriers`` and whose Scanned Time lies between
+        ``since`` and ``until``, for each filter given. Returns ``(columns,
+        rows)``; rows iterates lists of strings as they were when this was
+        called, however the manifest changes while they are read.
+        """
+        with self._locked():
+            table = self._table
+            masks = []
+            if statuses:
+                masks.append(table.match_mask('Status', statuses.__contains__))
+            if couriers:
+                masks.append(table.match_mask('Courier', lambda value: value.lower() in couriers))
+            if since or until:
+                masks.append(table.match_mask('Scanned Time', lambda value: value and (
+                    not since or value >= since) and (not until or value <= until)))
+            mask = None
+            for found in masks:
+                mask = found if mask is None else bytes(map(and_, mask, found))
+            snapshot = table.snapshot(mask, mutable=('Status', 'Scanned Time'))
+            return list(self.columns), snapshot.rows()
+
+    def records(self):
+        with self._locked():
+            return [dict(zip(self.columns, row)) for row in self._table.rows()]
+
+
+def _qty_key(value):
+    """Sort quantities numerically, with non-numbers after them"""
+    return (0, int(value), '') if value.isdigit() else (1, 0, value)
+
+
+def _fsync_dir(path):
+    """Persist a rename by fsyncing the containing directory (POSIX only)"""
+    if os.name != 'posix':
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,279 @@
+"""Stage timing histograms and counters, aggregated across gunicorn workers.
+
+Each process keeps its metrics in memory and writes them to
+``<directory>/metrics-<pid>.json`` at most every ``flush_interval``
+seconds. /metrics sums every process file (and the archive that files of
+exited workers are folded into) and renders the Prometheus text format.
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines have no flock
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+FLUSH_INTERVAL = 1.0
+
+HELP = {
+    'scanner_request_seconds': 'Time to handle a request, by endpoint',
+    'scanner_stage_seconds': 'Time spent in one stage of handling a request, by endpoint and stage',
+    'scanner_scans_total': 'Scans, by result',
+    'scanner_upload_orders_total': 'Orders read from uploaded manifests',
+    'scanner_upload_pages_total': 'Manifest PDF pages processed, by source (extracted or cached)',
+}
+
+_current = threading.local()
+
+
+def current_endpoint():
+    return getattr(_current, 'endpoint', None) or 'other'
+
+
+def set_endpoint(endpoint):
+    """Label stages timed by this thread with ``endpoint`` until the next call"""
+    _current.endpoint = endpoint
+
+
+class Metrics:
+    """Histograms and counters of one process, keyed by name and label values"""
+
+    def __init__(self, directory=None, flush_interval=FLUSH_INTERVAL):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.run = None
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._histograms = {}
+        self._counters = {}
+        self._last_flush = time.monotonic()
+
+    def configure(self, directory, flush_interval=FLUSH_INTERVAL, run=None):
+        """Flush to ``directory``; with ``run``, periodic flushes go through ``run(fn)``
+        (e.g. a gevent thread-pool call) so recording a metric never blocks on disk"""
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.run = run
+        os.makedirs(directory, exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # Recording
+    # ------------------------------------------------------------------
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            # A forked worker must not report its parent's numbers as its own
+            self._reset()
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._check_fork()
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(BUCKETS), 0.0, 0]
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+                    break
+            histogram[1] += seconds
+            histogram[2] += 1
+        self._maybe_flush()
+
+    def inc(self, name, n=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._check_fork()
+            self._counters[key] = self._counters.get(key, 0) + n
+        self._maybe_flush()
+
+    def stage_time(self, stage, seconds, endpoint=None):
+        self.observe('scanner_stage_seconds', seconds, endpoint=endpoint or current_endpoint(), stage=stage)
+
+    @contextmanager
+    def stage(self, stage, endpoint=None):
+        """Time a block as one stage of the current request"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_time(stage, time.perf_counter() - started, endpoint)
+
+    # ------------------------------------------------------------------
+    # Cross-process aggregation
+    # ------------------------------------------------------------------
+    def _maybe_flush(self):
+        if self.directory and time.monotonic() - self._last_flush >= self.flush_interval:
+            if self.run:
+                # Claim this flush before yielding to the pool, so concurrent greenlets do not queue more
+                self._last_flush = time.monotonic()
+                self.run(self.flush)
+            else:
+                self.flush()
+
+    def _snapshot(self):
+        with self._lock:
+            self._check_fork()
+            self._last_flush = time.monotonic()
+            return {
+                'histograms': [[name, labels, list(buckets), total, count]
+                               for (name, labels), (buckets, total, count) in self._histograms.items()],
+                'counters': [[name, labels, value] for (name, labels), value in self._counters.items()],
+            }
+
+    def flush(self):
+        """Write this process's cumulative metrics to its file"""
+        if not self.directory:
+            return
+        try:
+            # Created on demand: a deployment may clear the directory after the app was imported
+            os.makedirs(self.directory, exist_ok=True)
+            _write_json(os.path.join(self.directory, f"metrics-{os.getpid()}.json"), self._snapshot())
+        except OSError as e:
+            logger.warning(f"Could not write metrics: {e}")
+
+    def collect(self):
+        """Sum the metrics of every process, folding files of exited workers into the archive"""
+        self.flush()
+        if not self.directory:
+            return self._snapshot()
+        archive_path = os.path.join(self.directory, 'metrics-archive.json')
+        os.makedirs(self.directory, exist_ok=True)
+        with _flocked(os.path.join(self.directory, 'metrics.lock')):
+            archive = _read_json(archive_path) or {'histograms': [], 'counters': []}
+            live = []
+            dead = []
+            for entry in os.scandir(self.directory):
+                name = entry.name
+                if not (name.startswith('metrics-') and name.endswith('.json')) or name == 'metrics-archive.json':
+                    continue
+                pid = name[len('metrics-'):-len('.json')]
+                data = _read_json(entry.path)
+                if data is None or not pid.isdigit():
+                    continue
+                (live if _pid_alive(int(pid)) else dead).append((entry.path, data))
+            if dead:
+                archive = _merge([archive] + [data for _, data in dead])
+                _write_json(archive_path, archive)
+                for path, _ in dead:
+                    os.remove(path)
+        return _merge([archive] + [data for _, data in live])
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        merged = self.collect()
+        lines = []
+        seen = set()
+
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for name, labels, buckets, total, count in sorted(merged['histograms']):
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, n in zip(BUCKETS, buckets):
+                cumulative += n
+                lines.append(f"{name}_bucket{_labels(labels, le=repr(bound))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels, le='+Inf')} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {total}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+        for name, labels, value in sorted(merged['counters']):
+            header(name, 'counter')
+            lines.append(f"{name}{_labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+def _merge(snapshots):
+    histograms = {}
+    counters = {}
+    for snapshot in snapshots:
+        for name, labels, buckets, total, count in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            if key not in histograms:
+                histograms[key] = [[0] * len(BUCKETS), 0.0, 0]
+            merged = histograms[key]
+            merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+            merged[1] += total
+            merged[2] += count
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+    return {
+        'histograms': [[name, labels, *values] for (name, labels), values in histograms.items()],
+        'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+    }
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+@contextmanager
+def _flocked(path):
+    if fcntl is None:
+        yield
+        return
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def log_sampled(log, message, *args, rate=0.01, level=logging.DEBUG):
+    """Log about ``rate`` of the calls, and only if ``level`` is enabled.
+
+    For per-scan / per-order messages on hot paths; ``args`` are only
+    formatted when the message is actually emitted.
+    """
+    if log.isEnabledFor(level) and (rate >= 1 or random.random() < rate):
+        log.log(level, message, *args)
+
+
+# Process-wide metrics; app.py points it at a directory shared by all workers
+METRICS = Metrics()
@@ -0,0 +1,240 @@
+"""Streaming, page-parallel extraction of orders from Meesho manifest PDFs"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import time
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+
+# PyMuPDF (fitz) is imported where a PDF is opened: only upload jobs need it,
+# and importing it in every web worker costs start-up time and memory
+
+from awb_patterns import COURIER, DIGITS, ORDER_SUFFIX, AwbPatternRegistry, tokenize_lines
+
+logger = logging.getLogger(__name__)
+
+ORDER_COLUMNS = ["Order ID", "AWB ID", "Courier", "SKU", "Qty"]
+
+# Below this many pages a process pool costs more than it saves
+PARALLEL_MIN_PAGES = 8
+# Pages handed to a pool worker per task; each task opens the PDF once
+PAGES_PER_TASK = 8
+
+# Lines tokenized per batch while streaming
+TOKEN_CHUNK = 4096
+
+DEFAULT_REGISTRY = AwbPatternRegistry()
+
+# An indirect object reference ("12 0 R") in a PDF object's source
+_REFERENCE = re.compile(r'\b(\d+) \d+ R\b')
+
+
+def _extract_pages(path, page_numbers):
+    """Pool task: text of the given pages of the PDF at path"""
+    import fitz
+
+    texts = []
+    with fitz.open(path) as doc:
+        for page_num in page_numbers:
+            try:
+                texts.append(doc[page_num].get_text())
+            except Exception as e:
+                logger.warning(f"Error extracting text from page {page_num + 1}: {str(e)}")
+                texts.append('')
+    return texts
+
+
+def page_digest(page, object_hashes=None):
+    """Hash of what a page draws: its content stream, size and resources.
+
+    Labels generated from one template often share a byte-identical
+    content stream and differ only in a form XObject, font or ToUnicode map
+    it references, so every object reachable from the page's /Resources is
+    hashed as well. ``object_hashes`` (xref -> hash) can be shared by the
+    pages of one document, so fonts used on every page are hashed once.
+    Still cheap next to text extraction.
+    """
+    doc = page.parent
+    if object_hashes is None:
+        object_hashes = {}
+    digest = hashlib.sha256(page.read_contents())
+    digest.update(repr(tuple(page.rect)).encode())
+    resources = _page_resources(doc, page.xref)
+    digest.update(resources.encode())
+    for xref in _references(resources):
+        digest.update(_object_hash(doc, xref, object_hashes, set()).encode())
+    return digest.hexdigest()
+
+
+def _page_resources(doc, xref):
+    """The /Resources entry of a page, inherited from the page tree if the page has none"""
+    while True:
+        kind, value = doc.xref_get_key(xref, 'Resources')
+        if kind != 'null':
+            return value
+        kind, parent = doc.xref_get_key(xref, 'Parent')
+        if kind != 'xref':
+            return ''
+        xref = int(parent.split()[0])
+
+
+def _references(source):
+    return [int(xref) for xref in _REFERENCE.findall(source)]
+
+
+def _object_hash(doc, xref, object_hashes, visiting):
+    """Hash of an object's definition, its raw stream and every object it references"""
+    if xref in object_hashes:
+        return object_hashes[xref]
+    if xref in visiting:
+        return f"cycle-{xref}"
+    visiting.add(xref)
+    source = doc.xref_object(xref, compressed=True)
+    digest = hashlib.sha256(source.encode())
+    if doc.xref_is_stream(xref):
+        digest.update(doc.xref_stream_raw(xref) or b'')
+    for ref in _references(source):
+        digest.update(_object_hash(doc, ref, object_hashes, visiting).encode())
+    visiting.discard(xref)
+    object_hashes[xref] = digest.hexdigest()
+    return object_hashes[xref]
+
+
+def _iter_extracted(path, page_numbers, workers, parallel_min_pages, pages_per_task):
+    if len(page_numbers) < parallel_min_pages or workers < 2:
+        yield from _extract_pages(path, page_numbers)
+        return
+    tasks = [page_numbers[k:k + pages_per_task] for k in range(0, len(page_numbers), pages_per_task)]
+    # spawn, not fork: the web worker has background threads (journal
+    # maintenance, logging) whose locks a forked child could inherit held
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), mp_context=context) as pool:
+        futures = [pool.submit(_extract_pages, path, task) for task in tasks]
+        for future in futures:
+            yield from future.result()
+    logger.info(f"Extracted {len(page_numbers)} pages from {path} with {workers} workers")
+
+
+def iter_page_texts(path, workers=None, page_cache=None, stats=None, progress=None,
+                    parallel_min_pages=PARALLEL_MIN_PAGES, pages_per_task=PAGES_PER_TASK):
+    """Yield the text of each page in order, extracting pages in a process pool.
+
+    Pages are yielded as soon as they (and every page before them) are
+    done, so parsing overlaps extraction of later pages. With a
+    ``page_cache`` (see upload_cache.UploadCache), pages whose content hash
+    was seen before are not extracted again. ``stats``, if given, receives
+    the page count, how many pages came from the cache and the seconds spent
+    waiting for page extraction (``extract_seconds``). ``progress``, if
+    given, is called with ``(pages_done, page_count)`` after each page.
+    """
+    import fitz
+
+    try:
+        with fitz.open(path) as doc:
+            page_count = doc.page_count
+            object_hashes = {}
+            page_hashes = [page_digest(page, object_hashes) for page in doc] if page_cache else None
+    except Exception as e:
+        logger.error(f"Error opening PDF: {str(e)}")
+        raise Exception(f"Could not read PDF file: {str(e)}")
+
+    cached = {}
+    if page_cache:
+        for page_num, page_hash in enumerate(page_hashes):
+            text = page_cache.get_page(page_hash)
+            if text is not None:
+                cached[page_num] = text
+    missing = [page_num for page_num in range(page_count) if page_num not in cached]
+    if stats is not None:
+        stats.update(pages=page_count, cached_pages=len(cached))
+
+    workers = workers or min(4, os.cpu_count() or 1)
+    extracted = _iter_extracted(path, missing, workers, parallel_min_pages, pages_per_task)
+    extract_seconds = 0.0
+    for page_num in range(page_count):
+        if page_num in cached:
+            text = cached[page_num]
+        else:
+            started = time.perf_counter()
+            text = next(extracted)
+            extract_seconds += time.perf_counter() - started
+            if stats is not None:
+                stats['extract_seconds'] = extract_seconds
+            if page_cache:
+                page_cache.put_page(page_hashes[page_num], text)
+        yield text
+        if progress:
+            progress(page_num + 1, page_count)
+
+
+def iter_lines(page_texts):
+    """Yield manifest lines page by page without joining pages into one string.
+
+    Produces exactly the lines the old ``"\\n".join``-then-split approach did:
+    every page contributes its lines plus one separator line.
+    """
+    for text in page_texts:
+        yield from (text + '\n').split('\n')[:-1]
+    yield ''
+
+
+def iter_orders(lines, registry=None):
+    """Yield order dicts from a stream of manifest lines.
+
+    An order block is a run of digits followed by an ``<digits>_<n>`` line
+    (together the Order ID), then the AWB ID, the SKU and the quantity.
+    The courier is taken from the last ``Courier :`` line seen. Each line is
+    stripped and classified once, and the AWB ID is checked against the
+    courier pattern registry with a single match.
+    """
+    registry = registry or DEFAULT_REGISTRY
+    is_valid = registry.is_valid
+    lines = iter(lines)
+    buf = []
+    i = 0
+    exhausted = False
+    courier = "Unknown"
+    while True:
+        # Keep a full order block (5 lines) of lookahead in the buffer
+        while not exhausted and len(buf) - i < 5:
+            chunk = tokenize_lines(islice(lines, TOKEN_CHUNK))
+            exhausted = len(chunk) < TOKEN_CHUNK
+            buf = buf[i:] + chunk
+            i = 0
+        if i >= len(buf):
+            break
+        kind, line = buf[i]
+        if kind == COURIER:
+            courier = line.replace("Courier :", "").strip()
+            logger.debug("Found courier: %s", courier)
+
+        if not (kind == DIGITS and i + 1 < len(buf) and buf[i + 1][0] == ORDER_SUFFIX):
+            i += 1
+            continue
+
+        order_id = line + buf[i + 1][1]
+        awb_id = (buf[i + 2][1] if i + 2 < len(buf) else '') or 'Unknown'
+        sku = (buf[i + 3][1] if i + 3 < len(buf) else '') or 'Unknown'
+        qty = int(buf[i + 4][1]) if i + 4 < len(buf) and buf[i + 4][0] == DIGITS else 1
+
+        if awb_id != order_id and is_valid(awb_id):
+            yield {
+                "Order ID": order_id,
+                "AWB ID": awb_id,
+                "Courier": courier,
+                "SKU": sku,
+                "Qty": qty
+            }
+        else:
+            logger.warning(f"Invalid AWB ID '{awb_id}' for order {order_id}")
+
+        # Continue from the quantity line, as the index-based parser did
+        i += 4
+
+
+def iter_manifest_orders(path, workers=None, registry=None, page_cache=None, stats=None, progress=None):
+    """Orders from a manifest PDF on disk, produced incrementally"""
+    pages = iter_page_texts(path, workers=workers, page_cache=page_cache, stats=stats, progress=progress)
+    return iter_orders(iter_lines(pages), registry=registry)
@@ -0,0 +1,35 @@
+// Upload job progress, included by index.html and dashboard.html
+function pollUploadJob(jobId) {
+    // The upload is parsed in the background; until it is swapped in,
+    // the current manifest stays in use
+    fetch(`/api/jobs/${encodeURIComponent(jobId)}`)
+        .then(response => response.json())
+        .then(job => {
+            if (!job.success) {
+                document.getElementById('job-progress').textContent = job.message;
+                return;
+            }
+            if (job.state === 'done' || job.state === 'failed') {
+                window.location.href = '/?message=' + encodeURIComponent(job.message || '');
+                return;
+            }
+            document.getElementById('job-progress').textContent = describeUploadJob(job);
+            setTimeout(() => pollUploadJob(jobId), 1000);
+        })
+        .catch(() => setTimeout(() => pollUploadJob(jobId), 2000));
+}
+
+function describeUploadJob(job) {
+    if (job.state === 'queued') {
+        return `Upload of ${job.filename} is queued...`;
+    }
+    let text = `Processing ${job.filename}`;
+    if (job.pages_total) {
+        text += `: page ${job.pages_done} of ${job.pages_total}`;
+    }
+    text += `, ${job.orders} orders found`;
+    if (job.eta_seconds !== null && job.eta_seconds !== undefined) {
+        text += ` (about ${Math.ceil(job.eta_seconds)}s left)`;
+    }
+    return text;
+}
@@ -0,0 +1,93 @@
+import io
+import os
+import sys
+import time
+import uuid
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from manifest_sqlite import SqliteManifestStore  # noqa: E402
+from manifest_store import ManifestStore  # noqa: E402
+
+
+def manifest(awbs, courier='Valmo'):
+    """A manifest DataFrame shaped the way app.py hands it to the stores"""
+    return pd.DataFrame({
+        'Order ID': [f"O{n}" for n in range(len(awbs))],
+        'AWB ID': list(awbs),
+        'Courier': courier,
+        'SKU': 'SKU1',
+        'Qty': '1',
+        'Status': 'Pending',
+        'Scanned Time': '',
+    })
+
+
+def open_csv_store(path):
+    # No maintenance thread: the tests decide when to compact
+    return ManifestStore(str(path), compact_interval=0)
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    return tmp_path / 'orders.csv'
+
+
+@pytest.fixture(params=['csv', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'csv':
+        store = open_csv_store(tmp_path / 'orders.csv')
+    else:
+        store = SqliteManifestStore(str(tmp_path / 'orders.db'))
+    store.replace(manifest([f"AWB{n:04d}" for n in range(20)]))
+    yield store
+    store.close()
+
+
+# ----------------------------------------------------------------------
+# The Flask app, imported once in a scratch directory (it keeps its data
+# under ./uploads); every test gets a fresh active session
+# ----------------------------------------------------------------------
+@pytest.fixture(scope='session')
+def scanner(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('app')
+    previous = os.getcwd()
+    os.chdir(directory)
+    os.environ.pop('WORKER_MODE', None)
+    os.environ.setdefault('FLASK_ENV', 'production')
+    try:
+        import app
+    finally:
+        os.chdir(previous)
+    app.test_directory = str(directory)
+    return app
+
+
+@pytest.fixture
+def client(scanner, monkeypatch):
+    monkeypatch.chdir(scanner.test_directory)
+    scanner.sessions.create(f"test-{uuid.uuid4().hex[:12]}")
+    return scanner.app.test_client()
+
+
+def upload(client, filename, data, **form):
+    """Upload a manifest and wait for its job; returns the finished job status"""
+    response = client.post('/upload', data=dict(form, file=(io.BytesIO(data), filename)),
+                           content_type='multipart/form-data', headers={'Accept': 'application/json'})
+    job_id = response.get_json()['job_id']
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        status = client.get(f'/api/jobs/{job_id}').get_json()
+        if status['state'] in ('done', 'failed'):
+            return status
+        time.sleep(0.02)
+    raise AssertionError(f"Upload job {job_id} did not finish")
+
+
+def manifest_csv(awbs, courier='Valmo'):
+    rows = ['Order ID,AWB ID,Courier,SKU,Qty'] + [f"O{n},{awb},{courier},SKU{n % 3},1" for n, awb in enumerate(awbs)]
+    return '\n'.join(rows).encode()
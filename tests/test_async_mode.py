@@ -0,0 +1,86 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT
+
+pytest.importorskip('gevent')
+
+# Run in a child process: monkey-patching has to happen before the app is
+# imported, and must not leak into the rest of the test session
+SMOKE = r'''
+from gevent import monkey
+monkey.patch_all()
+
+import io
+import json
+import sys
+import time
+
+import gevent
+
+sys.path.insert(0, ROOT)
+import app as scanner
+
+# Flush on every observation, so the requests below go through the
+# metrics flush that runs on the thread pool
+scanner.METRICS.flush_interval = 0
+client = scanner.app.test_client()
+awbs = [f"VL{2035000000 + n}" for n in range(50)]
+rows = ['Order ID,AWB ID,Courier,SKU,Qty'] + [f"O{n},{awb},Valmo,S,1" for n, awb in enumerate(awbs)]
+response = client.post('/upload', data={'file': (io.BytesIO('\n'.join(rows).encode()), 'm.csv')},
+                       content_type='multipart/form-data', headers={'Accept': 'application/json'})
+job_id = response.get_json()['job_id']
+deadline = time.monotonic() + 30
+while True:
+    job = client.get(f'/api/jobs/{job_id}').get_json()
+    if job['state'] in ('done', 'failed') or time.monotonic() > deadline:
+        break
+    gevent.sleep(0.05)
+
+# Concurrent scans all go through the single writer greenlet
+scans = [gevent.spawn(client.post, '/scan', json={'awb_id': awb}) for awb in awbs]
+gevent.joinall(scans, timeout=30)
+scanned = [g.value.get_json()['success'] for g in scans if g.value is not None]
+# A manifest miss also looks the AWB up in the closed-session history
+unknown = client.post('/scan', json={'awb_id': 'NOTINMANIFEST', 'confirm': True}).get_json()
+
+stream = client.get('/events?last_id=0')
+first_chunk = next(stream.response)
+stream.close()
+
+metrics = client.get('/metrics')
+print(json.dumps({
+    'job': job['state'],
+    'job_message': job.get('message'),
+    'scanned': scanned,
+    'unknown': unknown['status'],
+    'stats': client.get('/api/stats').get_json(),
+    'verify': client.get('/api/stats/verify').get_json()['consistent'],
+    'metrics_status': metrics.status_code,
+    'metrics_scans': 'scanner_scans_total' in metrics.get_data(as_text=True),
+    'events_status': stream.status_code,
+    'events_first': first_chunk.decode() if isinstance(first_chunk, bytes) else first_chunk,
+}))
+'''
+
+
+@pytest.mark.parametrize('backend', ['csv', 'sqlite'])
+def test_gevent_mode_upload_scan_metrics(tmp_path, backend):
+    env = dict(os.environ, WORKER_MODE='gevent', FLASK_ENV='production', STORAGE_BACKEND=backend)
+    output = subprocess.run([sys.executable, '-c', f"ROOT = {ROOT!r}\n" + SMOKE], cwd=str(tmp_path), env=env,
+                            capture_output=True, text=True, timeout=120)
+    assert output.returncode == 0, output.stderr
+    result = json.loads(output.stdout.strip().splitlines()[-1])
+
+    assert result['job'] == 'done', result['job_message']
+    assert result['scanned'] == [True] * 50
+    assert result['unknown'] == 'Cancelled'
+    assert result['stats']['packed'] == 50 and result['stats']['pending'] == 0
+    assert result['verify']
+    assert result['metrics_status'] == 200 and result['metrics_scans']
+    assert result['events_status'] == 200
+    assert result['events_first'].startswith('retry:')
@@ -0,0 +1,100 @@
+import pytest
+
+from awb_index import MIN_PARTIAL_LENGTH, AwbIndex
+from manifest_sqlite import SqliteManifestStore
+
+from conftest import manifest, manifest_csv, upload
+
+AWBS = ['VL2035000101', 'VL2035000102', 'VL2035000219', 'SF123456789FPL', 'SF123456700FPL']
+
+
+@pytest.mark.parametrize('read, expected', [
+    ('VL2035000101', [('VL2035000101', 'exact'), ('VL2035000102', 'edit')]),
+    ('VL2035000191', [('VL2035000101', 'edit')]),  # substitution
+    ('VL20350000101', [('VL2035000101', 'edit')]),  # insertion
+    ('VL203500219', [('VL2035000219', 'edit')]),  # deletion
+    ('VL2035002019', [('VL2035000219', 'edit')]),  # adjacent swap
+    ('VL20350001', [('VL2035000101', 'prefix'), ('VL2035000102', 'prefix')]),
+    ('456789FPL', [('SF123456789FPL', 'suffix')]),
+    ('XX9999', []),
+])
+def test_suggest_kinds(read, expected):
+    assert AwbIndex(AWBS).suggest(read) == expected
+
+
+def test_short_reads_are_not_matched_as_fragments():
+    index = AwbIndex(AWBS)
+    short = 'VL2035'[:MIN_PARTIAL_LENGTH - 1]
+    assert index.prefixed(short) != []
+    assert index.suggest(short) == []
+    assert index.suggest('VL2035', limit=2) == [('VL2035000101', 'prefix'), ('VL2035000102', 'prefix')]
+
+
+def test_add_discard_and_reset():
+    index = AwbIndex(AWBS)
+    index.add('VL2035000103')
+    index.add('VL2035000103')
+    index.discard('VL2035000101')
+    index.discard('nope')
+    assert len(index) == 5 and 'VL2035000101' not in index
+    assert index.prefixed('VL203500010') == ['VL2035000102', 'VL2035000103']
+    assert index.suffixed('000103') == ['VL2035000103']
+
+    big = [f"VL{2035000000 + n}" for n in range(100)]
+    index.reset(big)
+    index.reset(big[1:] + ['VL2035009999'])  # a small difference is applied in place
+    assert len(index) == 100 and 'VL2035000000' not in index
+    assert index.prefixed('VL20350099') == ['VL2035009999']
+    index.reset(['SF1'])
+    assert (len(index), index.suggest('SF2')) == (1, [('SF1', 'edit')])
+
+
+def test_store_suggest_follows_manifest_changes(store):
+    assert [s['awb_id'] for s in store.suggest('AWB0O01')] == ['AWB0001']
+    store.delete('AWB0001')
+    store.merge(manifest(['AWB7001'], courier='Shadowfax'))
+    store.scan('AWB7001', '2026-10-16 10:00:00')
+    assert store.suggest('AWB0O01') == []
+    assert store.suggest('AWB70O1') == [{'awb_id': 'AWB7001', 'match': 'edit', 'status': 'Packed',
+                                         'courier': 'Shadowfax'}]
+    # Cancellations are not manifest orders, so they are never suggested
+    store.scan('AWB8001', '2026-10-16 10:00:01')
+    assert store.suggest('AWB80O1') == []
+
+
+def test_sqlite_suggest_sees_other_connections(tmp_path):
+    path = str(tmp_path / 'orders.db')
+    first = SqliteManifestStore(path)
+    first.replace(manifest(['AWB0001']))
+    second = SqliteManifestStore(path)
+    assert second.suggest('AWB0O01')[0]['awb_id'] == 'AWB0001'
+    first.merge(manifest(['AWB0002']))
+    assert [s['awb_id'] for s in second.suggest('AWB000')] == ['AWB0001', 'AWB0002']
+    first.close()
+    second.close()
+
+
+# ----------------------------------------------------------------------
+# Endpoints
+# ----------------------------------------------------------------------
+def test_scan_offers_suggestions_before_cancelling(client, scanner):
+    upload(client, 'm.csv', manifest_csv(AWBS[:3]))
+    body = client.post('/scan', json={'awb_id': 'VL2035000191'}).get_json()
+    assert not body['success'] and body['status'] is None
+    assert [(s['awb_id'], s['match'], s['status']) for s in body['suggestions']] == [
+        ('VL2035000101', 'edit', 'Pending')]
+    assert scanner.active_store().get('VL2035000191') is None
+
+    body = client.post('/scan', json={'awb_id': 'VL2035000191', 'confirm': True}).get_json()
+    assert body['status'] == 'Cancelled'
+    assert scanner.active_store().get('VL2035000191')['Status'] == 'Cancelled'
+
+
+def test_suggest_endpoint(client):
+    assert not client.get('/api/awb/suggest').get_json()['success']
+    assert client.get('/api/awb/suggest?q=VL2035').get_json()['suggestions'] == []  # no manifest yet
+    upload(client, 'm.csv', manifest_csv(AWBS[:3]))
+    body = client.get('/api/awb/suggest?q=VL2035&limit=2').get_json()
+    assert [s['awb_id'] for s in body['suggestions']] == ['VL2035000101', 'VL2035000102']
+    body = client.get('/api/awb/suggest?q=VL2035&limit=0').get_json()
+    assert len(body['suggestions']) == 1
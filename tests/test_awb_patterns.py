@@ -0,0 +1,53 @@
+import json
+import re
+
+import pytest
+
+from awb_patterns import COURIER, DIGITS, ORDER_SUFFIX, TEXT, AwbPatternRegistry, load_registry, tokenize_lines
+
+SAMPLES = ['VL2035000001', 'SF123456789FPL', '1490123456789012', '149012345', '13412345678901', '1341234567890',
+           'M123', 'MX', 'AB12', 'ab12', 'A12', '12345', '', 'Unknown', 'VL', 'SFX1', ' VL1']
+
+
+def original_is_valid(awb_id):
+    """The chain of checks the registry replaced"""
+    return bool(re.match(r'^[A-Z]{2}\d+', awb_id) or re.match(r'^M\d+', awb_id) or
+                re.match(r'^1490\d{12,}', awb_id) or re.match(r'^134\d{11,}', awb_id) or
+                re.match(r'^VL\d+', awb_id) or re.match(r'^SF\d+', awb_id))
+
+
+@pytest.mark.parametrize('awb_id', SAMPLES)
+def test_default_registry_matches_original_checks(awb_id):
+    assert AwbPatternRegistry().is_valid(awb_id) == original_is_valid(awb_id)
+
+
+def test_courier_for():
+    registry = AwbPatternRegistry()
+    assert registry.courier_for('VL2035000001') == 'Valmo'
+    assert registry.courier_for('SF123456789FPL') == 'Shadowfax'
+    assert registry.courier_for('1490123456789012') == 'Delhivery'
+    assert registry.courier_for('13412345678901') is None  # shared format
+    assert registry.courier_for('XX1') is None
+    assert registry.courier_for('nope') is None
+
+
+def test_patterns_file_comes_first(tmp_path):
+    path = tmp_path / 'patterns.json'
+    path.write_text(json.dumps([{'name': 'ekart', 'pattern': r'FM\d+', 'courier': 'Ekart'},
+                                {'name': 'lowercase', 'pattern': r'zz\d+', 'courier': 'Test'}]))
+    registry = load_registry(str(path))
+    assert registry.courier_for('FM5100000001') == 'Ekart'  # ahead of the generic two-letter pattern
+    assert registry.is_valid('zz1')
+    assert registry.fingerprint != AwbPatternRegistry().fingerprint
+    assert load_registry(str(tmp_path / 'missing.json')).fingerprint == AwbPatternRegistry().fingerprint
+
+
+def test_bad_pattern_fails_early():
+    with pytest.raises(re.error):
+        AwbPatternRegistry([{'name': 'broken', 'pattern': r'(', 'courier': None}])
+
+
+def test_tokenize_lines():
+    assert tokenize_lines(['  123 ', '123_1', 'Courier : Valmo', 'VL1', '', '12_x']) == [
+        (DIGITS, '123'), (ORDER_SUFFIX, '123_1'), (COURIER, 'Courier : Valmo'),
+        (TEXT, 'VL1'), (TEXT, ''), (TEXT, '12_x')]
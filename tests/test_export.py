@@ -0,0 +1,119 @@
+import csv
+import io
+import uuid
+import zipfile
+
+import pytest
+
+import manifest_export
+from manifest_export import iter_csv, iter_xlsx, row_filter
+
+from conftest import manifest, manifest_csv, upload
+
+COLUMNS = ['AWB ID', 'Courier', 'Status', 'Scanned Time']
+ROWS = [['AWB0001', 'Valmo', 'Packed', '2026-10-14 09:00:00'],
+        ['AWB0002', 'Shadowfax', 'Packed', '2026-10-15 18:30:00'],
+        ['AWB0003', 'Valmo', 'Pending', ''],
+        ['AWB0004', 'Unknown', 'Cancelled', '2026-10-16 08:00:00']]
+
+
+def read_csv(text):
+    return list(csv.reader(io.StringIO(text)))
+
+
+def sheet_rows(data):
+    """Row count of each worksheet in an XLSX workbook"""
+    with zipfile.ZipFile(io.BytesIO(data)) as workbook:
+        sheets = sorted(name for name in workbook.namelist() if name.startswith('xl/worksheets/sheet'))
+        return [workbook.read(name).count(b'<row ') for name in sheets]
+
+
+def test_iter_csv_chunks():
+    rows = [[f"AWB{n:04d}", 'Valmo', 'Pending', ''] for n in range(500)]
+    chunks = list(iter_csv(COLUMNS, iter(rows), chunk_size=1000))
+    assert len(chunks) > 5
+    assert all(len(chunk) < 1100 for chunk in chunks)
+    assert read_csv(''.join(chunks)) == [COLUMNS] + rows
+    assert read_csv(''.join(iter_csv(COLUMNS, []))) == [COLUMNS]
+
+
+def test_iter_xlsx_splits_sheets(tmp_path, monkeypatch):
+    pytest.importorskip('xlsxwriter')
+    monkeypatch.setattr(manifest_export, 'XLSX_SHEET_ROWS', 3)
+    data = b''.join(iter_xlsx(COLUMNS, iter(ROWS * 2), directory=str(tmp_path), chunk_size=512))
+    assert data[:2] == b'PK'
+    assert sheet_rows(data) == [4, 4, 3]  # header plus up to 3 rows per sheet
+    assert sheet_rows(b''.join(iter_xlsx(COLUMNS, [], directory=str(tmp_path)))) == [1]
+    assert list(tmp_path.iterdir()) == []  # the temporary workbook is removed
+
+
+@pytest.mark.parametrize('filters, expected', [
+    ({}, ['AWB0001', 'AWB0002', 'AWB0003', 'AWB0004']),
+    ({'statuses': {'Packed'}}, ['AWB0001', 'AWB0002']),
+    ({'couriers': {'valmo', 'unknown'}}, ['AWB0001', 'AWB0003', 'AWB0004']),
+    ({'since': '2026-10-15 00:00:00'}, ['AWB0002', 'AWB0004']),
+    ({'until': '2026-10-15 23:59:59', 'couriers': {'valmo'}}, ['AWB0001']),
+])
+def test_export_filters(store, filters, expected):
+    store.replace(manifest([row[0] for row in ROWS[:3]]).assign(Courier=[row[1] for row in ROWS[:3]]))
+    for awb, _, status, scanned in ROWS:
+        if status != 'Pending':
+            store.scan(awb, scanned)  # AWB0004 is not in the manifest: a cancellation
+    columns, rows = store.export_rows(**filters)
+    assert [row[columns.index('AWB ID')] for row in rows] == expected
+    # Archived sessions are filtered the same way
+    assert [row[0] for row in filter(row_filter(COLUMNS, **filters), ROWS)] == expected
+
+
+def test_export_rows_is_a_snapshot(store):
+    columns, rows = store.export_rows(statuses={'Pending'})
+    store.scan('AWB0000', '2026-10-16 10:00:00')
+    store.replace(manifest(['AWB9999']))
+    rows = list(rows)
+    assert len(rows) == 20
+    assert rows[0][columns.index('Status')] == 'Pending'
+
+
+# ----------------------------------------------------------------------
+# Endpoints
+# ----------------------------------------------------------------------
+AWBS = [f"VL{2035000000 + n}" for n in range(6)]
+
+
+def test_export_endpoint_filters(client):
+    upload(client, 'm.csv', manifest_csv(AWBS))
+    client.post('/scan', json={'awb_id': AWBS[1]})
+    response = client.get('/export?format=csv&status=Packed,Pending&courier=VALMO&since=2000-01-01')
+    assert response.status_code == 200
+    assert response.headers['Content-Disposition'] == 'attachment; filename="orders_export.csv"'
+    rows = read_csv(response.get_data(as_text=True))
+    assert [row[rows[0].index('AWB ID')] for row in rows[1:]] == [AWBS[1]]
+
+    rows = read_csv(client.get('/export').get_data(as_text=True))
+    assert len(rows) == len(AWBS) + 1
+
+
+def test_export_rejects_bad_input(client):
+    upload(client, 'm.csv', manifest_csv(AWBS))
+    for query in ('format=pdf', 'since=16-10-2026'):
+        response = client.get(f'/export?{query}')
+        assert response.status_code == 302
+
+
+def test_export_closed_session(client, scanner):
+    upload(client, 'm.csv', manifest_csv(AWBS))
+    client.post('/scan', json={'awb_id': AWBS[2]})
+    closed = scanner.sessions.active_name()
+    client.post('/sessions', json={'name': f"next-{uuid.uuid4().hex[:8]}"})
+    assert client.post(f'/sessions/{closed}/close', json={}).get_json()['success']
+
+    response = client.get(f'/sessions/{closed}/export?status=Packed')
+    assert response.status_code == 200
+    assert f'filename="orders_{closed}.csv"' in response.headers['Content-Disposition']
+    rows = read_csv(response.get_data(as_text=True))
+    assert [row[rows[0].index('AWB ID')] for row in rows[1:]] == [AWBS[2]]
+
+    if manifest_export.XLSX_AVAILABLE:
+        response = client.get(f'/sessions/{closed}/export?format=xlsx')
+        assert response.mimetype == manifest_export.XLSX_MIMETYPE
+        assert sheet_rows(response.get_data()) == [len(AWBS) + 1]
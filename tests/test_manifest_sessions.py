@@ -0,0 +1,159 @@
+import logging
+import os
+import sys
+import uuid
+from datetime import datetime
+
+import pytest
+
+import manifest_sessions
+from manifest_sessions import AwbHistory, SessionManager
+
+from conftest import manifest, manifest_csv, open_csv_store, upload
+
+
+def open_sessions(tmp_path, **kwargs):
+    return SessionManager(str(tmp_path / 'sessions'), lambda directory: open_csv_store(f"{directory}/orders.csv"),
+                          **kwargs)
+
+
+def test_history_goes_through_run(tmp_path):
+    calls = []
+
+    def run(fn, *args):
+        calls.append(fn.__name__)
+        return fn(*args)
+
+    history = AwbHistory(str(tmp_path / 'awb_history.db'), run=run)
+    history.add_session('day1', [{'AWB ID': 'AWB0001', 'Status': 'Packed', 'Scanned Time': '2026-10-15 10:00:00'}])
+    assert history.lookup('AWB0001') == [{'session': 'day1', 'status': 'Packed',
+                                          'scanned_time': '2026-10-15 10:00:00'}]
+    assert calls == ['_add_session', '_lookup']
+
+
+def test_archive_without_pyarrow_falls_back_and_warns_once(tmp_path, monkeypatch, caplog):
+    monkeypatch.setitem(sys.modules, 'pyarrow.feather', None)
+    monkeypatch.setattr(manifest_sessions, '_warned_no_pyarrow', False)
+    sessions = open_sessions(tmp_path)
+    sessions.create('live')
+    with caplog.at_level(logging.WARNING, logger='manifest_sessions'):
+        for name in ('day1', 'day2'):
+            sessions.create(name, activate=False)
+            sessions.store(name).replace(manifest(['AWB0001']))
+            sessions.close(name)
+
+    assert [info['archive'] for info in sessions.list() if info['state'] == 'closed'] == \
+        ['day1.csv.gz', 'day2.csv.gz']
+    assert sum('pyarrow is not installed' in record.message for record in caplog.records) == 1
+
+
+def test_create_activate_and_close(tmp_path):
+    sessions = open_sessions(tmp_path)
+    assert sessions.create('day1') == 'day1'
+    sessions.store().replace(manifest(['AWB0001', 'AWB0002']))
+    sessions.create('day2')
+    assert sessions.active_name() == 'day2'
+
+    with pytest.raises(ValueError):
+        sessions.close('day2')  # still active
+    with pytest.raises(ValueError):
+        sessions.create('bad name')
+    assert sessions.close('day1') == 2
+    info = sessions.get('day1')
+    assert (info['state'], info['orders']) == ('closed', 2)
+    assert not os.path.exists(info['directory'])
+    with pytest.raises(ValueError):
+        sessions.store('day1')
+    with pytest.raises(ValueError):
+        sessions.create('day1')  # a closed name is not reused
+    with pytest.raises(ValueError):
+        sessions.close('day1')
+
+
+def test_archived_rows_round_trip(tmp_path):
+    pytest.importorskip('pyarrow')
+    sessions = open_sessions(tmp_path)
+    sessions.create('live')
+    sessions.create('day1', activate=False)
+    store = sessions.store('day1')
+    store.replace(manifest(['AWB0001', 'AWB0002']))
+    store.scan('AWB0002', '2026-10-15 10:00:00')
+    sessions.close('day1')
+
+    assert sessions.get('day1')['archive'] == 'day1.feather'
+    columns, rows = sessions.archived_rows('day1')
+    rows = [dict(zip(columns, row)) for row in rows]
+    assert [(row['AWB ID'], row['Status'], row['Scanned Time']) for row in rows] == [
+        ('AWB0001', 'Pending', ''), ('AWB0002', 'Packed', '2026-10-15 10:00:00')]
+    with pytest.raises(ValueError):
+        sessions.archived_rows('live')
+
+
+def test_history_covers_open_and_closed_sessions(tmp_path):
+    sessions = open_sessions(tmp_path)
+    for day, scanned in (('day1', '2026-10-14 09:00:00'), ('day2', '2026-10-15 09:00:00')):
+        sessions.create(day)
+        sessions.store().replace(manifest(['AWB0001']))
+        sessions.store().scan('AWB0001', scanned)
+    sessions.create('day3')
+    sessions.store().replace(manifest(['AWB0001']))
+    sessions.close('day1')
+
+    # Open sessions (in creation order, which ties within a second) come before archived ones
+    found = [(entry['session'], entry['status']) for entry in sessions.history_of('AWB0001')]
+    assert sorted(found[:2]) == [('day2', 'Packed'), ('day3', 'Pending')]
+    assert found[2:] == [('day1', 'Packed')]
+    assert [entry['session'] for entry in sessions.history_of('AWB0001', exclude='day3')] == ['day2', 'day1']
+    # The latest packing wins, whether its session is open or archived
+    assert sessions.packed_elsewhere('AWB0001', exclude='day3')['session'] == 'day2'
+    assert sessions.packed_elsewhere('AWB0001', exclude='day2')['session'] == 'day1'
+    assert sessions.packed_elsewhere('AWB9999') is None
+
+
+def test_history_keeps_the_packed_row_of_a_session(tmp_path):
+    history = AwbHistory(str(tmp_path / 'awb_history.db'))
+    assert history.add_session('day1', [
+        {'AWB ID': 'AWB0001', 'Status': 'Packed', 'Scanned Time': '2026-10-15 10:00:00'},
+        {'AWB ID': 'AWB0001', 'Status': 'Pending', 'Scanned Time': ''},
+        {'AWB ID': ' ', 'Status': 'Pending'}]) == 1
+    # Indexing a session again replaces its rows
+    history.add_session('day1', [{'AWB ID': 'AWB0002', 'Status': 'Pending', 'Scanned Time': ''}])
+    assert history.lookup('AWB0001') == []
+    assert [entry['session'] for entry in history.lookup(' AWB0002 ')] == ['day1']
+
+
+# ----------------------------------------------------------------------
+# Endpoints
+# ----------------------------------------------------------------------
+def test_scan_reports_parcels_packed_in_another_session(client, scanner):
+    awb = f"VL{uuid.uuid4().int % 10 ** 10:010d}"
+    upload(client, 'm.csv', manifest_csv([awb]))
+    client.post('/scan', json={'awb_id': awb})
+    earlier = scanner.sessions.active_name()
+
+    body = client.post('/sessions', json={'name': f"next-{uuid.uuid4().hex[:8]}"}).get_json()
+    assert body['success']
+    assert client.post(f'/sessions/{earlier}/close', json={}).get_json()['success']
+    upload(client, 'm.csv', manifest_csv(['VL1000000001']))
+
+    body = client.post('/scan', json={'awb_id': awb, 'confirm': True}).get_json()
+    assert not body['success']
+    assert (body['status'], body['session']) == ('Packed', earlier)
+    assert body['packed_on'] == datetime.now().strftime('%Y-%m-%d')
+    # Reported, not recorded as a cancellation here
+    assert scanner.active_store().get(awb) is None
+
+    history = client.get(f'/api/awb/{awb}/history').get_json()
+    assert [(entry['session'], entry['status']) for entry in history['sessions']] == [(earlier, 'Packed')]
+
+
+def test_sessions_api(client, scanner):
+    name = f"api-{uuid.uuid4().hex[:8]}"
+    assert client.post('/sessions', json={'name': name}).get_json()['active'] == name
+    body = client.get('/api/sessions').get_json()
+    assert body['active'] == name
+    assert name in [info['name'] for info in body['sessions']]
+
+    body = client.post(f'/sessions/{name}/close', json={}).get_json()
+    assert not body['success'] and 'active' in body['message']
+    assert not client.post('/sessions/no-such-session/activate', json={}).get_json()['success']
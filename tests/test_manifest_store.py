@@ -0,0 +1,143 @@
+import json
+import shutil
+
+from conftest import manifest, open_csv_store
+
+AWBS = [f"AWB{n:04d}" for n in range(20)]
+
+
+def journal_events(store):
+    with open(store.journal_path, 'rb') as f:
+        return [json.loads(line) for line in f]
+
+
+# ----------------------------------------------------------------------
+# Journal replay
+# ----------------------------------------------------------------------
+def test_reopen_replays_journal(csv_path):
+    store = open_csv_store(csv_path)
+    store.replace(manifest(AWBS))
+    store.scan('AWB0001', '2026-10-16 10:00:00')
+    store.scan('NOTINLIST', '2026-10-16 10:01:00')
+    store.delete('AWB0002')
+
+    reopened = open_csv_store(csv_path)
+    assert reopened.get('AWB0001')['Status'] == 'Packed'
+    assert reopened.get('NOTINLIST')['Status'] == 'Cancelled'
+    assert reopened.get('AWB0002') is None
+    assert reopened.counts() == store.counts()
+
+
+def test_replay_over_snapshot_that_contains_journal_is_idempotent(csv_path):
+    # A crash inside _compact after the new snapshot is renamed into place
+    # but before the journal is removed leaves both behind
+    store = open_csv_store(csv_path)
+    store.replace(manifest(AWBS))
+    store.scan('AWB0001', '2026-10-16 10:00:00')
+    store.scan('NOTINLIST', '2026-10-16 10:01:00')
+    store.scan('GONE', '2026-10-16 10:02:00')
+    store.delete('GONE')
+    store.delete('AWB0003')
+    shutil.copy(store.journal_path, str(csv_path) + '.saved')
+    expected = store.counts()
+    store.compact()
+    shutil.copy(str(csv_path) + '.saved', store.journal_path)
+
+    reopened = open_csv_store(csv_path)
+    assert reopened.counts() == expected
+    assert len(reopened) == len(AWBS)  # one cancelled row added, one deleted
+    assert reopened.get('AWB0001')['Scanned Time'] == '2026-10-16 10:00:00'
+    assert reopened.get('GONE') is None
+    assert reopened.verify_counts()['consistent']
+
+
+def test_torn_tail_is_dropped(csv_path):
+    store = open_csv_store(csv_path)
+    store.replace(manifest(AWBS))
+    store.scan('AWB0001', '2026-10-16 10:00:00')
+    with open(store.journal_path, 'ab') as f:
+        f.write(b'{"event": "scan", "awb": "AWB00')
+
+    reopened = open_csv_store(csv_path)
+    assert reopened.get('AWB0001')['Status'] == 'Packed'
+    assert reopened.counts()['packed'] == 1
+
+    # The next append overwrites the torn record instead of following it
+    reopened.scan('AWB0002', '2026-10-16 10:05:00')
+    assert [event['awb'] for event in journal_events(reopened)] == ['AWB0001', 'AWB0002']
+    assert open_csv_store(csv_path).counts()['packed'] == 2
+
+
+def test_compaction_carries_batches_forward(csv_path):
+    store = open_csv_store(csv_path)
+    store.replace(manifest(AWBS))
+    items = [('AWB0001', '2026-10-16 10:00:00'), ('NOTINLIST', '2026-10-16 10:00:01')]
+    results, replayed = store.scan_batch(items, batch_id='b1')
+    assert results == ['packed', 'unknown'] and not replayed
+
+    store.compact()
+    assert journal_events(store) == [{'event': 'batch', 'batch_id': 'b1', 'results': results}]
+
+    reopened = open_csv_store(csv_path)
+    assert reopened.scan_batch(items, batch_id='b1') == (results, True)
+    assert reopened.counts() == store.counts()
+
+
+def test_replace_does_not_replay_old_journal(csv_path):
+    store = open_csv_store(csv_path)
+    store.replace(manifest(AWBS))
+    store.scan('AWB0001', '2026-10-16 10:00:00')
+    store.delete('AWB0002')
+
+    store.replace(manifest(AWBS))
+    reopened = open_csv_store(csv_path)
+    assert reopened.get('AWB0001')['Status'] == 'Pending'
+    assert reopened.get('AWB0002') is not None
+    assert reopened.counts()['packed'] == 0
+
+
+# ----------------------------------------------------------------------
+# Maintained counters, on both backends
+# ----------------------------------------------------------------------
+def test_counts_consistent_after_scan(store):
+    assert store.scan('AWB0001', '2026-10-16 10:00:00') == 'packed'
+    assert store.scan('AWB0001', '2026-10-16 10:00:01') == 'already_packed'
+    assert store.verify_counts()['consistent']
+    assert store.counts()['packed'] == 1
+
+
+def test_counts_consistent_after_cancel(store):
+    assert store.scan('NOTINLIST', '2026-10-16 10:00:00') == 'unknown'
+    assert store.scan('NOTINLIST', '2026-10-16 10:00:01') == 'cancelled'
+    assert store.verify_counts()['consistent']
+    assert store.counts()['cancelled'] == 1
+
+
+def test_counts_consistent_after_delete(store):
+    store.scan('AWB0001', '2026-10-16 10:00:00')
+    store.scan('NOTINLIST', '2026-10-16 10:00:01')
+    assert store.delete('AWB0001') == 1
+    assert store.delete('NOTINLIST') == 1
+    assert store.delete('NOTINLIST') == 0
+    assert store.verify_counts()['consistent']
+    assert store.counts()['packed'] == 0
+    assert store.counts()['cancelled'] == 0
+
+
+def test_counts_consistent_after_merge(store):
+    store.scan('AWB0001', '2026-10-16 10:00:00')
+    report = store.merge(manifest(AWBS[:5] + ['AWB9000', 'AWB9001'], courier='Delhivery'))
+    assert report['added'] == 2 and report['kept'] == 5
+    assert store.get('AWB0001')['Status'] == 'Packed'
+    assert store.get('AWB9000')['Status'] == 'Pending'
+    assert store.verify_counts()['consistent']
+    assert store.breakdown()['by_courier']['Delhivery']['pending'] == 2
+
+
+def test_replace_forgets_batches(store):
+    items = [('AWB0001', '2026-10-16 10:00:00')]
+    assert store.scan_batch(items, batch_id='b1') == (['packed'], False)
+    assert store.scan_batch(items, batch_id='b1') == (['packed'], True)
+
+    store.replace(manifest(['AWB0002']))
+    assert store.scan_batch(items, batch_id='b1') == (['unknown'], False)
@@ -0,0 +1,38 @@
+import os
+import runpy
+import shutil
+
+from conftest import ROOT
+from metrics import Metrics
+
+
+def test_flush_and_render_recreate_a_removed_directory(tmp_path):
+    directory = str(tmp_path / '.metrics')
+    metrics = Metrics()
+    metrics.configure(directory, flush_interval=3600)
+    metrics.inc('scanner_scans_total', result='packed')
+    shutil.rmtree(directory)
+
+    assert 'scanner_scans_total{result="packed"} 1' in metrics.render()
+    assert os.path.exists(os.path.join(directory, f"metrics-{os.getpid()}.json"))
+
+
+def test_gunicorn_on_starting_keeps_preloaded_metrics_directory(tmp_path, monkeypatch):
+    # With preload_app gunicorn imports the app (which configures metrics)
+    # before it calls on_starting
+    monkeypatch.chdir(tmp_path)
+    directory = os.path.join('uploads', '.metrics')
+    metrics = Metrics()
+    metrics.configure(directory, flush_interval=3600)
+    metrics.inc('scanner_scans_total', result='packed')
+    metrics.flush()
+    with open(os.path.join(directory, 'metrics-1.json'), 'w') as f:
+        f.write('{"histograms": [], "counters": [["scanner_scans_total", [], 5]]}')
+
+    hooks = runpy.run_path(os.path.join(ROOT, 'gunicorn.conf.py'))
+    hooks['on_starting'](None)
+
+    assert os.path.isdir(directory)
+    assert os.listdir(directory) == []
+    metrics.inc('scanner_scans_total', result='packed')
+    assert 'scanner_scans_total{result="packed"} 2' in metrics.render()
@@ -0,0 +1,133 @@
+import random
+import re
+
+import pytest
+
+from pdf_manifest import TOKEN_CHUNK, iter_lines, iter_manifest_orders, iter_orders, iter_page_texts, page_digest
+from upload_cache import UploadCache
+
+fitz = pytest.importorskip('fitz')
+
+
+def template_pdf(path, awbs):
+    """One page per AWB, drawn through a form XObject: every page has the same content stream"""
+    doc = fitz.open()
+    font = doc.get_new_xref()
+    doc.update_object(font, '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+    for awb in awbs:
+        page = doc.new_page(width=200, height=100)
+        form = doc.get_new_xref()
+        doc.update_object(form, f'<< /Type /XObject /Subtype /Form /BBox [0 0 200 100] '
+                                f'/Resources << /Font << /F1 {font} 0 R >> >> >>')
+        doc.update_stream(form, f'BT /F1 12 Tf 10 50 Td ({awb}) Tj ET'.encode())
+        contents = doc.get_new_xref()
+        doc.update_object(contents, '<< >>')
+        doc.update_stream(contents, b'q /Fm0 Do Q')
+        doc.xref_set_key(page.xref, 'Resources', f'<< /XObject << /Fm0 {form} 0 R >> >>')
+        doc.xref_set_key(page.xref, 'Contents', f'{contents} 0 R')
+    doc.save(str(path))
+    return str(path)
+
+
+def test_page_digest_covers_referenced_xobjects(tmp_path):
+    first = fitz.open(template_pdf(tmp_path / 'a.pdf', ['VL2035000001']))
+    second = fitz.open(template_pdf(tmp_path / 'b.pdf', ['VL2035000002']))
+    assert first[0].read_contents() == second[0].read_contents()
+    assert page_digest(first[0]) != page_digest(second[0])
+    assert page_digest(first[0]) == page_digest(fitz.open(str(tmp_path / 'a.pdf'))[0])
+
+
+def test_page_cache_does_not_mix_up_template_pages(tmp_path):
+    cache = UploadCache(str(tmp_path / 'cache'))
+    first = template_pdf(tmp_path / 'a.pdf', ['VL2035000001', 'VL2035000002'])
+    second = template_pdf(tmp_path / 'b.pdf', ['VL2035000001', 'VL2035000003'])
+
+    stats = {}
+    assert [text.strip() for text in iter_page_texts(first, workers=1, page_cache=cache, stats=stats)] == \
+        ['VL2035000001', 'VL2035000002']
+    assert stats['cached_pages'] == 0
+
+    stats = {}
+    assert [text.strip() for text in iter_page_texts(second, workers=1, page_cache=cache, stats=stats)] == \
+        ['VL2035000001', 'VL2035000003']
+    assert stats['cached_pages'] == 1
+
+
+# ----------------------------------------------------------------------
+# Streaming parser: same orders as the original whole-text parser
+# ----------------------------------------------------------------------
+def reference_orders(text):
+    """The index-based parser the streaming one replaced, kept as the oracle"""
+    entries = []
+    courier = "Unknown"
+    lines = text.split('\n')
+    i = 0
+    while i < len(lines):
+        line = lines[i].strip()
+        if line.startswith("Courier :"):
+            courier = line.replace("Courier :", "").strip()
+        if not (re.match(r'^\d+$', line) and i + 1 < len(lines) and re.match(r'^\d+_\d+$', lines[i + 1].strip())):
+            i += 1
+            continue
+        order_id = line + lines[i + 1].strip()
+        j = i + 2
+        awb_id = lines[j].strip() if j < len(lines) and lines[j].strip() else 'Unknown'
+        sku = lines[j + 1].strip() if j + 1 < len(lines) and lines[j + 1].strip() else 'Unknown'
+        qty = int(lines[j + 2].strip()) if j + 2 < len(lines) and re.match(r'^\d+$', lines[j + 2].strip()) else 1
+        if awb_id != order_id and any(re.match(pattern, awb_id) for pattern in (
+                r'^[A-Z]{2}\d+', r'^M\d+', r'^1490\d{12,}', r'^134\d{11,}', r'^VL\d+', r'^SF\d+')):
+            entries.append({"Order ID": order_id, "AWB ID": awb_id, "Courier": courier, "SKU": sku, "Qty": qty})
+        i = j + 2
+    return entries
+
+
+def manifest_pages(count, seed=0):
+    """Page texts with the awkward cases: bad AWBs, missing quantities, blocks split across pages"""
+    rng = random.Random(seed)
+    pages = []
+    lines = []
+    for n in range(count):
+        if n % 40 == 0:
+            lines.append(f"  Courier : {rng.choice(['Valmo', 'Shadowfax', 'Delhivery'])}")
+        lines += [str(100000 + n), f"{n}_1"]
+        lines.append(rng.choice([f"VL{2035000000 + n}", f"SF{n}FPL", f"1490{n:012d}", f"134{n:011d}",
+                                 f"M{n}", "bad awb", "", str(100000 + n) + f"{n}_1"]))
+        lines.append(rng.choice([f"SKU {n}", ""]))
+        if rng.random() < 0.8:
+            lines.append(str(rng.randint(1, 5)))
+        if rng.random() < 0.1:
+            lines.append("Page footer")
+        if rng.random() < 0.05:
+            pages.append('\n'.join(lines))
+            lines = []
+    pages.append('\n'.join(lines))
+    return pages
+
+
+@pytest.mark.parametrize('count', [0, 1, 50, TOKEN_CHUNK])
+def test_streaming_parser_matches_reference(count):
+    pages = manifest_pages(count, seed=count)
+    text = ''.join(page + '\n' for page in pages)
+    assert list(iter_orders(iter_lines(pages))) == reference_orders(text)
+
+
+def text_pdf(path, pages):
+    doc = fitz.open()
+    for text in pages:
+        page = doc.new_page(width=300, height=2000)
+        page.insert_text((10, 10), text, fontsize=4)
+    doc.save(str(path))
+    return str(path)
+
+
+def test_parallel_extraction_matches_serial(tmp_path):
+    pages = manifest_pages(300, seed=1)
+    path = text_pdf(tmp_path / 'manifest.pdf', pages)
+    serial = list(iter_page_texts(path, workers=1))
+    parallel = list(iter_page_texts(path, workers=2, parallel_min_pages=1, pages_per_task=3))
+    assert parallel == serial
+
+    progress = []
+    orders = list(iter_manifest_orders(path, workers=1, progress=lambda done, total: progress.append((done, total))))
+    assert orders == reference_orders(''.join(text + '\n' for text in serial))
+    assert progress[-1] == (len(pages), len(pages))
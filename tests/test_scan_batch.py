@@ -0,0 +1,58 @@
+from datetime import datetime
+
+from conftest import manifest_csv, upload
+
+AWBS = [f"VL{2035000000 + n}" for n in range(10)]
+
+
+def post_batch(client, items, batch_id=None):
+    return client.post('/scan/batch', json={'batch_id': batch_id, 'items': items}).get_json()
+
+
+def test_batch_results(client):
+    upload(client, 'm.csv', manifest_csv(AWBS))
+    body = post_batch(client, [{'awb_id': AWBS[0]}, AWBS[1], {'awb_id': AWBS[0]}, {'awb_id': 'VL9999999999'},
+                               {'awb_id': '  '}], batch_id='b1')
+    assert body['success'] and not body['replayed']
+    assert [(item['result'], item['status']) for item in body['results']] == [
+        ('packed', 'Packed'), ('packed', 'Packed'), ('duplicate', 'Packed'), ('unknown', 'Cancelled'),
+        ('invalid', None)]
+    assert (body['stats']['packed'], body['stats']['cancelled']) == (2, 1)
+
+
+def test_retried_batch_is_not_applied_twice(client, scanner):
+    upload(client, 'm.csv', manifest_csv(AWBS))
+    items = [{'awb_id': AWBS[0]}, {'awb_id': 'VL9999999999'}]
+    first = post_batch(client, items, batch_id='retry-me')
+    client.post('/delete', json={'awb_id': 'VL9999999999'})
+
+    retry = post_batch(client, items, batch_id='retry-me')
+    assert retry['replayed']
+    assert [item['result'] for item in retry['results']] == [item['result'] for item in first['results']]
+    # The replay did not record the deleted cancellation again
+    assert scanner.active_store().get('VL9999999999') is None
+    assert (retry['stats']['packed'], retry['stats']['cancelled']) == (1, 0)
+
+    # Without a batch ID every post is applied
+    again = post_batch(client, [{'awb_id': AWBS[0]}])
+    assert not again['replayed'] and again['results'][0]['result'] == 'duplicate'
+
+
+def test_offline_scan_times_are_kept_in_local_time(client, scanner):
+    upload(client, 'm.csv', manifest_csv(AWBS))
+    post_batch(client, [{'awb_id': AWBS[0], 'scanned_at': '2026-10-16T04:30:00Z'},
+                        {'awb_id': AWBS[1], 'scanned_at': '2026-10-16 09:15:00'},
+                        {'awb_id': AWBS[2], 'scanned_at': 'not a time'}])
+    store = scanner.active_store()
+    expected = datetime.fromisoformat('2026-10-16T04:30:00+00:00').astimezone().strftime('%Y-%m-%d %H:%M:%S')
+    assert store.get(AWBS[0])['Scanned Time'] == expected
+    assert store.get(AWBS[1])['Scanned Time'] == '2026-10-16 09:15:00'
+    assert store.get(AWBS[2])['Scanned Time'].startswith(datetime.now().strftime('%Y-%m-%d'))
+
+
+def test_batch_size_limit(client, scanner):
+    upload(client, 'm.csv', manifest_csv(AWBS))
+    limit = scanner.app.config.get('MAX_SCAN_BATCH', 500)
+    body = post_batch(client, [{'awb_id': AWBS[0]}] * (limit + 1))
+    assert not body['success']
+    assert scanner.active_store().counts()['packed'] == 0
@@ -0,0 +1,78 @@
+from conftest import manifest, manifest_csv, upload
+
+AWBS = [f"AWB{n:04d}" for n in range(20)]
+
+
+def awbs(rows):
+    return [row['AWB ID'] for row in rows]
+
+
+# ----------------------------------------------------------------------
+# Store queries behind the orders table, on both backends
+# ----------------------------------------------------------------------
+def test_query_pages_in_manifest_order(store):
+    total, filtered, rows = store.query(start=5, length=3)
+    assert (total, filtered) == (20, 20)
+    assert awbs(rows) == AWBS[5:8]
+    assert awbs(store.query(start=18, length=-1)[2]) == AWBS[18:]
+
+
+def test_query_search_and_status(store):
+    store.scan('AWB0011', '2026-10-16 10:00:00')
+    store.scan('AWB0012', '2026-10-16 10:00:01')
+    total, filtered, rows = store.query(search='awb001')
+    assert (total, filtered) == (20, 10)
+    total, filtered, rows = store.query(search='awb001', status='Packed')
+    assert (filtered, awbs(rows)) == (2, ['AWB0011', 'AWB0012'])
+    # LIKE wildcards are matched literally
+    assert store.query(search='%')[1] == 0
+
+
+def test_query_sorting(store):
+    store.merge(manifest(['AWB9000']).assign(Qty='10'))
+    store.merge(manifest(['AWB9001']).assign(Qty='2'))
+    rows = store.query(order_by='Qty', descending=True, length=2)[2]
+    assert awbs(rows) == ['AWB9000', 'AWB9001']  # numeric, not text, order
+    rows = store.query(order_by='AWB ID', descending=True, length=1)[2]
+    assert awbs(rows) == ['AWB9001']
+    # Unknown columns keep manifest order
+    assert awbs(store.query(order_by='nope', length=1)[2]) == ['AWB0000']
+
+
+# ----------------------------------------------------------------------
+# Endpoints
+# ----------------------------------------------------------------------
+def test_stats_endpoints(client):
+    upload(client, 'm.csv', manifest_csv(AWBS[:6]))
+    client.post('/scan', json={'awb_id': AWBS[0]})
+    client.post('/scan', json={'awb_id': 'VL9999999999', 'confirm': True})
+
+    assert client.get('/api/stats').get_json() == {'packed': 1, 'pending': 5, 'cancelled': 1, 'total': 7}
+    breakdown = client.get('/api/stats/breakdown').get_json()
+    # The unknown AWB's courier comes from its VL prefix
+    assert breakdown['by_courier']['Valmo'] == {'packed': 1, 'pending': 5, 'cancelled': 1, 'total': 7}
+    assert sum(counts['total'] for counts in breakdown['by_sku'].values()) == 7
+    assert client.get('/api/stats/verify').get_json()['consistent']
+
+
+def test_orders_table_endpoint(client):
+    upload(client, 'm.csv', manifest_csv(AWBS))
+    client.post('/scan', json={'awb_id': AWBS[3]})
+    query = ('/api/orders?draw=7&start=0&length=5&order[0][column]=1&order[0][dir]=desc'
+             '&columns[1][data]=AWB ID&search[value]=')
+    body = client.get(query).get_json()
+    assert (body['draw'], body['recordsTotal'], body['recordsFiltered']) == (7, 20, 20)
+    assert awbs(body['data']) == AWBS[:-6:-1]
+
+    body = client.get('/api/orders?draw=8&length=5&status=Packed').get_json()
+    assert (body['recordsFiltered'], awbs(body['data'])) == (1, [AWBS[3]])
+
+    # length=-1 ("all") is capped at ORDERS_PAGE_MAX
+    body = client.get('/api/orders?draw=9&length=-1').get_json()
+    assert len(body['data']) == 20
+
+
+def test_endpoints_without_a_manifest(client):
+    assert client.get('/api/stats').get_json()['total'] == 0
+    assert client.get('/api/orders?draw=3').get_json() == {'draw': 3, 'recordsTotal': 0, 'recordsFiltered': 0,
+                                                             'data': []}
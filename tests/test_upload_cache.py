@@ -0,0 +1,65 @@
+import os
+import time
+
+import pytest
+
+from conftest import upload
+from upload_cache import UploadCache, file_digest
+
+fitz = pytest.importorskip('fitz')
+
+
+def test_orders_and_pages_round_trip(tmp_path):
+    cache = UploadCache(str(tmp_path / 'cache'))
+    assert cache.get_orders('f1') is None
+    cache.put_orders('f1', [{'AWB ID': 'VL1'}])
+    cache.put_page('p1', 'page text')
+    assert cache.get_orders('f1') == [{'AWB ID': 'VL1'}]
+    assert cache.get_page('p1') == 'page text'
+    assert cache.get_page('p2') is None
+
+
+def test_eviction_drops_least_recently_used(tmp_path):
+    cache = UploadCache(str(tmp_path / 'cache'), max_bytes=250)
+    for n, key in enumerate(['old', 'used', 'new']):
+        cache.put_page(key, 'x' * 100)
+        path = os.path.join(cache.directory, f"page-{key}.txt")
+        os.utime(path, (time.time() - 100 + n, time.time() - 100 + n))
+    cache.get_page('used')  # reading bumps the mtime
+    cache.evict()
+    assert cache.get_page('old') is None
+    assert cache.get_page('used') is not None
+    assert cache.get_page('new') is not None
+
+
+def test_file_digest(tmp_path):
+    path = tmp_path / 'a.bin'
+    path.write_bytes(b'abc' * 1000)
+    assert file_digest(str(path), chunk_size=7) == file_digest(str(path))
+
+
+def manifest_pdf(path, pages):
+    """One page per list of AWB IDs, laid out as Meesho manifest order blocks"""
+    doc = fitz.open()
+    for n, awbs in enumerate(pages):
+        lines = ['Courier : Valmo']
+        for k, awb in enumerate(awbs):
+            lines += [f"{1000 + n}{k}", f"{n}{k}_1", awb, f"SKU {k}", '1']
+        doc.new_page(width=300, height=800).insert_text((20, 20), '\n'.join(lines), fontsize=8)
+    doc.save(str(path))
+    return path.read_bytes()
+
+
+def test_upload_reuses_cached_files_and_pages(client, tmp_path):
+    first = manifest_pdf(tmp_path / 'a.pdf', [['VL2035000001', 'VL2035000002'], ['VL2035000003']])
+    status = upload(client, 'a.pdf', first)
+    assert (status['state'], status['cache'], status['orders']) == ('done', 'miss', 3)
+
+    status = upload(client, 'a.pdf', first)
+    assert (status['state'], status['cache'], status['orders']) == ('done', 'hit', 3)
+
+    # Same first page, new second page: only the new page is extracted
+    second = manifest_pdf(tmp_path / 'b.pdf', [['VL2035000001', 'VL2035000002'], ['VL2035000009']])
+    status = upload(client, 'b.pdf', second)
+    assert (status['state'], status['cache'], status['orders']) == ('done', 'partial', 3)
+    assert client.post('/scan', json={'awb_id': 'VL2035000009'}).get_json()['status'] == 'Packed'
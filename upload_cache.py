@@ -0,0 +1,97 @@
+"""On-disk, size-bounded LRU cache for parsed manifest uploads"""
+import hashlib
+import json
+import logging
+import os
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Default cache size; least recently used entries are evicted beyond it
+MAX_BYTES = 200 * 1024 * 1024
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """sha256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class UploadCache:
+    """Parsed orders keyed by file hash, and page text keyed by page hash.
+
+    A re-uploaded manifest is answered from its file hash without touching
+    the PDF. A manifest that shares pages with an earlier one only has its
+    new pages extracted. Entries are plain files; reading one bumps its
+    mtime, and writes evict the oldest files once the directory exceeds
+    ``max_bytes``. Writes go through a temp file and rename, so several
+    workers can share the directory.
+    """
+
+    def __init__(self, directory, max_bytes=MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def _path(self, kind, key):
+        return os.path.join(self.directory, f"{kind}-{key}")
+
+    def _read(self, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            return None
+
+    def _write(self, path, data):
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get_orders(self, file_hash):
+        data = self._read(self._path('orders', file_hash) + '.json')
+        return json.loads(data) if data is not None else None
+
+    def put_orders(self, file_hash, orders):
+        self._write(self._path('orders', file_hash) + '.json', json.dumps(orders))
+        self.evict()
+
+    def get_page(self, page_hash):
+        return self._read(self._path('page', page_hash) + '.txt')
+
+    def put_page(self, page_hash, text):
+        self._write(self._path('page', page_hash) + '.txt', text)
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        logger.info(f"Evicted upload cache entries down to {total} bytes")
@@ -0,0 +1,164 @@
+"""Background upload jobs with progress kept in JSON status files"""
+import json
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Upload jobs processed at once by each worker process
+JOB_WORKERS = 2
+# Status files of finished jobs are removed after this many seconds
+JOB_RETENTION = 24 * 3600
+# Progress is written to the status file at most this often, in seconds
+PROGRESS_INTERVAL = 0.5
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class UploadJob:
+    """One upload being processed; passed to the job function to report progress"""
+
+    def __init__(self, jobs, status):
+        self.jobs = jobs
+        self.status = status
+        self._last_write = 0.0
+
+    @property
+    def id(self):
+        return self.status['id']
+
+    def update(self, force=False, **fields):
+        self.status.update(fields)
+        now = time.time()
+        if force or now - self._last_write >= PROGRESS_INTERVAL:
+            self.status['updated'] = now
+            self.jobs._write(self.status)
+            self._last_write = now
+
+    def progress(self, pages_done, pages_total, orders=None):
+        """Callback for manifest parsing: pages processed so far and orders found"""
+        fields = {'pages_done': pages_done, 'pages_total': pages_total}
+        if orders is not None:
+            fields['orders'] = orders
+        self.update(force=pages_done == pages_total, **fields)
+
+
+class UploadJobs:
+    """Runs uploads in a local thread pool and tracks them in ``directory``.
+
+    Every job has a ``<id>.json`` status file, replaced atomically on each
+    update, so any gunicorn worker can answer a status poll for a job
+    another worker is running. The pool is created lazily per process
+    (threads do not survive fork).
+    """
+
+    def __init__(self, directory, workers=JOB_WORKERS, retention=JOB_RETENTION):
+        self.directory = directory
+        self.workers = workers
+        self.retention = retention
+        self._pool = None
+        self._pool_pid = None
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def _path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _write(self, status):
+        path = self._path(status['id'])
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(status, f)
+        os.replace(tmp_path, path)
+
+    def _executor(self):
+        if self._pool is None or self._pool_pid != os.getpid():
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='upload-job')
+            self._pool_pid = os.getpid()
+        return self._pool
+
+    def submit(self, fn, filename, **kwargs):
+        """Queue ``fn(job, **kwargs)``; its return value (a dict) is merged into the final status"""
+        self.prune()
+        now = time.time()
+        status = {
+            'id': uuid.uuid4().hex,
+            'filename': filename,
+            'state': QUEUED,
+            'pid': os.getpid(),
+            'created': now,
+            'started': None,
+            'finished': None,
+            'updated': now,
+            'pages_done': 0,
+            'pages_total': None,
+            'orders': 0,
+            'message': None,
+        }
+        self._write(status)
+        job = UploadJob(self, status)
+        self._executor().submit(self._run, job, fn, kwargs)
+        return job.id
+
+    def _run(self, job, fn, kwargs):
+        job.update(force=True, state=RUNNING, started=time.time())
+        try:
+            result = fn(job, **kwargs) or {}
+            job.update(force=True, state=DONE, finished=time.time(), **result)
+            logger.info(f"Upload job {job.id} finished: {job.status.get('message')}")
+        except Exception as e:
+            logger.error(f"Upload job {job.id} failed: {str(e)}")
+            job.update(force=True, state=FAILED, finished=time.time(), message=str(e))
+
+    def get(self, job_id):
+        """Status of a job with its ETA, or None for an unknown job id"""
+        if not job_id or not all(c in '0123456789abcdef' for c in job_id):
+            return None
+        try:
+            with open(self._path(job_id), encoding='utf-8') as f:
+                status = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if status['state'] in (QUEUED, RUNNING) and not _pid_alive(status['pid']):
+            # The worker running it was restarted; the old manifest is still in place
+            status.update(state=FAILED, finished=time.time(),
+                          message='The upload was interrupted by a server restart. Please upload the file again.')
+            self._write(status)
+        status['eta_seconds'] = _eta(status)
+        return status
+
+    def prune(self):
+        """Remove status files of jobs that finished more than ``retention`` seconds ago"""
+        cutoff = time.time() - self.retention
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+
+def _eta(status):
+    """Seconds left, extrapolated from the pages processed so far"""
+    done, total = status.get('pages_done'), status.get('pages_total')
+    if status['state'] != RUNNING or not done or not total or not status.get('started'):
+        return None
+    elapsed = time.time() - status['started']
+    return round(elapsed * (total - done) / done, 1)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True